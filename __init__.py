@@ -1,6 +1,13 @@
 from .py import endpoints
+from .py.nodes import WildcardProcessor, WildcardCombinations
+from .py.utils import mk_name, un_name, set_default_category
 
 
-NODE_CLASS_MAPPINGS = {}
-WEB_DIRECTORY = "./web"
+NODE_CLASS_MAPPINGS = {
+    mk_name("WildcardProcessor"): WildcardProcessor, 
+    mk_name("WildcardCombinations"): WildcardCombinations, 
+}
+NODE_DISPLAY_NAME_MAPPINGS = {k: un_name(k) for k in NODE_CLASS_MAPPINGS}
+set_default_category(NODE_CLASS_MAPPINGS)
 
+WEB_DIRECTORY = "./web"
@@ -0,0 +1,183 @@
+from __future__ import annotations
+from . import paths
+from .utils import PeriodicFlusher, save_json
+import heapq
+import json
+import re
+import threading
+from collections import deque
+from typing import Dict, List, Tuple
+
+
+# -----------------------------------------------
+# タグの共起（次のタグの候補）
+#   キューに追加されたプロンプトから、同じプロンプトに含まれるタグの組を数える。
+#   候補の検索には、タグごとに共起する確率の高い上位 TOP_K 個の隣接タグだけを持つ疎な表を使い、
+#   プロンプト中のタグの隣接リストを引いて足し合わせるだけで済むようにする。
+#   数え上げの途中の値はメモリ上に保持し、一定間隔でまとめて表を作り直してファイルに書き出す。
+#   学習したタグの隣接リストは、次に候補を検索したときにそのタグの分だけ作り直す。
+# -----------------------------------------------
+
+_SPLIT_RE = re.compile(r"[,;\"|{}\n]+")
+_WEIGHT_RE = re.compile(r":\s*-?[\d.]+\s*$")
+
+
+def prompt_tags(text: str) -> List[str]:
+    """
+    プロンプトをタグに分割し、タグファイルと同じ表記（小文字、空白は _）に揃える。
+    強調の括弧と重み（例: `(long hair:1.2)`）は外し、エスケープされた括弧は残す。
+    """
+    tags = []
+    for token in _SPLIT_RE.split(text):
+        token = token.replace("\\(", "\0").replace("\\)", "\1")
+        token = _WEIGHT_RE.sub("", token.strip().strip("()[] ")).strip().strip("()[] ")
+        token = token.replace("\0", "(").replace("\1", ")").replace(" ", "_").lower()
+        if token and token not in tags:
+            tags.append(token)
+    return tags
+
+
+class CooccurrenceIndex:
+    TOP_K = 20 # 検索に使う隣接タグの数
+    MAX_TAGS = 10000 # 数えるタグ数の上限（書き出し時に、出現回数の少ないタグから捨てる）
+    MAX_NEIGHBOURS = 64 # タグごとに数え続ける隣接タグ数の上限
+    MAX_PROMPT_TAGS = 64 # 1つのプロンプトから数えるタグ数の上限
+    RECENT_PROMPTS = 256 # 同じプロンプトの繰り返し（バッチ実行など）を数えない件数
+    FLUSH_INTERVAL = 300.0 # 表の作り直しとファイルへの書き出しの間隔（秒）
+
+    _counts: Dict[str, float] = {} # タグ -> 出現したプロンプト数
+    _pairs: Dict[str, Dict[str, float]] = {} # タグ -> 隣接タグ -> 同時に出現したプロンプト数
+    _neighbours: Dict[str, Tuple[Tuple[str, float], ...]] = {} # タグ -> 上位の (隣接タグ, 共起する確率)
+    _stale: set = set() # 学習後に隣接リストを作り直していないタグ
+    _recent: deque = deque(maxlen=RECENT_PROMPTS)
+    _loaded: bool = False
+    _dirty: bool = False
+    _lock = threading.Lock()
+
+    # 一定間隔の書き出し（flusher.start() で開始）
+    flusher = PeriodicFlusher("ExTagCompleteCooccurrenceFlusher", lambda: CooccurrenceIndex.flush(), FLUSH_INTERVAL, "tag co-occurrence")
+
+    # --- Public API ---
+
+    @classmethod
+    def learn(cls, tags: List[str]):
+        """1つのプロンプトに含まれるタグの組を数える（隣接リストは次の検索時に作り直す）。"""
+        tags = tags[:cls.MAX_PROMPT_TAGS]
+        if len(tags) < 2:
+            return
+
+        key = frozenset(tags)
+        with cls._lock:
+            cls._load()
+            if key in cls._recent:
+                return
+            cls._recent.append(key)
+
+            for tag in tags:
+                cls._counts[tag] = cls._counts.get(tag, 0.0) + 1.0
+                pairs = cls._pairs.setdefault(tag, {})
+                for other in tags:
+                    if other != tag:
+                        pairs[other] = pairs.get(other, 0.0) + 1.0
+            cls._stale.update(tags)
+            cls._dirty = True
+
+            # 書き出しまでの間に増えすぎた場合は、その場で上限まで減らす
+            if len(cls._counts) > cls.MAX_TAGS * 2:
+                cls._trim()
+
+    @classmethod
+    def suggest(cls, tags: List[str], limit: int, exclude: set = None) -> List[Tuple[str, float]]:
+        """プロンプト中のタグの隣接リストを足し合わせ、スコアの高い順に (タグ, スコア) を返す。"""
+        exclude = set(tags) | (exclude or set())
+        scores: Dict[str, float] = {}
+        with cls._lock:
+            cls._load()
+            # 学習後のタグは、ここで隣接リストだけを作り直す（書き出しを待たずに候補に反映する）
+            for tag in cls._stale.intersection(tags):
+                cls._refresh_neighbours(tag)
+            neighbours = cls._neighbours
+        for tag in tags:
+            for other, probability in neighbours.get(tag, ()):
+                if other not in exclude:
+                    scores[other] = scores.get(other, 0.0) + probability
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    @classmethod
+    def flush(cls):
+        """変更があれば、検索用の表を作り直してファイルに書き出す。"""
+        with cls._lock:
+            if not cls._dirty:
+                return
+            cls._trim()
+            cls._neighbours = cls._build_neighbours()
+            cls._stale = set()
+            data = {"counts": dict(cls._counts), "pairs": {tag: dict(pairs) for tag, pairs in cls._pairs.items()}}
+            cls._dirty = False
+
+        save_json(paths.cooccurrence_path, data, "tag co-occurrence")
+
+    # --- Internal ---
+
+    @classmethod
+    def _trim(cls):
+        # 出現回数の多いタグと、タグごとに同時に出現した回数の多い隣接タグだけを残す
+        if len(cls._counts) > cls.MAX_TAGS:
+            kept = heapq.nlargest(cls.MAX_TAGS, cls._counts.items(), key=lambda item: item[1])
+            cls._counts = dict(kept)
+
+        pairs = {}
+        for tag in cls._counts:
+            neighbours = {other: count for other, count in cls._pairs.get(tag, {}).items() if other in cls._counts}
+            if len(neighbours) > cls.MAX_NEIGHBOURS:
+                neighbours = dict(heapq.nlargest(cls.MAX_NEIGHBOURS, neighbours.items(), key=lambda item: item[1]))
+            if neighbours:
+                pairs[tag] = neighbours
+        cls._pairs = pairs
+
+    @classmethod
+    def _build_neighbours(cls):
+        neighbours = {}
+        for tag in cls._pairs:
+            top = cls._top_neighbours(tag)
+            if top:
+                neighbours[tag] = top
+        return neighbours
+
+    @classmethod
+    def _refresh_neighbours(cls, tag: str):
+        # 1つのタグの隣接リストを作り直す（検索中の他のスレッドが参照している辞書のため、値の置き換えと削除のみ行う）
+        cls._stale.discard(tag)
+        top = cls._top_neighbours(tag)
+        if top:
+            cls._neighbours[tag] = top
+        else:
+            cls._neighbours.pop(tag, None)
+
+    @classmethod
+    def _top_neighbours(cls, tag: str):
+        # タグ t を含むプロンプトに隣接タグが含まれる確率（回数 / t の出現回数）の上位 TOP_K 個
+        count = cls._counts.get(tag)
+        pairs = cls._pairs.get(tag)
+        if not count or not pairs:
+            return None
+        top = heapq.nlargest(cls.TOP_K, pairs.items(), key=lambda item: item[1])
+        return tuple((other, pair_count / count) for other, pair_count in top)
+
+    @classmethod
+    def _load(cls):
+        if cls._loaded:
+            return
+        cls._loaded = True
+        if not paths.cooccurrence_path.exists():
+            return
+
+        try:
+            with open(paths.cooccurrence_path, mode="r", encoding="utf-8") as file:
+                data = json.load(file)
+            cls._counts = {tag: float(count) for tag, count in data["counts"].items()}
+            cls._pairs = {tag: {other: float(count) for other, count in pairs.items()} for tag, pairs in data["pairs"].items()}
+            cls._neighbours = cls._build_neighbours()
+            cls._stale = set()
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            print(f"Failed to load tag co-occurrence: {e}")
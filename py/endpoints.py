@@ -1,51 +1,84 @@
-from .utils import Endpoint
-from .tagdata_manager import TagDataManager
+from .utils import Endpoint, SingleFlight, LatestRequests, RequestCancel
+from .tagdata_manager import TagDataManager, csv_opener
 from . import paths
 
-from aiohttp import web
+from aiohttp import web, WSMsgType
+from server import PromptServer
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import folder_paths
+import json
+import threading
 
 # ===============================================
 # エンドポイント
 # ===============================================
 
+# --- ファイルリスト ---
+def list_tag_files():
+    """tagsフォルダを一度だけ走査し、(mainリスト, extraリスト) を返す（圧縮されたCSVも含む）"""
+    files = paths.tags_dir.iterdir() if paths.tags_dir.is_dir() else []
+    files = [file for file in files if file.is_file() and csv_opener(file.name)]
+    main_files = [file.name for file in files if not file.name.startswith("extra")]
+    extra_files = [file.name for file in files if file.name.startswith("extra")]
+    return main_files, extra_files
+
+def list_translate_files():
+    files = paths.translate_dir.iterdir() if paths.translate_dir.is_dir() else []
+    filelist = [file.name for file in files if file.is_file() and csv_opener(file.name)]
+    return ["None"] + filelist
+
+
+# --- 起動時に必要な情報をまとめて取得 ---
+@Endpoint.get("get_bootstrap")
+async def get_bootstrap(req: web.Request):
+    main_files, extra_files = list_tag_files()
+
+    return web.json_response({
+        "mainFiles": main_files, 
+        "extraFiles": extra_files, 
+        "translateFiles": list_translate_files(), 
+    })
+
 # --- main タグファイルリストを取得 ---
 @Endpoint.get("get_main_files")
 async def get_main_files(req: web.Request):
-    files = paths.tags_dir.glob("*.csv")
-    filelist = [file.name for file in files if not file.stem.startswith("extra")]
+    main_files, _ = list_tag_files()
 
-    return web.json_response(filelist)
+    return web.json_response(main_files)
 
 # --- extra タグファイルリストを取得 ---
 @Endpoint.get("get_extra_files")
 async def get_extra_files(req: web.Request):
-    files = paths.tags_dir.glob("*.csv")
-    filelist = [file.name for file in files if file.stem.startswith("extra")]
+    _, extra_files = list_tag_files()
 
-    return web.json_response(filelist)
+    return web.json_response(extra_files)
 
 # --- translate ファイルリストを取得 ---
 @Endpoint.get("get_translate_files")
 async def get_translate_files(req: web.Request):
-    files = paths.translate_dir.glob("*.csv")
-    filelist = [file.name for file in files]
-    filelist = ["None"] + filelist
-    
-    return web.json_response(filelist)
+    return web.json_response(list_translate_files())
 
 
 # -----------------------------------------------
 # On Change
 # -----------------------------------------------
 
+# 同じ選択の同時ロードをまとめ、同じテーブルのロードは直列に実行する
+loader = SingleFlight()
+
+
 # --- Enable切り替え ---
 @Endpoint.post("toggle_enable")
 async def toggle_enble(req: web.Request):
     data = await req.json()
     value = data.get("value")
 
-    TagDataManager.toggle_enable(value)
+    def job(cancel):
+        TagDataManager.toggle_enable(value)
+
+    await loader.run("enable", value, job)
+    TagDataManager.save_selection()
 
     return web.json_response({"status": "success"})
 
@@ -56,8 +89,12 @@ async def load_main(req: web.Request):
     data = await req.json()
     filename = data.get("filename")
 
-    TagDataManager.main_filename = filename
-    TagDataManager.load_main()
+    def job(cancel):
+        TagDataManager.main_filename = filename
+        TagDataManager.load_main(cancel)
+
+    await loader.run("main", filename, job)
+    TagDataManager.save_selection()
 
     return web.json_response({"status": "success"})
 
@@ -68,8 +105,12 @@ async def load_extra(req: web.Request):
     data = await req.json()
     filename = data.get("filename")
 
-    TagDataManager.extra_filename = filename
-    TagDataManager.load_extra()
+    def job(cancel):
+        TagDataManager.extra_filename = filename
+        TagDataManager.load_extra(cancel)
+
+    await loader.run("extra", filename, job)
+    TagDataManager.save_selection()
 
     return web.json_response({"status": "success"})
 
@@ -80,8 +121,12 @@ async def load_translate(req: web.Request):
     data = await req.json()
     filename = data.get("filename")
 
-    TagDataManager.translate_filename = filename
-    TagDataManager.load_translate()
+    def job(cancel):
+        TagDataManager.translate_filename = filename
+        TagDataManager.load_translate(cancel)
+
+    await loader.run("translate", filename, job)
+    TagDataManager.save_selection()
 
     return web.json_response({"status": "success"})
 
@@ -91,9 +136,13 @@ async def load_translate(req: web.Request):
 async def load_embeddings(req: web.Request):
     data = await req.json()
     value = data.get("value")
-    
-    TagDataManager.enable_embeddings = value
-    TagDataManager.load_embeddings()
+
+    def job(cancel):
+        TagDataManager.enable_embeddings = value
+        TagDataManager.load_embeddings(cancel)
+
+    await loader.run("embeddings", value, job)
+    TagDataManager.save_selection()
 
     return web.json_response({"status": "success"})
 
@@ -104,8 +153,12 @@ async def load_loras(req: web.Request):
     data = await req.json()
     value = data.get("value")
 
-    TagDataManager.enable_loras = value
-    TagDataManager.load_loras()
+    def job(cancel):
+        TagDataManager.enable_loras = value
+        TagDataManager.load_loras(cancel)
+
+    await loader.run("loras", value, job)
+    TagDataManager.save_selection()
 
     return web.json_response({"status": "sccuess"})
 
@@ -116,8 +169,12 @@ async def load_wildcard(req: web.Request):
     data = await req.json()
     value = data.get("value")
 
-    TagDataManager.enable_wildcards = value
-    TagDataManager.load_wildcards()
+    def job(cancel):
+        TagDataManager.enable_wildcards = value
+        TagDataManager.load_wildcards(cancel)
+
+    await loader.run("wildcards", value, job)
+    TagDataManager.save_selection()
 
     return web.json_response({"status": "success"})
 
@@ -129,6 +186,7 @@ async def set_suggestion_count(req: web.Request):
     value = data.get("value")
     
     TagDataManager.max_count = value
+    TagDataManager.save_selection()
     
     return web.json_response({"status": "success"})
 
@@ -140,17 +198,258 @@ async def set_restrict_alias(req: web.Request):
     value = data.get("value")
 
     TagDataManager.restrictAlias = value
+    TagDataManager.save_selection()
     
     return web.json_response({"status": "success"})
 
 
+# --- 次のタグの候補設定 ---
+@Endpoint.post("set_next_tags")
+async def set_next_tags(req: web.Request):
+    data = await req.json()
+    value = data.get("value")
+
+    TagDataManager.enable_next_tags = bool(value)
+    TagDataManager.save_selection()
+
+    return web.json_response({"status": "success"})
+
+
+# --- メモリの上限設定 ---
+@Endpoint.post("set_memory_budget")
+async def set_memory_budget(req: web.Request):
+    data = await req.json()
+    value = data.get("value")
+
+    # 上位候補表を作り直す場合があるため、別スレッドで適用する
+    await asyncio.to_thread(TagDataManager.set_memory_budget, value)
+    TagDataManager.save_selection()
+
+    return web.json_response({"status": "success"})
+
+
+# --- アイドル時のメモリ解放設定 ---
+@Endpoint.post("set_idle_release")
+async def set_idle_release(req: web.Request):
+    data = await req.json()
+    value = data.get("value")
+
+    TagDataManager.idle_release_minutes = max(0, int(value or 0))
+    TagDataManager.save_selection()
+
+    return web.json_response({"status": "success"})
+
+
+# --- メモリ使用量（ソースごと）と、退避・読み戻しの回数を取得 ---
+@Endpoint.get("get_memory_usage")
+async def get_memory_usage(req: web.Request):
+    report = await asyncio.to_thread(TagDataManager.memory_usage)
+    return web.json_response(report)
+
+
 # --- 検索実行 ---
+
+# クライアントごとの最新の検索（入力が進んで古くなった検索は中断する）
+searches = LatestRequests()
+
+# この大きさ以上の検索結果は、クライアントが求めた場合に圧縮する
+COMPRESS_MIN_SIZE = 1024
+
 @Endpoint.post("search")
 async def search(req: web.Request):
     data = await req.json()
     term = data.get("term")
     filters = data.get("filters")
+    client = data.get("client")
+    seq = data.get("seq")
+    cursor = data.get("cursor")
+    group = data.get("group")
+
+    # 新しい検索に置き換えられた場合と、クライアントが切断した場合に中断する
+    cancel = RequestCancel(req)
+    searches.begin(client, seq, cancel)
+    try:
+        # 公開中の世代を読むだけなので、イベントループを止めずに別スレッドで並列に検索する
+        page = await asyncio.to_thread(TagDataManager.search_page, term, filters, cancel, cursor, group)
+    except asyncio.CancelledError:
+        cancel.set()
+        raise
+    finally:
+        searches.end(client, cancel)
+
+    response = web.json_response(encode_search_response(data, page))
+    if data.get("compress") and len(response.body) >= COMPRESS_MIN_SIZE:
+        response.enable_compression()
+    return response
+
+
+def encode_search_response(data: dict, page: dict):
+    # 中断された検索の結果は読まれないため、空の結果を返す
+    if page is None:
+        page = {"results": [], "cursor": None}
+
+    # クライアントが対応している場合は列形式で返す（全て表示の場合は続きのページのカーソルを付ける）
+    if data.get("format") == "columns":
+        encoded = TagDataManager.encode_columns(page["results"])
+        encoded["cursor"] = page["cursor"]
+        return encoded
+    return page["results"]
+
+
+# --- 検索チャネル（WebSocket） ---
+@Endpoint.get("search_ws")
+async def search_ws(req: web.Request):
+    # 1本の接続で検索リクエストを受け付け、リクエストIDを付けて結果を返す
+    # 新しいリクエストが届いた場合は、実行中の古い検索を中断する
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(req)
+
+    cancel = None
+    tasks = set()
+
+    async def respond(data: dict, cancel: RequestCancel):
+        try:
+            page = await asyncio.to_thread(
+                TagDataManager.search_page, data.get("term"), data.get("filters"), cancel, data.get("cursor"), data.get("group")
+            )
+            response = encode_search_response(data, page)
+        except Exception as e:
+            # 失敗した検索にも空の結果で応答し、クライアントが応答を待ち続けないようにする
+            print(f"Search failed: {e}")
+            response = encode_search_response(data, None)
+        
+        if ws.closed: return
+        try:
+            await ws.send_json({"id": data.get("id"), "response": response})
+        except ConnectionResetError:
+            pass
+
+    try:
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            try:
+                data = json.loads(message.data)
+            except ValueError:
+                continue
+            if not isinstance(data, dict):
+                continue
+
+            if cancel is not None:
+                cancel.set()
+            cancel = RequestCancel(req)
+
+            task = asyncio.ensure_future(respond(data, cancel))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        if cancel is not None:
+            cancel.set()
+
+    return ws
+
+
+# --- 次のタグの候補（カーソルが区切り文字の直後にある場合） ---
+@Endpoint.post("suggest_next")
+async def suggest_next(req: web.Request):
+    data = await req.json()
+    text = data.get("text")
+    text = text[-4000:] if isinstance(text, str) else ""
+
+    page = await asyncio.to_thread(TagDataManager.suggest_next, text)
+    return web.json_response(encode_search_response(data, page))
+
+
+# --- キューに追加されたプロンプトからタグの共起を学習 ---
+LEARN_QUEUE_LIMIT = 16 # 学習待ちのプロンプトの上限（超えた分は数えない）
+learn_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ExTagCompleteLearn")
+learn_slots = threading.BoundedSemaphore(LEARN_QUEUE_LIMIT)
+
+def learn_from_prompt(json_data: dict):
+    # キューへの追加は止めず、文字列の入力（区切り文字を含むもの）だけを1本のワーカースレッドで順に数える
+    # 次のタグの候補が無効な場合は何もしない
+    if not (TagDataManager.enable and TagDataManager.enable_next_tags):
+        return json_data
+    
+    try:
+        prompt = json_data.get("prompt")
+        if isinstance(prompt, dict):
+            texts = [
+                value for node in prompt.values() if isinstance(node, dict)
+                for value in (node.get("inputs") or {}).values() if isinstance(value, str) and "," in value
+            ]
+            # 大量のキュー追加で学習が追いつかない場合は、待ちが空くまで数えない
+            if texts and learn_slots.acquire(blocking=False):
+                learn_executor.submit(TagDataManager.learn_prompts, texts).add_done_callback(learned)
+    except Exception as e:
+        print(f"Failed to learn tags from prompt: {e}")
+    return json_data
+
+def learned(future):
+    learn_slots.release()
+    if future.exception() is not None:
+        print(f"Failed to learn tags from prompt: {future.exception()}")
+
+if hasattr(PromptServer.instance, "add_on_prompt_handler"):
+    PromptServer.instance.add_on_prompt_handler(learn_from_prompt)
+
+
+# --- プロンプト全体の正規化（エイリアスの置き換え、未知のタグの検出） ---
+@Endpoint.post("normalize_prompt")
+async def normalize_prompt(req: web.Request):
+    data = await req.json()
+    prompt = data.get("prompt")
+    if not isinstance(prompt, str):
+        return web.json_response({"error": "prompt is required"}, status=400)
+
+    result = await asyncio.to_thread(TagDataManager.normalize_prompt, prompt)
+    return web.json_response(result)
 
-    results = TagDataManager.search(term, filters)
 
-    return web.json_response(results)
\ No newline at end of file
+# --- 確定されたタグを記録（使用回数による並び順の調整） ---
+@Endpoint.post("record_usage")
+async def record_usage(req: web.Request):
+    data = await req.json()
+    term = data.get("term")
+
+    # メモリ上の回数を増やすだけで、ファイルへの書き出しと並び順への反映は一定間隔でまとめて行う
+    if isinstance(term, str) and 0 < len(term) <= 256:
+        TagDataManager.record_usage(term)
+
+    return web.json_response({"status": "success"})
+
+
+# --- ワイルドカードの内容をページ単位で取得 ---
+WILDCARD_VALUES_LIMIT = 1000 # 1回に返す行数の上限
+
+@Endpoint.post("get_wildcard_values")
+async def get_wildcard_values(req: web.Request):
+    data = await req.json()
+    key = data.get("key") or ""
+    try:
+        offset = int(data.get("offset") or 0)
+        limit = int(data.get("limit") or 100)
+    except (TypeError, ValueError):
+        return web.json_response({"error": "offset and limit must be integers"}, status=400)
+    if not isinstance(key, str):
+        return web.json_response({"error": "key must be a string"}, status=400)
+
+    # 1回に返す行数は上限までに抑える
+    offset = max(0, offset)
+    limit = min(max(1, limit), WILDCARD_VALUES_LIMIT)
+
+    result = await asyncio.to_thread(TagDataManager.get_wildcard_values, key, offset, limit)
+
+    return web.json_response(result)
+
+
+# ===============================================
+# 起動時のウォームアップ
+# ===============================================
+def start_warmup():
+    # 前回の選択状態でバックグラウンドにインデックスを構築する
+    thread = threading.Thread(target=TagDataManager.warmup, name="ExTagCompleteWarmup", daemon=True)
+    thread.start()
+
+# サーバーのイベントループ開始後に実行する
+PromptServer.instance.loop.call_soon_threadsafe(start_warmup)
@@ -0,0 +1,142 @@
+from __future__ import annotations
+from . import paths
+from .utils import save_json
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+# -----------------------------------------------
+# LoRA のメタデータ（トリガーワードと学習タグの出現回数）
+#   .safetensors の先頭にある長さ（8バイト）と JSON のヘッダーだけを読み、テンソルのデータは読まない。
+#   読み取った結果はパス・サイズ・更新日時をキーにファイルへ保存し、
+#   次回からは変更されたファイルのヘッダーだけを読み直す。
+# -----------------------------------------------
+
+MAX_HEADER_SIZE = 64 * 1024 * 1024 # これより大きいヘッダーは壊れたファイルとして読まない
+MAX_TRIGGERS = 5 # ファイルごとのトリガーワードの上限
+TRIGGER_RATIO = 0.9 # データセットの画像のこの割合以上に付いている学習タグをトリガーワードとみなす
+READ_WORKERS = 8 # ヘッダーを並列に読むスレッド数（ネットワーク上のフォルダ向け）
+
+
+def normalize_tag(tag: str) -> str:
+    # タグファイルと同じ表記（小文字、空白は _）に揃える
+    return tag.strip().replace(" ", "_").lower()
+
+
+def read_safetensors_metadata(path: str) -> Optional[dict]:
+    """.safetensors のヘッダーの __metadata__ を返す（読めない場合は None）。"""
+    try:
+        with open(path, mode="rb") as file:
+            prefix = file.read(8)
+            if len(prefix) != 8:
+                return None
+            size = int.from_bytes(prefix, "little")
+            if size < 2 or size > MAX_HEADER_SIZE:
+                return None
+            header = json.loads(file.read(size))
+    except (OSError, ValueError) as e:
+        print(f"Failed to read LoRA metadata: {path}: {e}")
+        return None
+
+    metadata = header.get("__metadata__") if isinstance(header, dict) else None
+    return metadata if isinstance(metadata, dict) else {}
+
+
+def extract_triggers(metadata: dict) -> List[Tuple[str, int]]:
+    """
+    メタデータからトリガーワードを取り出し、学習タグの出現回数と組にして返す。
+      - modelspec.trigger_phrase に書かれたフレーズ
+      - ss_tag_frequency（データセットのフォルダ -> タグ -> 回数）で、フォルダ内のほぼ全ての画像に付いているタグ
+    """
+    triggers = []
+    phrase = metadata.get("modelspec.trigger_phrase")
+    if isinstance(phrase, str):
+        triggers.extend(normalize_tag(tag) for tag in phrase.split(","))
+
+    frequency = metadata.get("ss_tag_frequency")
+    totals: Dict[str, int] = {}
+    try:
+        datasets = json.loads(frequency) if isinstance(frequency, str) else frequency
+        for counts in (datasets or {}).values():
+            counts = {normalize_tag(tag): int(count) for tag, count in counts.items()}
+            images = max(counts.values(), default=0)
+            for tag, count in counts.items():
+                totals[tag] = totals.get(tag, 0) + count
+                if images and count >= images * TRIGGER_RATIO:
+                    triggers.append(tag)
+    except (ValueError, TypeError, AttributeError):
+        pass
+
+    unique = []
+    for tag in triggers:
+        if tag and tag not in unique:
+            unique.append(tag)
+    return [(tag, totals.get(tag, 0)) for tag in unique[:MAX_TRIGGERS]]
+
+
+class LoraMetadataCache:
+    _entries: Dict[str, dict] = {} # パス -> {"size", "mtime", "triggers": [(トリガーワード, 学習タグの出現回数)]}
+    _loaded: bool = False
+    _lock = threading.Lock()
+
+    # --- Public API ---
+
+    @classmethod
+    def get_many(cls, files: List[Tuple[str, int, int]]) -> Dict[str, dict]:
+        """
+        (パス, 更新日時, サイズ) のリストについて、メタデータを返す。
+        キャッシュと一致しないファイルだけヘッダーを読み、リストにないファイルのキャッシュは捨てる。
+        """
+        with cls._lock:
+            cls._load()
+            entries = {}
+            stale = []
+            for path, mtime, size in files:
+                entry = cls._entries.get(path)
+                if entry is not None and entry["mtime"] == mtime and entry["size"] == size:
+                    entries[path] = entry
+                else:
+                    stale.append((path, mtime, size))
+
+            if stale:
+                with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+                    results = executor.map(read_safetensors_metadata, [path for path, _, _ in stale])
+                    for (path, mtime, size), metadata in zip(stale, results):
+                        triggers = extract_triggers(metadata or {})
+                        entries[path] = {"size": size, "mtime": mtime, "triggers": triggers}
+
+            changed = bool(stale) or len(entries) != len(cls._entries)
+            cls._entries = entries
+            if changed:
+                cls._save()
+            return entries
+
+    # --- Internal ---
+
+    @classmethod
+    def _save(cls):
+        save_json(paths.lora_metadata_path, cls._entries, "LoRA metadata")
+
+    @classmethod
+    def _load(cls):
+        if cls._loaded:
+            return
+        cls._loaded = True
+        if not paths.lora_metadata_path.exists():
+            return
+
+        try:
+            with open(paths.lora_metadata_path, mode="r", encoding="utf-8") as file:
+                data = json.load(file)
+            cls._entries = {
+                path: {
+                    "size": int(entry["size"]),
+                    "mtime": int(entry["mtime"]),
+                    "triggers": [(str(tag), int(count)) for tag, count in entry["triggers"]],
+                }
+                for path, entry in data.items()
+            }
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            print(f"Failed to load LoRA metadata: {e}")
@@ -0,0 +1,80 @@
+from .utils import Field, is_queue_idle
+from .wildcards import WildcardLoader
+from .wildcard_space import WildcardSpace
+from comfy.comfy_types import IO
+from itertools import islice
+
+# ===============================================
+# ノード
+# ===============================================
+
+# --- ワイルドカード展開 ---
+class WildcardProcessor:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "text": Field.string(multiline=True), 
+                "seed": Field.int(default=0, min=0, max=0xffffffffffffffff), 
+            }
+        }
+    
+    RETURN_TYPES = (IO.STRING, )
+    RETURN_NAMES = ("text", )
+    FUNCTION = "execute"
+    
+    @classmethod
+    def IS_CHANGED(cls, text, seed):
+        # ワイルドカードがホットリロードされた場合は再実行する
+        return (text, seed, WildcardLoader.get_generation())
+    
+    def execute(self, text, seed):
+        # 初回のみディスクから読み込み、以降は常駐ストアを使用する
+        # 変更の反映は監視スレッドがキューの空き時間に行う
+        WildcardLoader.load()
+        WildcardLoader.start_watcher(is_queue_idle)
+
+        return (WildcardLoader.process(text, seed), )
+
+
+# --- ワイルドカードの展開空間から重複なしで生成 ---
+INT64_MAX = 0x7fffffffffffffff
+
+class WildcardCombinations:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "text": Field.string(multiline=True), 
+                "count": Field.int(default=10, min=1, max=100000), 
+                "mode": Field.combo(["random", "sequential"]), 
+                "seed": Field.int(default=0, min=0, max=0xffffffffffffffff), 
+                "start": Field.int(default=0, min=0, max=0xffffffffffffffff, tooltip="sequential: index of the first expansion."), 
+            }
+        }
+    
+    RETURN_TYPES = (IO.STRING, IO.INT, )
+    RETURN_NAMES = ("texts", "total", )
+    OUTPUT_IS_LIST = (True, False, )
+    OUTPUT_TOOLTIPS = (
+        "Unique prompts. Multi-select ({2$$a|b|c}) is expanded in every order, as WildcardProcessor joins picks in random order.", 
+        f"Number of expansions before removing duplicate texts, capped at {INT64_MAX} (64-bit).", 
+    )
+    FUNCTION = "execute"
+    
+    @classmethod
+    def IS_CHANGED(cls, text, count, mode, seed, start):
+        return (text, count, mode, seed, start, WildcardLoader.get_generation())
+    
+    def execute(self, text, count, mode, seed, start):
+        WildcardLoader.load()
+        WildcardLoader.start_watcher(is_queue_idle)
+
+        space = WildcardSpace(text)
+        if mode == "sequential":
+            texts = list(islice(space.iter_all(start), count))
+        else:
+            texts = list(space.sample_unique(count, seed))
+
+        # 総数は任意精度の整数になるため、INT の出力に収まるように上限で抑える
+        return (texts, min(space.count(), INT64_MAX), )
@@ -4,4 +4,19 @@ root_dir = Path(__file__).parent.parent
 custom_nodes_dir = root_dir.parent
 
 tags_dir = root_dir / "tags"
-translate_dir = root_dir / "translate"
\ No newline at end of file
+translate_dir = root_dir / "translate"
+
+# 最後に適用した選択状態（起動時のウォームアップ用）
+selection_path = root_dir / "selection.json"
+# 補完で確定されたタグの使用回数（並び順の調整用）
+usage_path = root_dir / "usage.json"
+
+# キューに追加されたプロンプトから数えたタグの共起（次のタグの候補用）
+cooccurrence_path = root_dir / "cooccurrence.json"
+
+# LoRA のヘッダーから読んだトリガーワード（パス・サイズ・更新日時ごとのキャッシュ）
+lora_metadata_path = root_dir / "lora_metadata.json"
+
+# 検索のない間にメモリから退避したインデックス（次の検索で読み戻す）
+index_snapshot_path = root_dir / "index_snapshot.sqlite"
+index_short_queries_path = root_dir / "index_snapshot.npz"
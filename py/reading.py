@@ -0,0 +1,152 @@
+import re
+import unicodedata
+
+
+# -----------------------------------------------
+# 翻訳の読み（ローマ字）
+#   かな（カタカナはひらがなに揃える）をローマ字に変換した検索用のキーを作る。
+#   入力されたローマ字も一度かなに変換してから同じ規則でキーにするため、
+#   shi / si、tsu / tu、fu / hu のような綴りの違いは同じキーになる。
+#   漢字など変換できない文字はそのまま残す。
+# -----------------------------------------------
+
+def _rows(consonant: str, kana: str, vowels: str = "aiueo"):
+    return {k: consonant + v for k, v in zip(kana, vowels) if k != " "}
+
+
+# かな -> ローマ字（キーに使う綴り）
+_KANA = {
+    **_rows("", "あいうえお"),
+    **_rows("k", "かきくけこ"), **_rows("g", "がぎぐげご"),
+    **_rows("s", "さしすせそ"), **_rows("z", "ざじずぜぞ"),
+    **_rows("t", "たちつてと"), **_rows("d", "だぢづでど"),
+    **_rows("n", "なにぬねの"),
+    **_rows("h", "はひふへほ"), **_rows("b", "ばびぶべぼ"), **_rows("p", "ぱぴぷぺぽ"),
+    **_rows("m", "まみむめも"),
+    **_rows("y", "や ゆ よ"),
+    **_rows("r", "らりるれろ"),
+    **_rows("w", "わゐ ゑを"),
+    **_rows("x", "ぁぃぅぇぉ"),
+    **_rows("xy", "ゃ ゅ ょ"),
+    "ゎ": "xwa", "ゕ": "xka", "ゖ": "xke", "ゔ": "vu", "ん": "n", "ー": "-",
+}
+
+# 拗音などの2文字のかな
+_KANA_PAIRS = {}
+for _kana, _consonant in zip("きしちにひみりぎじぢびぴ", ["k", "s", "t", "n", "h", "m", "r", "g", "z", "d", "b", "p"]):
+    _KANA_PAIRS.update(_rows(_consonant + "y", [_kana + small for small in "ゃゅょ"], "auo"))
+    _KANA_PAIRS[_kana + "ぇ"] = _consonant + "ye"
+_KANA_PAIRS.update({
+    **_rows("f", ["ふぁ", "ふぃ", " ", "ふぇ", "ふぉ"]),
+    **_rows("v", ["ゔぁ", "ゔぃ", " ", "ゔぇ", "ゔぉ"]),
+    **_rows("ts", ["つぁ", "つぃ", " ", "つぇ", "つぉ"]),
+    "てぃ": "thi", "でぃ": "dhi", "とぅ": "twu", "どぅ": "dwu",
+    "うぃ": "wi", "うぇ": "we", "うぉ": "who", "いぇ": "ye",
+})
+
+# ローマ字 -> かな（キーの綴りに加えて、IME で使われる別の綴りも受け付ける）
+_ROMAJI = {romaji: kana for kana, romaji in {**_KANA, **_KANA_PAIRS}.items() if kana != "ん"}
+_ROMAJI.update({
+    "shi": "し", "chi": "ち", "tsu": "つ", "fu": "ふ", "ji": "じ",
+    "sha": "しゃ", "shu": "しゅ", "she": "しぇ", "sho": "しょ",
+    "cha": "ちゃ", "chu": "ちゅ", "che": "ちぇ", "cho": "ちょ",
+    "cya": "ちゃ", "cyu": "ちゅ", "cye": "ちぇ", "cyo": "ちょ",
+    "ja": "じゃ", "ju": "じゅ", "je": "じぇ", "jo": "じょ",
+    "jya": "じゃ", "jyu": "じゅ", "jye": "じぇ", "jyo": "じょ",
+    "ca": "か", "cu": "く", "co": "こ", "qa": "くぁ", "qi": "くぃ", "qe": "くぇ", "qo": "くぉ",
+    "la": "ぁ", "li": "ぃ", "lu": "ぅ", "le": "ぇ", "lo": "ぉ",
+    "lya": "ゃ", "lyu": "ゅ", "lyo": "ょ",
+    "xtu": "っ", "ltu": "っ", "xtsu": "っ", "ltsu": "っ",
+    "nn": "ん", "n'": "ん", "xn": "ん", "-": "ー",
+})
+_ROMAJI_MAX = max(len(romaji) for romaji in _ROMAJI)
+_ROMAJI_PREFIXES = {romaji[:i] for romaji in _ROMAJI for i in range(1, len(romaji) + 1)}
+
+_KANA_RE = re.compile(r"[ぁ-ゟァ-ヿ]")
+_ROMAJI_RE = re.compile(r"[a-z'\-]+")
+
+# 促音と撥音は前後の音で綴りが変わるため、他のかなを変換してから置き換える
+_KANA_TOKENS = {kana: romaji for kana, romaji in {**_KANA, **_KANA_PAIRS}.items() if kana != "ん"}
+_KANA_TOKEN_RE = re.compile("|".join(sorted(_KANA_TOKENS, key=len, reverse=True)))
+_SOKUON_RE = re.compile(r"っ([b-df-hj-np-tv-z])")
+_HATSUON_RE = re.compile(r"ん(?=[aiueoy])")
+_FOLD_KATAKANA = str.maketrans({chr(c): chr(c - 0x60) for c in range(ord("ァ"), ord("ヶ") + 1)})
+
+
+def fold_kana(text: str) -> str:
+    """全角・半角を揃えて小文字にし、カタカナをひらがなにする。"""
+    return unicodedata.normalize("NFKC", text).lower().translate(_FOLD_KATAKANA)
+
+
+def reading_key(text: str) -> str:
+    """かなをローマ字に変換した読みのキーを返す。"""
+    text = _KANA_TOKEN_RE.sub(lambda m: _KANA_TOKENS[m.group()], fold_kana(text))
+    
+    # 促音は次の音の子音を重ねる（子音が続かない場合は単独の「っ」）
+    text = _SOKUON_RE.sub(r"\1\1", text).replace("っ", "xtu")
+    
+    # 母音と y の前の撥音は区切りを付けて「な行」と区別する
+    return _HATSUON_RE.sub("n'", text).replace("ん", "n")
+
+
+def romaji_to_kana(text: str):
+    """
+    入力途中のローマ字をかなに変換する（IME と同じ規則）。
+    末尾の入力途中の子音は残し、変換できない文字が途中にある場合は None を返す。
+    """
+    kana = []
+    i = 0
+    while i < len(text):
+        following = text[i + 1:i + 2]
+        
+        # 同じ子音の連続（tch を含む）は促音
+        if text[i] not in "aiueon'-" and (following == text[i] or text[i:i + 3] == "tch"):
+            kana.append("っ")
+            i += 1
+            continue
+
+        # 子音（y 以外）の前の n は撥音（nn の後に母音が続く場合は、後ろの n を次の音に使う）
+        if text[i] == "n" and following and following not in "aiueoy'":
+            kana.append("ん")
+            i += 2 if following == "n" and text[i + 2:i + 3] not in tuple("aiueoy") else 1
+            continue
+
+        for size in range(min(_ROMAJI_MAX, len(text) - i), 0, -1):
+            converted = _ROMAJI.get(text[i:i + size])
+            if converted is not None:
+                kana.append(converted)
+                i += size
+                break
+        else:
+            rest = text[i:]
+            return "".join(kana) + rest if rest in _ROMAJI_PREFIXES else None
+    return "".join(kana)
+
+
+def query_reading_key(term: str):
+    """
+    検索語を読みのキーに変換する。
+    ローマ字（入力途中を含む）またはかなを含む語のみを対象とし、それ以外は None を返す。
+    """
+    term = fold_kana(term)
+    if _ROMAJI_RE.fullmatch(term):
+        kana = romaji_to_kana(term)
+        return reading_key(kana) if kana else None
+    if _KANA_RE.search(term):
+        return reading_key(term)
+    return None
+
+
+def is_romaji_query(term: str) -> bool:
+    """検索語がローマ字として読める（英語の検索語とも区別できない）場合に True を返す。"""
+    return _ROMAJI_RE.fullmatch(fold_kana(term)) is not None
+
+
+def translation_reading_keys(translate: str) -> set[str]:
+    """翻訳（カンマ区切りで複数の場合あり）ごとの読みのキーを返す。かなを含まない翻訳は対象外。"""
+    keys = set()
+    for part in re.split(r"[,、]", translate):
+        part = part.strip()
+        if part and _KANA_RE.search(part):
+            keys.add(reading_key(part))
+    return keys
@@ -0,0 +1,342 @@
+from __future__ import annotations
+import copy
+import json
+import sqlite3
+import zipfile
+from typing import TYPE_CHECKING, Iterable
+
+# numpy は表を作成するときまでインポートしない
+if TYPE_CHECKING:
+    import numpy as np
+
+
+# -----------------------------------------------
+# 1〜2文字の検索語の上位候補表
+#   1〜2文字の検索語は一致する行が多い一方で、一致する行が少ない組み合わせでは
+#   検索のたびにテーブル全体を走査することになる。
+#   ソースごとに、検索語（2文字、または ASCII 以外の1文字）ごとの並び順の上位 size 件を
+#   読み込み時に作成しておき、検索時は候補のIDだけを引いて並べ直す。
+#   使用回数で並び順が上がるタグは上位の表から外し、それらのタグだけの小さな表（件数の上限なし）で補う。
+#   使用回数が変わった場合は小さな表だけを作り直す（上位の表は、使用回数で上がっていないタグの並び順が変わらないため使い続けられる）。
+# -----------------------------------------------
+
+_UNIGRAM = 1 << 42 # 1文字の検索語のコード（2文字のコードは 42 ビットに収まる）
+_CATEGORY_BITS = 6 # カテゴリ別の表のコードに付けるカテゴリ番号のビット数
+_MAX_CATEGORIES = (1 << _CATEGORY_BITS) - 1
+_READING_PREFIX = 4 # 1〜2文字の検索語から作られる読みのキーの最大の長さ
+_POSTINGS = ("tags", "tag_categories", "aliases", "alias_categories")
+
+
+def query_code(term: str):
+    """検索語のコードを返す（表の対象外の場合は None）。LIKE と同じく ASCII の大文字と小文字は区別しない。"""
+    if len(term) == 2:
+        first, second = (ord(c) + 32 if "A" <= c <= "Z" else ord(c) for c in term)
+        return first << 21 | second
+    if len(term) == 1 and ord(term) > 127:
+        return ord(term) | _UNIGRAM
+    return None
+
+
+def _postings(texts: list[str], groups: list[int], size: int):
+    """
+    各行の文字列に含まれる検索語のコードごとに、先頭から size 行までの行番号を求める。
+    groups を渡した場合は、(コード, グループ) ごとに求める（グループ 0 の行は除く）。
+    戻り値: (コードの昇順の配列, 各コードの行番号の開始位置, 行番号)
+    """
+    import numpy as np
+
+    # 行を \0 で区切って連結し、隣り合う2文字と ASCII 以外の1文字をコードにする
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer("".join(text + "\0" for text in texts).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    codes[(codes >= 65) & (codes <= 90)] += np.uint64(32)
+    rows = np.repeat(np.arange(len(texts), dtype=np.int64), lengths + 1)
+
+    pair = (codes[:-1] != 0) & (codes[1:] != 0)
+    single = codes > 127
+    keys = np.concatenate([(codes[:-1][pair] << np.uint64(21)) | codes[1:][pair], codes[single] | np.uint64(_UNIGRAM)])
+    rows = np.concatenate([rows[:-1][pair], rows[single]])
+
+    if groups is not None:
+        group = np.asarray(groups, dtype=np.uint64)[rows]
+        keys = (keys << np.uint64(_CATEGORY_BITS)) | group
+        keys, rows = keys[group != 0], rows[group != 0]
+
+    # コードごとに行番号の順に並べ、同じ行の重複を除いてから先頭の size 行を残す
+    order = np.lexsort((rows, keys))
+    keys, rows = keys[order], rows[order]
+    unique = np.ones(len(keys), dtype=bool)
+    unique[1:] = (keys[1:] != keys[:-1]) | (rows[1:] != rows[:-1])
+    keys, rows = keys[unique], rows[unique]
+
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    starts = np.flatnonzero(first)
+    rank = np.arange(len(keys)) - np.repeat(starts, np.diff(np.append(starts, len(keys))))
+    keys, rows = keys[rank < size], rows[rank < size]
+
+    # 行番号と開始位置は 32 ビットで足りる（表のメモリを抑える）
+    keys, starts = np.unique(keys, return_index=True)
+    return keys, np.append(starts, len(rows)).astype(np.int32), rows.astype(np.int32)
+
+
+def _lookup(postings, code: int):
+    keys, starts, rows = postings
+    i = int(keys.searchsorted(code))
+    if i == len(keys) or int(keys[i]) != code:
+        return rows[:0]
+    return rows[starts[i]:starts[i + 1]]
+
+
+class ShortQueryTable:
+    """
+    1つのソースについて、1〜2文字の検索語ごとの上位 size 件のタグとエイリアスを保持する表。
+    カテゴリフィルタごとの上位と、翻訳の読みの前方一致の上位も持つ。
+    対象はタグの term / translate と、エイリアスの alias / translate（検索と同じ列）。
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.categories: dict[str, int] = {}
+        self.tag_ids = None
+        self.tags = None
+        self.tag_categories = None
+        self.readings: dict[str, list[int]] = {}
+        self.alias_keys: list[tuple[str, int]] = []
+        self.aliases = None
+        self.alias_categories = None
+        self.excluded: frozenset[str] = frozenset() # 作成時に使用回数で並び順が上がっていたため、上位の表から外したタグ
+        self.boosted: ShortQueryTable = None # 使用回数で並び順が変わるタグだけの表
+
+    # --- 作成 ---
+    @classmethod
+    def build(cls, conn: sqlite3.Connection, source_id: int, size: int, boosted: Iterable[str] = ()):
+        """
+        ソースの表を作る。boosted は使用回数で並び順が上がっているタグで、上位の表からは外して小さな表に入れる。
+        """
+        table = cls(size)
+        table.excluded = frozenset(boosted)
+
+        # タグ（検索結果と同じ並び順）
+        rows = conn.execute('''
+            SELECT id, term, translate, LOWER(categoryName) FROM tags
+            WHERE +source = ? AND shadowed = 0
+            ORDER BY rank DESC, label ASC, term ASC, id ASC
+        ''', (source_id,))
+        table._add_tags([row for row in rows if row[1] not in table.excluded])
+
+        # 翻訳の読み（前方一致のため、キーの先頭の数文字ごとに上位を持つ）
+        readings = conn.execute('''
+            SELECT reading.reading, tag.id, LOWER(tag.categoryName), tag.term FROM readings AS reading
+            JOIN tags AS tag ON tag.id = reading.tag
+            WHERE reading.source = ? AND tag.shadowed = 0
+            ORDER BY tag.rank DESC, tag.label ASC, tag.term ASC, tag.id ASC
+        ''', (source_id,))
+        table._add_readings(row for row in readings if row[3] not in table.excluded)
+
+        # エイリアス（主キーの並び順）
+        rows = conn.execute('''
+            SELECT alias.alias, alias.tag, alias.translate, LOWER(tag.categoryName) FROM aliases AS alias
+            JOIN tags AS tag ON tag.id = alias.tag
+            WHERE alias.source = ? AND alias.shadowed = 0
+            ORDER BY alias.alias ASC, alias.tag ASC
+        ''', (source_id,)).fetchall()
+        table.alias_keys = [(row[0], row[1]) for row in rows]
+        texts = [row[0] + ("\x01" + row[2] if row[2] else "") for row in rows]
+        groups = [table.category_index(row[3]) for row in rows]
+        table.aliases = _postings(texts, None, size)
+        table.alias_categories = _postings(texts, groups, size)
+
+        table.boosted = table._build_boosted(conn, source_id, table.excluded)
+        return table
+
+    def with_usage(self, conn: sqlite3.Connection, source_id: int, boosted: Iterable[str]) -> "ShortQueryTable":
+        """
+        使用回数が変わった後の表を返す（上位の表は共有し、使用回数で並び順が変わるタグだけの表を作り直す）。
+        作成時に外したタグは、使用回数が減った後も小さな表に残す。
+        """
+        table = copy.copy(self)
+        table.boosted = self._build_boosted(conn, source_id, self.excluded.union(boosted))
+        return table
+
+    def _build_boosted(self, conn: sqlite3.Connection, source_id: int, terms: frozenset[str]):
+        # 一致する行を全て持つ（並び順の上限で切らない）ため、検索時に SQL で並べ直せば上位が揃う
+        table = ShortQueryTable(0)
+        table.categories = dict(self.categories)
+        rows = []
+        terms = list(terms)
+        for i in range(0, len(terms), 500):
+            chunk = terms[i:i + 500]
+            rows.extend(conn.execute(f'''
+                SELECT id, term, translate, LOWER(categoryName) FROM tags
+                WHERE term IN ({','.join('?' for _ in chunk)}) AND +source = ? AND shadowed = 0
+            ''', [*chunk, source_id]))
+        table.size = len(rows)
+        table._add_tags(rows)
+
+        # readings にはタグIDのインデックスがないため、ソースの読みを1回だけ走査して絞り込む
+        tags = {row[0]: row for row in rows}
+        if not tags:
+            return table
+        readings = conn.execute('SELECT reading, tag FROM readings WHERE source = ? ORDER BY tag', (source_id,))
+        table._add_readings((reading, tag_id, tags[tag_id][3], tags[tag_id][1]) for reading, tag_id in readings if tag_id in tags)
+        return table
+
+    def _add_tags(self, rows: list[tuple]):
+        # (id, term, translate, カテゴリ) を並び順に受け取り、検索語ごとの上位の行番号を求める
+        import numpy as np
+
+        self.tag_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        texts = [row[1] + ("\x01" + row[2] if row[2] else "") for row in rows]
+        groups = [self.category_index(row[3]) for row in rows]
+        self.tags = _postings(texts, None, self.size)
+        self.tag_categories = _postings(texts, groups, self.size)
+
+    def _add_readings(self, rows: Iterable[tuple]):
+        # (読み, タグID, カテゴリ, term) を並び順に受け取る（同じタグの行は続けて渡す）
+        for reading, tag_id, category, _ in rows:
+            for prefix in {reading[:n] for n in range(1, _READING_PREFIX + 1)}:
+                for key in (prefix, (prefix, category)):
+                    ids = self.readings.setdefault(key, [])
+                    if len(ids) < self.size and (not ids or ids[-1] != tag_id):
+                        ids.append(tag_id)
+
+    # --- 保存と読み込み（インデックスの退避用） ---
+    def to_arrays(self, prefix: str) -> dict:
+        """
+        表を np.savez で書き出せる配列にする。
+        候補と読みのIDは配列のまま、カテゴリ・読み・エイリアスのキーは JSON（UTF-8 のバイト列）にまとめる。
+        """
+        import numpy as np
+
+        meta = {
+            "size": self.size,
+            "categories": self.categories,
+            "reading_keys": [key if isinstance(key, str) else list(key) for key in self.readings],
+            "alias_keys": self.alias_keys,
+            "excluded": sorted(self.excluded),
+        }
+        lengths = np.fromiter((len(ids) for ids in self.readings.values()), dtype=np.int64, count=len(self.readings))
+        arrays = {
+            f"{prefix}meta": np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+            f"{prefix}tag_ids": self.tag_ids,
+            f"{prefix}reading_ids": np.fromiter((i for ids in self.readings.values() for i in ids), dtype=np.int64, count=int(lengths.sum())),
+            f"{prefix}reading_starts": np.concatenate([[0], np.cumsum(lengths)]),
+        }
+        for name in _POSTINGS:
+            postings = getattr(self, name)
+            if postings is None:
+                continue # 使用回数で並び順が変わるタグの表はエイリアスを持たない
+            for part, array in zip(("keys", "starts", "rows"), postings):
+                arrays[f"{prefix}{name}_{part}"] = array
+        if self.boosted is not None:
+            arrays.update(self.boosted.to_arrays(f"{prefix}boosted_"))
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix: str):
+        meta = json.loads(arrays[f"{prefix}meta"].tobytes().decode("utf-8"))
+        table = cls(int(meta["size"]))
+        table.categories = {str(category): int(index) for category, index in meta["categories"].items()}
+        reading_ids = arrays[f"{prefix}reading_ids"].tolist()
+        starts = arrays[f"{prefix}reading_starts"].tolist()
+        table.readings = {
+            key if isinstance(key, str) else tuple(key): reading_ids[start:end]
+            for key, start, end in zip(meta["reading_keys"], starts, starts[1:])
+        }
+        table.alias_keys = [(alias, tag_id) for alias, tag_id in meta["alias_keys"]]
+        table.excluded = frozenset(meta["excluded"])
+        table.tag_ids = arrays[f"{prefix}tag_ids"]
+        for name in _POSTINGS:
+            if f"{prefix}{name}_keys" in arrays:
+                setattr(table, name, tuple(arrays[f"{prefix}{name}_{part}"] for part in ("keys", "starts", "rows")))
+        if f"{prefix}boosted_meta" in arrays:
+            table.boosted = cls.from_arrays(arrays, f"{prefix}boosted_")
+        return table
+
+    def category_index(self, category: str):
+        # カテゴリ別の表の番号（0 はカテゴリなし、または表の対象外）
+        if not category: return 0
+        index = self.categories.get(category)
+        if index is None:
+            if len(self.categories) >= _MAX_CATEGORIES: return 0
+            index = self.categories[category] = len(self.categories) + 1
+        return index
+
+    def nbytes(self):
+        """表が使っているおおよそのメモリ（バイト数）。"""
+        size = self.tag_ids.nbytes if self.tag_ids is not None else 0
+        for postings in (self.tags, self.tag_categories, self.aliases, self.alias_categories):
+            if postings is not None:
+                size += sum(array.nbytes for array in postings)
+        # 読みとエイリアスのキーは Python のオブジェクト（1件あたりの大きさを概算する）
+        size += sum(len(ids) for ids in self.readings.values()) * 8 + len(self.readings) * 120
+        size += len(self.alias_keys) * 100
+        size += len(self.excluded) * 80
+        if self.boosted is not None:
+            size += self.boosted.nbytes()
+        return size
+
+    # --- 検索 ---
+    def covers(self, limit: int, categories: list[str]):
+        # 件数が表の大きさ以内で、カテゴリフィルタが全て表にある場合のみ使える
+        return limit <= self.size and (len(self.categories) < _MAX_CATEGORIES or all(c in self.categories for c in categories))
+
+    def covers_reading(self, reading: str):
+        # 読みのキーは先頭の数文字までしか持たない
+        return len(reading) <= _READING_PREFIX
+
+    def find_tags(self, code: int, reading: str, categories: list[str]) -> list[int]:
+        """検索語に一致するタグのうち、並び順の上位のIDを返す（カテゴリごとの上位の和集合）。"""
+        ids = set()
+        for category in categories or [None]:
+            if category is None:
+                rows = _lookup(self.tags, code)
+            elif category in self.categories:
+                rows = _lookup(self.tag_categories, code << _CATEGORY_BITS | self.categories[category])
+            else:
+                continue
+            ids.update(self.tag_ids[rows].tolist())
+
+            if reading:
+                ids.update(self.readings.get(reading if category is None else (reading, category), ()))
+        if self.boosted is not None:
+            ids.update(self.boosted.find_tags(code, reading, categories))
+        return list(ids)
+
+    def find_aliases(self, code: int, categories: list[str]) -> list[tuple[str, int]]:
+        """検索語に一致するエイリアスのうち、並び順の上位の (alias, tag) を返す。"""
+        keys = set()
+        for category in categories or [None]:
+            if category is None:
+                rows = _lookup(self.aliases, code)
+            elif category in self.categories:
+                rows = _lookup(self.alias_categories, code << _CATEGORY_BITS | self.categories[category])
+            else:
+                continue
+            keys.update(self.alias_keys[row] for row in rows.tolist())
+        return list(keys)
+
+
+def save_tables(path, tables: dict[int, ShortQueryTable]):
+    """ソースID -> 表 を1つの .npz ファイルに書き出す（pickle は使わない）。"""
+    import numpy as np
+
+    arrays = {"sources": np.array(list(tables), dtype=np.int64)}
+    for source_id, table in tables.items():
+        arrays.update(table.to_arrays(f"{source_id}_"))
+    with open(path, mode="wb") as file:
+        np.savez(file, **arrays)
+
+
+def load_tables(path) -> dict[int, ShortQueryTable]:
+    """save_tables で書き出した表を読み込む。壊れたファイルの場合は ValueError を送出する。"""
+    import numpy as np
+
+    try:
+        with np.load(path, allow_pickle=False) as arrays:
+            return {
+                source_id: ShortQueryTable.from_arrays(arrays, f"{source_id}_")
+                for source_id in arrays["sources"].tolist()
+            }
+    except (KeyError, TypeError, zipfile.BadZipFile) as e:
+        raise ValueError(f"invalid short query tables: {e}") from e
@@ -1,13 +1,52 @@
 from . import paths
+from contextlib import contextmanager
+import bz2
 import csv
+import gzip
+import heapq
+import itertools
+import json
+import lzma
 import os
+import re
 import sqlite3
+import threading
+import time
+from typing import Iterable
 import folder_paths
+from .reading import is_romaji_query, query_reading_key, translation_reading_keys
+from .short_queries import ShortQueryTable, load_tables, query_code, save_tables
+from .usage import UsageCounter
+from .cooccurrence import CooccurrenceIndex, prompt_tags
+from .lora_metadata import LoraMetadataCache
 from .wildcards import WildcardLoader
+from .utils import is_queue_idle, LoadCancelled, SearchCancelled
 
 # ===============================================
 # ユーティリティ
 # ===============================================
+# 圧縮されたCSV（拡張子 -> 展開しながら読むための open）
+CSV_OPENERS = {".csv": open, ".csv.gz": gzip.open, ".csv.bz2": bz2.open, ".csv.xz": lzma.open}
+
+def csv_opener(filename: str):
+    # 対応するCSVファイルの場合は open 関数、それ以外は None を返す
+    lower = filename.lower()
+    for suffix, opener in CSV_OPENERS.items():
+        if lower.endswith(suffix):
+            return opener
+    return None
+
+def read_csv_rows(csv_path):
+    """
+    CSVの空でない行を順に返す。圧縮ファイルは展開したコピーを作らず、読みながら展開する。
+    ファイル全体を読み込まないため、メモリ使用量はファイルの大きさによらない。
+    """
+    opener = csv_opener(csv_path.name) or open
+    with opener(csv_path, mode="rt", encoding="utf-8", newline="") as file:
+        for row in csv.reader(file):
+            if row:
+                yield row
+
 def load_category_map():
     category_map = {}
     category_map_path = paths.root_dir / "category_map.csv"
@@ -27,6 +66,83 @@ def load_category_map():
 
 
 
+# ===============================================
+# 検索用のスナップショット（読み取り専用の世代）
+# ===============================================
+class TagSnapshot:
+    """
+    書き込み用データベースを複製した読み取り専用の世代。
+    名前付きのインメモリデータベース（memdb VFS）に複製し、検索ごとに接続プールから接続を借りるため、
+    複数の検索を並列に実行できる。memdb が使えない SQLite では1つの接続を共有する。
+    """
+    MEMDB = sqlite3.sqlite_version_info >= (3, 36, 0)
+    _names = itertools.count(1)
+    
+    def __init__(self, source: sqlite3.Connection, source_ids: list[int], short_queries: dict = None):
+        self.source_ids = source_ids
+        self.short_queries = short_queries or {} # ソースID -> 1〜2文字の検索語の上位候補表
+        self.groups: set[str] = set() # タグのカテゴリ名（小文字、カテゴリなしは空文字）
+        self.uri = f"file:/jupo-extagcomplete-{os.getpid()}-{next(self._names)}?vfs=memdb" if self.MEMDB else None
+        self._lock = threading.Lock()
+        self._pool = []
+        self._users = 0
+        self._retired = False
+        
+        # この接続が開いている間、データベースが保持される
+        self._owner = self._connect()
+        source.backup(self._owner)
+        self.groups = {group or "" for (group,) in self._owner.execute('SELECT DISTINCT LOWER(categoryName) FROM tags')}
+    
+    def _connect(self):
+        if self.uri is None:
+            return sqlite3.connect(':memory:', check_same_thread=False)
+        return sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+    
+    def acquire(self):
+        """検索用の接続を借りる。引退済みの世代の場合は None を返す。"""
+        with self._lock:
+            if self._retired: return None
+            self._users += 1
+            if self.uri is None: return self._owner
+            if self._pool: return self._pool.pop()
+        
+        try:
+            return self._connect()
+        except sqlite3.Error:
+            self.release(None)
+            raise
+    
+    def release(self, conn):
+        with self._lock:
+            self._users -= 1
+            if conn is not None and conn is not self._owner:
+                if self._retired:
+                    conn.close()
+                else:
+                    self._pool.append(conn)
+            if self._retired and self._users == 0:
+                self._close()
+    
+    def backup(self, target: sqlite3.Connection):
+        self._owner.backup(target)
+    
+    def retire(self):
+        # 新しい世代に置き換えられた。使用中の検索が終わり次第、データベースを解放する
+        with self._lock:
+            self._retired = True
+            if self._users == 0:
+                self._close()
+    
+    def _close(self):
+        for conn in self._pool:
+            conn.close()
+        self._pool = []
+        if self._owner is not None:
+            self._owner.close()
+            self._owner = None
+
+
+
 # ===============================================
 # タグデータを管理し、検索機能を提供する
 # ===============================================
@@ -40,128 +156,476 @@ class TagDataManager:
     enable_loras: bool = False
     enable_wildcards: bool = False
     
-    main_filename: str = None
-    extra_filename: str = None
+    # main / extra は複数ファイルを重ねて読み込める（リストの先頭ほど優先）
+    main_filename: str | list[str] = None
+    extra_filename: str | list[str] = None
     translate_filename: str = None
     
-    tables = ["main", "extra", "embeddings", "loras", "wildcards"]
-    category_map = load_category_map()
+    # ソースの種類と優先度の基準値（値が小さいほど優先。同じ種類のファイルは並び順を加算）
+    source_kinds = {"main": 0, "extra": 1000, "embeddings": 2000, "loras": 3000, "wildcards": 4000}
+    layered_kinds = ["main", "extra"] # 重複除去の対象となるタグファイルの種類
+    category_map: dict = None # 初回のパース時に読み込む
     max_count: int = 50
+    page_size: int = 200 # 全て表示（max_count が 0）の場合に1回で返す件数
+    wildcard_preview_lines: int = 10
+    wildcard_reverse_limit: int = 200
     restrictAlias: bool = False
+    enable_next_tags: bool = False # 次のタグの候補（Suggest Next Tags）。有効な場合のみキューに追加されたプロンプトから共起を学習する
+    usage_weight: int = 10000 # 確定された回数（減衰後の整数部分）1回あたりに postCount の並び順へ加える数（0 で無効）
+    memory_budget_mb: int = 0 # インデックスのメモリの上限（MB、0 で無制限）
+    idle_release_minutes: int = 0 # 検索のない状態がこの時間続いたら、インデックスをディスクに退避してメモリを解放する（0 で無効）
+    memory_check_interval: float = 60.0 # アイドル状態と上限を確認する間隔（秒）
+    
+    # 再起動後のウォームアップ用に保存する選択状態
+    selection_keys = [
+        "enable", "main_filename", "extra_filename", "translate_filename", 
+        "enable_embeddings", "enable_loras", "enable_wildcards", 
+        "max_count", "restrictAlias", "enable_next_tags", "memory_budget_mb", "idle_release_minutes", 
+    ]
     
-    conn = None
+    conn = None # 書き込み用の接続（読み込み中のみ存在する）
+    _lock = threading.RLock() # 書き込みの排他
+    _write_depth: int = 0
+    _changed: bool = False # 公開していない変更があるか
+    _snapshot: TagSnapshot = None # 検索に使う公開中の世代
+    _snapshot_lock = threading.Lock()
+    _live: dict = {} # ソースの種類ごとに読み込み済みの選択
+    _sources: dict = {} # ソース名 -> {"id", "kind", "priority"}
+    _next_source_id: int = 1
+    _next_tag_id: int = 1
+    _short_queries: dict = {} # ソースID -> 1〜2文字の検索語の上位候補表
+    _short_queries_dirty: set = set() # 候補表を作り直すソースID
+    _usage_boosts: dict = {} # 並び順に反映済みの使用回数（タグ -> rank に加えた数）
+    _wildcards_dirty: bool = False # 退避中にワイルドカードが更新され、読み戻し後に再インデックスするか
+    _short_queries_dropped: set = set() # メモリの上限のため上位候補表を作らないソースID
+    _evicted: bool = False # インデックスをディスクに退避してメモリを解放しているか
+    _last_access: float = 0.0 # 最後に検索または公開した時刻（time.monotonic）
+    _memory_stats: dict = {"evictions": 0, "restores": 0, "lastEviction": None, "lastRestoreMs": None}
+    _memory_monitor: threading.Thread = None
+    cancel_check_interval: int = 10000 # 中断を確認する行数の間隔
+    search_check_interval: int = 10000 # 検索の中断を確認する SQLite の命令数の間隔
     
     
     # -------------------------------------------
     # 初期化
     # -------------------------------------------
+    @classmethod
+    def get_category_map(cls):
+        if cls.category_map is None:
+            cls.category_map = load_category_map()
+        return cls.category_map
+    
     @classmethod
     def init_db(cls): 
-        cls.conn = sqlite3.connect(':memory:')
-        
-        # 各テーブル作成
-        for table in cls.tables:
-            cls.conn.execute(
-                f'''
-                CREATE TABLE IF NOT EXISTS {table}_tags (
-                    term TEXT, 
-                    text TEXT, 
-                    value TEXT, 
-                    category TEXT, 
-                    postCount TEXT, 
-                    categoryName TEXT, 
-                    site TEXT, 
-                    translate TEXT, 
-                    wildcardValue TEXT
-                )
-                '''
-            )
-            
-            # 各テーブルにインデックスを作成
-            cls.conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_term ON {table}_tags(term)')
-            cls.conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_category ON {table}_tags(category)')
-            cls.conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_categoryName_lower ON {table}_tags(LOWER(categoryName))')
+        # ウォームアップのスレッドとイベントループの両方から使うため、スレッドチェックは無効化し _lock で保護する
+        cls.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        
+        # 全ソースを1つのテーブルに格納し、source で区別する
+        #   id: タグごとの整数ID（エイリアスは aliases テーブルからこのIDを参照する）
+        #   text / value: term と同じ場合は NULL として保持し、読み出し時に term で補う
+        #   rank / label: 並び順（postCount の数値と、数値以外の postCount）を読み込み時に計算したもの
+        #   shadowed: 優先度の高いタグファイルに同じタグがあるため検索から除外する行
+        # 検索結果の並び順を主キーにしたクラスタ化テーブルにして、先頭から順に走査し LIMIT 件で打ち切れるようにする
+        cls.conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS tags (
+                id INTEGER, 
+                source INTEGER, 
+                priority INTEGER, 
+                term TEXT, 
+                text TEXT, 
+                value TEXT, 
+                category TEXT, 
+                postCount TEXT, 
+                categoryName TEXT, 
+                site TEXT, 
+                translate TEXT, 
+                wildcardValue TEXT, 
+                wildcardCount INTEGER, 
+                rank INTEGER, 
+                label TEXT, 
+                shadowed INTEGER DEFAULT 0, 
+                PRIMARY KEY (rank DESC, label, term, id)
+            ) WITHOUT ROWID
+            '''
+        )
+        
+        # WITHOUT ROWID の副インデックスは主キー全体を含むため、必要なものだけ作成する
+        # （ソース単位の削除は読み込み時のみのため、source のインデックスは作らず走査する）
+        cls.conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_tags_id ON tags(id)')
+        cls.conn.execute('CREATE INDEX IF NOT EXISTS idx_tags_term ON tags(term)')
+        
+        # エイリアス -> タグIDの対応表（タグの内容は複製せず、検索時に tags と結合する）
+        # 主キーが alias のため、完全一致の検索はインデックスの1回の探索で済む
+        cls.conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS aliases (
+                alias TEXT, 
+                tag INTEGER, 
+                source INTEGER, 
+                priority INTEGER, 
+                translate TEXT, 
+                shadowed INTEGER DEFAULT 0, 
+                PRIMARY KEY (alias, tag)
+            ) WITHOUT ROWID
+            '''
+        )
+        
+        cls.conn.execute('CREATE INDEX IF NOT EXISTS idx_aliases_translate ON aliases(translate) WHERE translate IS NOT NULL')
+        
+        # 翻訳の読み（ローマ字）-> タグIDの対応表（ローマ字やかなの入力から、前方一致で翻訳を引く）
+        cls.conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS readings (
+                reading TEXT, 
+                tag INTEGER, 
+                source INTEGER, 
+                PRIMARY KEY (reading, tag)
+            ) WITHOUT ROWID
+            '''
+        )
         
         cls.conn.commit()
+        cls._sources = {}
+        cls._short_queries = {}
+        cls._usage_boosts = cls.usage_boosts()
 
     
     # -------------------------------------------
-    # Main CSV
+    # 書き込みと世代の公開
     # -------------------------------------------
     @classmethod
-    def load_main(cls):
-        # データベースが無ければ作成
-        if not cls.conn:
+    @contextmanager
+    def writing(cls, activity: bool = True):
+        # 読み込み処理の区間。最も外側の区間を抜けるときに、変更を新しい世代として公開する
+        # バックグラウンドの更新（activity=False）は、アイドル時間の計測をやり直さない
+        with cls._lock:
+            cls._write_depth += 1
+            try:
+                yield
+            finally:
+                cls._write_depth -= 1
+                if cls._write_depth == 0:
+                    cls.publish(activity)
+    
+    
+    @classmethod
+    def open_writer(cls):
+        # 書き込み用の接続を用意する（公開中の世代があれば複製して続きから更新する）
+        if cls.conn is not None: return
+        
+        # 退避中の場合は、ディスクから読み戻した世代の続きから更新する
+        if cls._snapshot is None and cls._evicted:
+            cls.restore_index()
+            if cls.conn is not None: return
+        
+        if cls._snapshot is None:
             cls.init_db()
+            return
         
-        # mainテーブルを削除
-        cls.clear_data_by_table("main")
+        cls.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        cls._snapshot.backup(cls.conn)
+    
+    
+    @classmethod
+    def publish(cls, activity: bool = True):
+        # 書き込み用データベースを複製して検索用の世代を差し替え、書き込み用の接続は閉じる
+        if cls.conn is None: return
         
-        # 早期リターン
-        if not cls.enable: return
-        if not cls.main_filename or cls.main_filename == "None": return
-        csv_path = paths.tags_dir / cls.main_filename
-        if not csv_path.exists(): return
+        if cls._changed:
+            cls.update_short_queries()
+            cls.enforce_memory_budget()
+            cls.set_snapshot(TagSnapshot(cls.conn, cls.source_ids(), dict(cls._short_queries)))
+            cls._changed = False
+            if activity or not cls._last_access:
+                cls._last_access = time.monotonic()
+            cls.start_memory_monitor()
         
-        with open(csv_path, mode="r", encoding="utf-8") as file:
-            reader = csv.reader(file)
-            rows = [row for row in reader if row] # 空行除去
-            
-        data = cls.parse_csv(rows)
+        cls.conn.close()
+        cls.conn = None
+    
+    
+    @classmethod
+    def update_short_queries(cls):
+        # 変更されたソースと、まだ表のないソースの上位候補表を作る（削除されたソースの表は捨てる）
+        # メモリの上限のため作らないソースも、変更された場合は改めて上限と比べる
+        ids = cls.source_ids()
+        cls._short_queries = {
+            source_id: table for source_id, table in cls._short_queries.items() 
+            if source_id in ids and source_id not in cls._short_queries_dirty
+        }
+        cls._short_queries_dropped = {source_id for source_id in cls._short_queries_dropped if source_id in ids} - cls._short_queries_dirty
+        cls._short_queries_dirty = set()
         
-        # mainテーブルに挿入
-        cls.insert_data_to_table(data, "main")
+        try:
+            for source_id in ids:
+                if source_id not in cls._short_queries and source_id not in cls._short_queries_dropped:
+                    cls._short_queries[source_id] = ShortQueryTable.build(cls.conn, source_id, cls.page_size, cls._usage_boosts.keys())
+        except ImportError:
+            # numpy がない場合は表を使わずに検索する
+            cls._short_queries = {}
+    
+    
+    @classmethod
+    def set_snapshot(cls, snapshot: TagSnapshot):
+        with cls._snapshot_lock:
+            previous = cls._snapshot
+            cls._snapshot = snapshot
+        if previous is not None:
+            previous.retire()
 
     
     # -------------------------------------------
-    # Extra CSV
+    # 選択状態の保存・復元
     # -------------------------------------------
     @classmethod
-    def load_extra(cls):
-        if not cls.conn:
-            cls.init_db()
+    def save_selection(cls):
+        data = {key: getattr(cls, key) for key in cls.selection_keys}
+        try:
+            with open(paths.selection_path, mode="w", encoding="utf-8") as file:
+                json.dump(data, file, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"Failed to save selection: {e}")
+    
+    
+    @classmethod
+    def restore_selection(cls):
+        if not paths.selection_path.exists():
+            return False
         
-        cls.clear_data_by_table("extra")
-
-        if not cls.enable: return
-        if not cls.extra_filename or cls.extra_filename == "None": return
-        csv_path = paths.tags_dir / cls.extra_filename
-        if not csv_path.exists(): return
+        try:
+            with open(paths.selection_path, mode="r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Failed to restore selection: {e}")
+            return False
         
-        with open(csv_path, mode="r", encoding="utf-8") as file:
-            reader = csv.reader(file)
-            rows = [row for row in reader if row]
+        for key in cls.selection_keys:
+            if key in data:
+                setattr(cls, key, data[key])
+        return True
+    
+    
+    # -------------------------------------------
+    # 起動時のウォームアップ
+    # -------------------------------------------
+    @classmethod
+    def warmup(cls):
+        # 前回の選択状態でインデックスを構築しておき、ブラウザ接続時のロードを不要にする
+        # 退避中に終了した場合に残った退避ファイルは使わずに消す
+        cls.remove_index_files()
+        if not cls.restore_selection(): return
         
-        data = cls.parse_csv(rows)
+        cls.toggle_enable(cls.enable)
+    
+    
+    # -------------------------------------------
+    # 読み込み済みかの判定
+    # -------------------------------------------
+    @classmethod
+    def is_live(cls, kind, selection):
+        # 同じ選択がすでに読み込まれていれば再構築しない
+        return kind in cls._live and cls._live[kind] == selection
+    
+    
+    @classmethod
+    def file_selection(cls, directory, filename):
+        # ファイル名と更新日時・サイズの組（ファイルが更新された場合は読み直す）
+        if not cls.enable: return None
+        if not filename or filename == "None": return None
+        path = directory / filename
+        if not path.exists(): return None
+        stat = path.stat()
+        return [filename, stat.st_mtime_ns, stat.st_size]
+    
+    
+    @classmethod
+    def files_selection(cls, directory, filenames):
+        # 複数ファイルの選択（読み込めるファイルのみ、優先順に並べる）
+        if isinstance(filenames, str) or filenames is None:
+            filenames = [filenames]
+        
+        selection = []
+        for filename in filenames:
+            file_selection = cls.file_selection(directory, filename)
+            if file_selection is not None and file_selection not in selection:
+                selection.append(file_selection)
+        return selection or None
+    
+    
+    # -------------------------------------------
+    # 中断の確認
+    # -------------------------------------------
+    @classmethod
+    def check_cancelled(cls, cancel: threading.Event = None):
+        # 新しいリクエストに置き換えられた場合は中断する
+        if cancel is not None and cancel.is_set():
+            raise LoadCancelled()
+    
+    
+    # -------------------------------------------
+    # ソースの入れ替え
+    # -------------------------------------------
+    @classmethod
+    def source_ids(cls, kinds: list[str] = None):
+        return [source["id"] for source in cls._sources.values() if kinds is None or source["kind"] in kinds]
+    
+    
+    @classmethod
+    def replace_sources(cls, kind, selection, sources: list[tuple[str, Iterable[dict]]], cancel: threading.Event = None):
+        # kind のソースを (ソース名, データ) のリストで置き換える（データは挿入しながら読み込むイテレータでもよい）
+        # 削除と挿入を1つのトランザクションで行い、中断された場合や読み込みに失敗した場合は元のデータに戻す
+        previous = dict(cls._sources)
+        try:
+            cls.clear_data_by_kind(kind, commit=False)
+            for order, (name, data) in enumerate(sources):
+                source = {
+                    "id": cls._next_source_id, 
+                    "kind": kind, 
+                    "priority": cls.source_kinds[kind] + order, 
+                }
+                cls._next_source_id += 1
+                cls._sources[name] = source
+                cls.insert_data_to_source(data, source, cancel, commit=False)
+            
+            if kind in cls.layered_kinds:
+                # 重複除去で他のファイルの検索対象も変わる
+                cls.update_shadowed(cancel)
+                cls._short_queries_dirty.update(cls.source_ids(cls.layered_kinds))
+            cls.apply_live_translate([kind], cancel, commit=False)
+            cls.conn.commit()
+        except Exception:
+            cls.conn.rollback()
+            cls._sources = previous
+            raise
+        
+        cls._changed = True        
+        cls._live[kind] = selection
+    
+    
+    @classmethod
+    def update_shadowed(cls, cancel: threading.Event = None):
+        # 重ねたタグファイル間で同じ (term, value) の行は、優先度が最も高いものだけを残す
+        cls.check_cancelled(cancel)
+        ids = cls.source_ids(cls.layered_kinds)
+        placeholders = ','.join('?' for _ in ids)
+        
+        cls.conn.execute('UPDATE tags SET shadowed = 0 WHERE shadowed != 0')
+        cls.conn.execute('UPDATE aliases SET shadowed = 0 WHERE shadowed != 0')
+        if len(ids) < 2: return
+        
+        cls.conn.execute(f'''
+            UPDATE tags SET shadowed = 1
+            WHERE source IN ({placeholders}) AND EXISTS (
+                SELECT 1 FROM tags AS other 
+                WHERE other.term = tags.term 
+                    AND other.value IS tags.value 
+                    AND other.priority < tags.priority 
+                    AND other.source IN ({placeholders})
+            )
+        ''', ids + ids)
+        
+        # エイリアスも同じ (alias, 参照先のタグ) の組は優先度が最も高いものだけを残す
+        cls.conn.execute(f'''
+            UPDATE aliases SET shadowed = 1
+            WHERE source IN ({placeholders}) AND EXISTS (
+                SELECT 1 FROM aliases AS other 
+                JOIN tags AS other_tag ON other_tag.id = other.tag 
+                JOIN tags AS tag ON tag.id = aliases.tag 
+                WHERE other.alias = aliases.alias 
+                    AND COALESCE(other_tag.value, other_tag.term) = COALESCE(tag.value, tag.term) 
+                    AND other.priority < aliases.priority 
+                    AND other.source IN ({placeholders})
+            )
+        ''', ids + ids)
+    
+    
+    # -------------------------------------------
+    # タグファイルの読み込み
+    # -------------------------------------------
+    @classmethod
+    def load_tag_files(cls, kind, filenames, cancel: threading.Event = None):
+        with cls.writing():
+            selection = cls.files_selection(paths.tags_dir, filenames)
+            if cls.is_live(kind, selection): return
+            
+            # 書き込み用のデータベースを用意
+            cls.open_writer()
+            
+            # 各ファイルは挿入時に読みながら変換する（全行をリストに展開しない）
+            sources = []
+            for filename, _, _ in selection or []:
+                rows = read_csv_rows(paths.tags_dir / filename)
+                sources.append((f"{kind}:{filename}", cls.parse_csv(rows)))
+            
+            # ソースを入れ替え、読み込み済みの翻訳を反映
+            cls.replace_sources(kind, selection, sources, cancel)
+    
+    
+    # -------------------------------------------
+    # Main CSV
+    # -------------------------------------------
+    @classmethod
+    def load_main(cls, cancel: threading.Event = None):
+        cls.load_tag_files("main", cls.main_filename, cancel)
 
-        cls.insert_data_to_table(data, "extra")
+    
+    # -------------------------------------------
+    # Extra CSV
+    # -------------------------------------------
+    @classmethod
+    def load_extra(cls, cancel: threading.Event = None):
+        cls.load_tag_files("extra", cls.extra_filename, cancel)
         
 
     # -------------------------------------------
     # Translate
     # -------------------------------------------
     @classmethod
-    def load_translate(cls):
-        if not cls.conn:
-            cls.init_db()
-        
-        cls.clear_translate_data()
+    def load_translate(cls, cancel: threading.Event = None):
+        with cls.writing():
+            selection = cls.file_selection(paths.translate_dir, cls.translate_filename)
+            if cls.is_live("translate", selection): return
+            
+            cls.open_writer()
+            
+            previous = cls._live.get("translate")
+            cls._live["translate"] = selection
+            try:
+                cls.clear_translate_data(commit=False)
+                cls.apply_live_translate(None, cancel, commit=False)
+                cls.conn.commit()
+                cls._short_queries_dirty.update(cls.source_ids())
+            except Exception:
+                # 中断された場合や、翻訳ファイルの読み込みに失敗した場合は元に戻す
+                cls.conn.rollback()
+                cls._live["translate"] = previous
+                raise
+            
+            cls._changed = True
+    
+    
+    @classmethod
+    def apply_live_translate(cls, kinds, cancel: threading.Event = None, commit=True):
+        # 読み込み済みの翻訳ファイルを指定した種類のソースに反映（None の場合は全ソース）
+        if not cls._live.get("translate"): return
         
-        if not cls.enable: return
-        if not cls.translate_filename or cls.translate_filename == "None": return
-        csv_path = paths.translate_dir / cls.translate_filename
+        csv_path = paths.translate_dir / cls._live["translate"][0]
         if not csv_path.exists(): return
         
-        with open(csv_path, mode="r", encoding="utf-8") as file:
-            reader = csv.reader(file)
-            rows = [row for row in reader if row]
-        
-        cls.apply_translate(rows)
+        cls.apply_translate(read_csv_rows(csv_path), kinds, cancel, commit)
     
     
     @classmethod
-    def apply_translate(cls, rows: list[list[str]]):
-        for row in rows:
+    def apply_translate(cls, rows: Iterable[list[str]], kinds: list[str] = None, cancel: threading.Event = None, commit=True):
+        ids = cls.source_ids(kinds)
+        if not ids: return
+        placeholders = ','.join('?' for _ in ids)
+        
+        for i, row in enumerate(rows):
+            if i % cls.cancel_check_interval == 0:
+                cls.check_cancelled(cancel)
+            
             if len(row) < 2:
                 continue
             
@@ -171,112 +635,273 @@ class TagDataManager:
             if not tag or not translate_str:
                 continue
             
-            for table in cls.tables:   
-                cls.conn.execute(f'''
-                    UPDATE {table}_tags 
-                    SET translate = ?
-                    WHERE term = ?
-                ''', (translate_str, tag))
+            cls.conn.execute(f'''
+                UPDATE tags 
+                SET translate = ?
+                WHERE term = ? AND source IN ({placeholders})
+            ''', (translate_str, tag, *ids))
+            cls.conn.execute(f'''
+                UPDATE aliases 
+                SET translate = ?
+                WHERE alias = ? AND source IN ({placeholders})
+            ''', (translate_str, tag, *ids))
+            cls.conn.executemany(f'''
+                INSERT OR IGNORE INTO readings (reading, tag, source)
+                SELECT ?, id, source FROM tags WHERE term = ? AND source IN ({placeholders})
+            ''', [(key, tag, *ids) for key in translation_reading_keys(translate_str)])
         
-        cls.conn.commit()
+        if commit:
+            cls.conn.commit()
     
     
     @classmethod
-    def clear_translate_data(cls):
+    def clear_translate_data(cls, commit=True):
         if cls.conn is None:
             return
         
         # translateカラムを全てNULLにリセット
-        for table in cls.tables:
-            cls.conn.execute(f'UPDATE {table}_tags SET translate = NULL')
-        cls.conn.commit()
+        cls.conn.execute('UPDATE tags SET translate = NULL WHERE translate IS NOT NULL')
+        cls.conn.execute('UPDATE aliases SET translate = NULL WHERE translate IS NOT NULL')
+        cls.conn.execute('DELETE FROM readings')
+        if commit:
+            cls.conn.commit()
     
     
     # -------------------------------------------
     # Embeddings
     # -------------------------------------------
     @classmethod
-    def load_embeddings(cls):
-        if not cls.conn:
-            cls.init_db()
-        
-        cls.clear_data_by_table("embeddings")
-
-        if not cls.enable: return
-        if not cls.enable_embeddings: return
-        
-        files = folder_paths.get_filename_list("embeddings")
-        data = cls.parse_embeddings(files)
+    def load_embeddings(cls, cancel: threading.Event = None):
+        with cls.writing():
+            files = folder_paths.get_filename_list("embeddings") if cls.enable and cls.enable_embeddings else None
+            selection = list(files) if files is not None else None
+            if cls.is_live("embeddings", selection): return
+            
+            cls.open_writer()
+            
+            data = cls.parse_embeddings(files) if selection is not None else None
 
-        cls.insert_data_to_table(data, "embeddings")
+            cls.replace_sources("embeddings", selection, [("embeddings", data)] if data else [], cancel)
     
     
     # -------------------------------------------
     # LoRA
     # -------------------------------------------
     @classmethod
-    def load_loras(cls):
-        if not cls.conn:
-            cls.init_db()
-        
-        cls.clear_data_by_table("loras")
-
-        if not cls.enable: return
-        if not cls.enable_loras: return
-        
-        files = folder_paths.get_filename_list("loras")
-        data = cls.parse_loras(files)
+    def load_loras(cls, cancel: threading.Event = None):
+        with cls.writing():
+            # 同じ名前のまま更新されたファイルも読み直すよう、更新日時とサイズも選択に含める
+            files = folder_paths.get_filename_list("loras") if cls.enable and cls.enable_loras else None
+            selection = cls.lora_selection(files) if files is not None else None
+            if cls.is_live("loras", selection): return
+            
+            cls.open_writer()
+            
+            data = cls.parse_loras(selection) if selection is not None else None
 
-        cls.insert_data_to_table(data, "loras")
+            cls.replace_sources("loras", selection, [("loras", data)] if data else [], cancel)
+    
+    
+    @classmethod
+    def lora_selection(cls, files: list[str]):
+        # [ファイル名, フルパス, 更新日時, サイズ] のリスト
+        selection = []
+        for file in files:
+            path = folder_paths.get_full_path("loras", file)
+            try:
+                stat = os.stat(path)
+            except (OSError, TypeError):
+                continue
+            selection.append([file, path, stat.st_mtime_ns, stat.st_size])
+        return selection
     
     
     # -------------------------------------------
     # Wildcards
     # -------------------------------------------
     @classmethod
-    def load_wildcards(cls):
-        if not cls.conn:
-            cls.init_db()
-        
-        cls.clear_data_by_table("wildcards")
-        WildcardLoader.unload()
-
-        if not cls.enable: return
-        if not cls.enable_wildcards: return
-        
-        WildcardLoader.load()
-        data = cls.parse_wildcards()
-
-        cls.insert_data_to_table(data, "wildcards")
+    def load_wildcards(cls, cancel: threading.Event = None):
+        with cls.writing():
+            # ワイルドカードの変更は監視スレッドが検知するため、世代番号で判定する
+            if cls.enable and cls.enable_wildcards:
+                WildcardLoader.load()
+                selection = WildcardLoader.get_generation()
+            else:
+                selection = None
+            if cls.is_live("wildcards", selection): return
+            
+            cls.open_writer()
+            
+            data = None
+            if selection is not None:
+                # ワイルドカードは常駐ストアから取得する（変更されたファイルのみ読み直す）
+                WildcardLoader.add_reload_listener(cls.on_wildcards_reloaded)
+                WildcardLoader.start_watcher(is_queue_idle)
+                data = cls.parse_wildcards()
 
-        WildcardLoader.unload()
+            cls.replace_sources("wildcards", selection, [("wildcards", data)] if data else [], cancel)
+    
+    
+    @classmethod
+    def on_wildcards_reloaded(cls):
+        # 監視スレッド（またはインデックスの読み戻し後に起動したスレッド）から呼ばれ、このスレッドで再インデックスして公開する
+        # 検索は公開中の世代を読むだけで、ここでの読み込みを待たない
+        with cls.writing(activity=False):
+            # 退避中はインデックスを読み戻さず、次に読み戻したときに反映する
+            if cls._evicted:
+                cls._wildcards_dirty = True
+                return
+            cls._wildcards_dirty = False
+            cls.load_wildcards()
     
 
     # -------------------------------------------
     # データベースにデータを挿入
     # -------------------------------------------
+    NUMERIC_RE = re.compile(r"\d+")
+    
     @classmethod
-    def insert_data_to_table(cls, data, table):
+    def sort_keys(cls, postCount):
+        # (rank, label): 数字で始まる postCount はその数値の降順、それ以外は -1 として postCount の昇順
+        # label は主キーの一部のため NULL の代わりに空文字とする（並び順は変わらない）
+        match = cls.NUMERIC_RE.match(postCount) if postCount else None
+        if match:
+            return int(match.group()), ""
+        return -1, postCount or ""
+    
+    
+    @classmethod
+    def insert_data_to_source(cls, data, source: dict, cancel: threading.Event = None, commit=True):
+        source_id = source["id"]
+        priority = source["priority"]
+        
+        # タグにIDを振り、エイリアスはIDへの対応として別テーブルに挿入する
+        # 数値の postCount のタグは、使用回数の分だけ並び順を上げる
+        boosts = cls._usage_boosts
+        tag_rows = []
+        alias_rows = []
+        
+        def flush():
+            cls.check_cancelled(cancel)
+            cls.insert_rows(tag_rows, alias_rows)
+            tag_rows.clear()
+            alias_rows.clear()
+        
         for item in data:
-            if item and item.get("term"):
-                cls.conn.execute(
-                    f'''
-                    INSERT INTO {table}_tags (term, text, value, category, postCount, categoryName, site, translate, wildcardValue)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        item.get("term"), 
-                        item.get("text"), 
-                        item.get("value"), 
-                        item.get("category"), 
-                        item.get("postCount"), 
-                        item.get("categoryName"), 
-                        item.get("site"), 
-                        item.get("translate"), 
-                        item.get("wildcardValue")
-                    )
-                )
+            if not item or not item.get("term"):
+                continue
+            
+            tag_id = cls._next_tag_id
+            cls._next_tag_id += 1
+            term = item.get("term")
+            text = item.get("text")
+            value = item.get("value")
+            postCount = item.get("postCount")
+            rank, label = cls.sort_keys(postCount)
+            if rank >= 0:
+                rank += boosts.get(term, 0)
+            tag_rows.append((
+                tag_id, 
+                source_id, 
+                priority, 
+                term, 
+                None if text == term else text, 
+                None if value == term else value, 
+                item.get("category"), 
+                postCount, 
+                item.get("categoryName"), 
+                item.get("site"), 
+                item.get("translate"), 
+                item.get("wildcardValue"), 
+                item.get("wildcardCount"), 
+                rank, 
+                label, 
+            ))
+            for alias in item.get("aliases") or ():
+                alias_rows.append((alias, tag_id, source_id, priority))
+            
+            # 一定行数ごとにまとめて挿入し、その間に中断を確認する
+            if len(tag_rows) >= cls.cancel_check_interval:
+                flush()
         
-        cls.conn.commit()
+        if tag_rows or alias_rows:
+            flush()
+        
+        if commit:
+            cls.conn.commit()
+    
+    
+    @classmethod
+    def insert_rows(cls, tag_rows, alias_rows):
+        cls.conn.executemany(
+            '''
+            INSERT INTO tags (id, source, priority, term, text, value, category, postCount, categoryName, site, translate, wildcardValue, wildcardCount, rank, label)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', tag_rows
+        )
+        # 同じタグに同じエイリアスが重複している場合は1つにまとめる
+        cls.conn.executemany(
+            '''
+            INSERT OR IGNORE INTO aliases (alias, tag, source, priority)
+            VALUES (?, ?, ?, ?)
+            ''', alias_rows
+        )
+    
+    
+    # -------------------------------------------
+    # 使用回数による並び順の調整
+    # -------------------------------------------
+    @classmethod
+    def record_usage(cls, term: str):
+        # 確定されたタグを数える（並び順への反映は、使用回数の書き出しと同じ間隔でまとめて行う）
+        UsageCounter.record(term)
+        UsageCounter.add_flush_listener(cls.apply_usage)
+        UsageCounter.flusher.start()
+    
+    
+    @classmethod
+    def usage_boosts(cls):
+        # 使用回数の整数部分だけを使い、減衰による小さな変化では並び順を書き換えない
+        if cls.usage_weight <= 0: return {}
+        return {term: int(count) * cls.usage_weight for term, count in UsageCounter.counts().items() if count >= 1}
+    
+    
+    @classmethod
+    def apply_usage(cls):
+        # 加える数が変わったタグの rank を更新して公開する（読み込み中の場合は次の書き出しに回す）
+        if cls._snapshot is None or not cls._lock.acquire(blocking=False): return
+        try:
+            boosts = cls.usage_boosts()
+            changed = [term for term in boosts.keys() | cls._usage_boosts.keys() if boosts.get(term) != cls._usage_boosts.get(term)]
+            if not changed: return
+            
+            with cls.writing(activity=False):
+                cls.open_writer()
+                
+                # 数値の postCount のタグのみ（idx_tags_term で引く）
+                rows = []
+                for i in range(0, len(changed), 500):
+                    terms = changed[i:i + 500]
+                    rows.extend(cls.conn.execute(f'''
+                        SELECT id, term, postCount, source FROM tags 
+                        WHERE term IN ({','.join('?' for _ in terms)}) AND rank >= 0
+                    ''', terms))
+                
+                cls.conn.executemany('UPDATE tags SET rank = ? WHERE id = ?', [
+                    (cls.sort_keys(postCount)[0] + boosts.get(term, 0), tag_id) for tag_id, term, postCount, _ in rows
+                ])
+                cls.conn.commit()
+                cls._usage_boosts = boosts
+                
+                # 上位候補表は、使用回数で並び順が変わるタグだけの部分を作り直す
+                for source in {source for *_, source in rows}:
+                    table = cls._short_queries.get(source)
+                    if table is not None and source not in cls._short_queries_dirty:
+                        cls._short_queries[source] = table.with_usage(cls.conn, source, boosts.keys())
+                if rows:
+                    cls._changed = True
+        finally:
+            cls._lock.release()
     
     
     # -------------------------------------------
@@ -285,8 +910,9 @@ class TagDataManager:
     
     # --- CSV ---
     @classmethod
-    def parse_csv(cls, rows: list[list[str]]):
-        data = []
+    def parse_csv(cls, rows: Iterable[list[str]]):
+        # 1行ずつ変換して返す（読み込みと挿入を並行して行い、全行を保持しない）
+        category_map = cls.get_category_map()
 
         for row in rows:
             if len(row) < 4:
@@ -300,39 +926,24 @@ class TagDataManager:
             if not tag:
                 continue # 空行や不正行をスキップ
             
+            # --- categoryName と site のマッピング ---
+            mapInfo = category_map.get(category if category else None) or {
+                "categoryName": None, 
+                "site": None
+            }
+            
             # --- メインデータ ---
-            main_entry = {
+            # エイリアスは行を複製せず、タグIDへの対応として保持する
+            yield {
                 "term": tag, 
                 "text": tag, 
                 "value": tag, 
                 "category": category if category else None, 
                 "postCount": postCount if postCount else None, 
+                "aliases": [aliasTag for aliasTag in aliasesStr.split(",") if aliasTag] if aliasesStr else None, 
+                "categoryName": mapInfo["categoryName"], 
+                "site": mapInfo["site"], 
             }
-            data.append(main_entry)
-
-            # --- エイリアスデータ ---
-            if aliasesStr:
-                for aliasTag in aliasesStr.split(","):
-                    if aliasTag:
-                        alias_entry = {
-                            "term": aliasTag, 
-                            "text": f"{aliasTag} => {tag}", 
-                            "value": tag, 
-                            "category": category if category else None, 
-                            "postCount": "Alias", 
-                        }
-                        data.append(alias_entry)
-        
-        # --- categoryName と site のマッピング ---
-        for tagData in data:
-            mapInfo = cls.category_map.get(tagData.get("category")) or {
-                "categoryName": None, 
-                "site": None
-            }
-            tagData["categoryName"] = mapInfo["categoryName"]
-            tagData["site"] = mapInfo["site"]
-        
-        return data
     
     # --- Embeddings ---
     @classmethod
@@ -354,10 +965,22 @@ class TagDataManager:
     
     # --- Loras ---
     @classmethod
-    def parse_loras(cls, files: list[str]):
+    def parse_loras(cls, selection: list[list]):
+        # .safetensors はヘッダーのトリガーワードも読む（変更されたファイルのみ、結果はキャッシュする）
+        metadata = LoraMetadataCache.get_many([
+            (path, mtime, size) for file, path, mtime, size in selection if file.lower().endswith(".safetensors")
+        ])
+        
+        # タグファイルにあるタグ（1girl など）は、トリガーワードとして重ねて表示しない
+        triggers = {tag for entry in metadata.values() for tag, _ in entry["triggers"]}
+        known = cls.tag_file_terms(list(triggers))
+        
         data = []
-        for file in files:
+        for file, path, mtime, size in selection:
             name = os.path.splitext(file)[0]
+            entry_triggers = [(tag, count) for tag, count in (metadata.get(path) or {}).get("triggers", ()) if tag not in known]
+            
+            # トリガーワードで検索すると、エイリアスとして LoRA も表示する
             data.append({
                 "term": f"lora:{name}", 
                 "text": f"lora:{name}", 
@@ -366,10 +989,38 @@ class TagDataManager:
                 "postCount": None, 
                 "categoryName": "LoRA", 
                 "site": None, 
+                "aliases": [tag for tag, _ in entry_triggers] or None, 
             })
+            
+            # トリガーワード自体も候補にする（学習タグの出現回数の順）
+            for tag, count in entry_triggers:
+                data.append({
+                    "term": tag, 
+                    "text": f"{tag} ({name})", 
+                    "value": tag, 
+                    "category": None, 
+                    "postCount": str(count) if count else None, 
+                    "categoryName": "Trigger", 
+                    "site": None, 
+                })
         
         return data
     
+    
+    @classmethod
+    def tag_file_terms(cls, terms: list[str]):
+        # 書き込み中のデータベースで、タグファイル（main / extra）にあるタグを引く
+        ids = cls.source_ids(cls.layered_kinds)
+        if not terms or not ids: return set()
+        
+        known = set()
+        for i in range(0, len(terms), cls.PROMPT_LOOKUP_CHUNK):
+            chunk = terms[i:i + cls.PROMPT_LOOKUP_CHUNK]
+            known.update(row[0] for row in cls.conn.execute(f'''
+                SELECT term FROM tags WHERE term IN ({','.join('?' for _ in chunk)}) AND source IN ({','.join('?' for _ in ids)})
+            ''', (*chunk, *ids)))
+        return known
+    
     # --- Wildcards ---
     @classmethod
     def parse_wildcards(cls):
@@ -377,6 +1028,8 @@ class TagDataManager:
         wildcards = WildcardLoader.get_wildcards_dict()
         for key, value in wildcards.items():
             key = f"__{key}__"
+            # 検索結果には先頭数行のプレビューと行数のみを含める
+            # 全内容は get_wildcard_values でページ単位に取得する
             data.append({
                 "term": key, 
                 "text": key, 
@@ -385,7 +1038,8 @@ class TagDataManager:
                 "postCount": None, 
                 "categoryName": "Wildcard", 
                 "site": None, 
-                "wildcardValue": ",".join(value)
+                "wildcardValue": "\n".join(value[:cls.wildcard_preview_lines]), 
+                "wildcardCount": len(value), 
             })
         
         return data
@@ -395,93 +1049,847 @@ class TagDataManager:
     # 検索
     # -------------------------------------------
     @classmethod
-    def search(cls, term: str, category: list[str] = None):
-        if not cls.enable or cls.conn is None: return []
+    def search(cls, term: str, category: list[str] = None, cancel: threading.Event = None):
+        # 中断された場合は None を返す
+        page = cls.search_page(term, category, cancel)
+        return page["results"] if page is not None else None
+    
+    
+    @classmethod
+    def search_page(cls, term: str, category: list[str] = None, cancel: threading.Event = None, cursor: dict = None, group: int = None):
+        """
+        検索結果を並び順に1ページ分返す（中断された場合は None）。
+        Suggestion Count が 0（全て表示）の場合は page_size 件ずつ返し、続きがある場合は
+        次のページを取得するためのカーソル（タグとエイリアスそれぞれの最後の行の並び順のキー）を返す。
+        group を渡した場合は、カテゴリごとに上位 group 件ずつをカテゴリのまとまりで返す（ページ分けなし）。
+        """
+        if not cls.enable: return {"results": [], "cursor": None}
+        
+        # 公開中の世代で検索する（読み込み中も前の世代で検索を続け、複数の検索は並列に実行される）
+        while True:
+            snapshot = cls.current_snapshot()
+            if snapshot is None: return {"results": [], "cursor": None}
+            conn = snapshot.acquire()
+            if conn is not None: break
+        
+        quota = group if isinstance(group, int) and group > 0 else None
+        paged = quota is None and not (cls.max_count is not None and cls.max_count > 0)
+        limit = cls.page_size if paged else cls.max_count
         
+        try:
+            if quota is not None:
+                results, next_cursor = cls._search_grouped(conn, snapshot.source_ids, term, category, cancel, quota, snapshot.groups)
+            else:
+                results, next_cursor = cls._search(conn, snapshot.source_ids, term, category, cancel, cursor if paged else None, limit, snapshot.short_queries)
+        except SearchCancelled:
+            return None
+        finally:
+            snapshot.release(conn)
+        
+        return {"results": results, "cursor": next_cursor if paged else None}
+    
+    
+    @classmethod
+    def _search(cls, conn: sqlite3.Connection, ids: list[int], term: str, category: list[str], cancel: threading.Event, cursor: dict, limit: int, short_queries: dict = None):
         escaped_term = term.replace('_', '\\_').replace('%', '\\%')
-
-        # Restrict Alias
-        if cls.restrictAlias:
-            where_clause = "(postCount IS NULL OR postCount != 'Alias' OR (postCount = 'Alias' AND (term = ? OR translate = ?))) AND (term LIKE '%' || ? || '%' ESCAPE '\\' OR translate LIKE '%' || ? || '%' ESCAPE '\\')"
-            params = [term, term, escaped_term, escaped_term]
-        else:
-            where_clause = "(term LIKE '%' || ? || '%' ESCAPE '\\' OR translate LIKE '%' || ? || '%' ESCAPE '\\')"
-            params = [escaped_term, escaped_term]
+        
+        # 読み込み済みのソースのみを対象とする（重ねたタグファイルで優先度の低い重複行は除外）
+        if not ids: return [], None
         
         # カテゴリフィルタ
-        if category and len(category) > 0:
-            category_lower = [c.lower() for c in category]
-            placeholders = ','.join(['?' for _ in category_lower])
-            where_clause += f" AND LOWER(categoryName) IN ({placeholders})"
+        category_lower = [c.lower() for c in category] if category else []
+        
+        # 前のページの続きから取得する
+        cursor = cursor if isinstance(cursor, dict) else {}
+        tag_after = cls.cursor_position(cursor, "tag", 4)
+        alias_after = cls.cursor_position(cursor, "alias", 2)
+        reading_after = cls.cursor_position(cursor, "reading", 4)
+        
+        # 中断された場合は、SQLite の進捗ハンドラで実行中のクエリを打ち切る
+        if cancel is not None:
+            if cancel.is_set(): raise SearchCancelled()
+            conn.set_progress_handler(cancel.is_set, cls.search_check_interval)
+        
+        # 1〜2文字の検索語の最初のページは、上位候補表から候補を引いて並べ直す
+        tables = None
+        code = query_code(term)
+        if code is not None and tag_after is None and alias_after is None and reading_after is None and short_queries:
+            tables = [short_queries.get(source_id) for source_id in ids]
+            if not all(table is not None and table.covers(limit, category_lower) for table in tables):
+                tables = None
+        
+        # かなの検索語は、翻訳の読みの一致もタグの一致と同じ並び順で統合する。
+        # ローマ字の検索語は英語の検索語とも読めるため、読みの一致はタグとエイリアスの一致の後ろに続ける
+        reading = query_reading_key(term)
+        romaji = reading is not None and is_romaji_query(term)
+        
+        # かなの 1〜2文字の検索語は、読みの一致も上位候補表から引く
+        table_reading = None
+        if reading is not None and not romaji and tables is not None and all(table.covers_reading(reading) for table in tables):
+            table_reading = reading
+        
+        try:
+            # タグとエイリアスはそれぞれ並び順で取得し、同じ並び順で統合する
+            if tables is not None:
+                tag_rows = cls.search_tags_by_table(conn, tables, code, table_reading, category_lower, limit)
+            else:
+                tag_rows = cls.search_tags(conn, escaped_term, ids, category_lower, limit, tag_after)
+            
+            # Restrict Alias の場合は完全一致のため、表を使わなくても主キーの探索で済む
+            if tables is not None and not cls.restrictAlias:
+                alias_rows = cls.search_aliases_by_table(conn, tables, code, category_lower, limit)
+            else:
+                alias_rows = cls.search_aliases(conn, term, escaped_term, ids, category_lower, limit, alias_after)
+            merged = heapq.merge(tag_rows, alias_rows, key=lambda row: row[0])
+            
+            if reading is not None and table_reading is None:
+                reading_rows = cls.search_readings(conn, escaped_term, reading, ids, category_lower, limit, reading_after)
+                merged = itertools.chain(merged, reading_rows) if romaji else heapq.merge(merged, reading_rows, key=lambda row: row[0])
+            
+            results = []
+            next_cursor = {"tag": tag_after, "alias": alias_after, "reading": reading_after}
+            for _, stream, position, result in merged:
+                results.append(result)
+                next_cursor[stream] = position
+                if len(results) == limit:
+                    break
+        except sqlite3.OperationalError:
+            if cancel is not None and cancel.is_set(): raise SearchCancelled()
+            raise
+        finally:
+            if cancel is not None:
+                conn.set_progress_handler(None, 0)
+        
+        # 最後まで取得した場合は続きがない
+        if len(results) < limit:
+            next_cursor = None
+        
+        # --wildcard の場合は、ワイルドカードの内容からも逆引きする（最後のページに付ける）
+        if next_cursor is None and "wildcard" in category_lower and cls.enable_wildcards:
+            if cancel is not None and cancel.is_set(): raise SearchCancelled()
+            limit = cls.max_count - len(results) if cls.max_count else cls.wildcard_reverse_limit
+            results.extend(cls.search_wildcard_values(term, results, limit))
+    
+        return results, next_cursor
+    
+    
+    @classmethod
+    def _search_grouped(cls, conn: sqlite3.Connection, ids: list[int], term: str, category: list[str], cancel: threading.Event, quota: int, groups: set[str]):
+        """
+        カテゴリ（category_map.csv の categoryName）ごとに、並び順の上位 quota 件を返す。
+        タグとエイリアスを主キーの並び順に1回だけ走査し、全てのカテゴリが quota 件に達した時点で打ち切る。
+        カテゴリの順は、各カテゴリの最上位の結果の並び順。
+        """
+        escaped_term = term.replace('_', '\\_').replace('%', '\\%')
+        if not ids: return [], None
+        
+        category_lower = [c.lower() for c in category] if category else []
+        
+        # 結果が出る可能性のあるカテゴリ（件数が揃ったかの判定に使う）
+        pending = {group for group in groups if not category_lower or group in category_lower}
+        
+        if cancel is not None:
+            if cancel.is_set(): raise SearchCancelled()
+            conn.set_progress_handler(cancel.is_set, cls.search_check_interval)
+        
+        results: dict[str, list[dict]] = {}
+        try:
+            tag_rows = cls.search_tags(conn, escaped_term, ids, category_lower, -1)
+            alias_rows = cls.search_aliases(conn, term, escaped_term, ids, category_lower, -1)
+            merged = heapq.merge(tag_rows, alias_rows, key=lambda row: row[0])
+            
+            # 読みの一致の扱いは _search と同じ（ローマ字の場合はタグとエイリアスの一致の後ろ）
+            reading = query_reading_key(term)
+            if reading is not None:
+                reading_rows = cls.search_readings(conn, escaped_term, reading, ids, category_lower, -1)
+                merged = itertools.chain(merged, reading_rows) if is_romaji_query(term) else heapq.merge(merged, reading_rows, key=lambda row: row[0])
+            
+            for _, _, _, result in merged:
+                group = (result["categoryName"] or "").lower()
+                items = results.setdefault(group, [])
+                if len(items) < quota:
+                    items.append(result)
+                    if len(items) == quota:
+                        pending.discard(group)
+                        if not pending: break
+        except sqlite3.OperationalError:
+            if cancel is not None and cancel.is_set(): raise SearchCancelled()
+            raise
+        finally:
+            if cancel is not None:
+                conn.set_progress_handler(None, 0)
+        
+        # --wildcard の場合は、ワイルドカードのまとまりの残りをワイルドカードの内容からの逆引きで埋める
+        if "wildcard" in category_lower and cls.enable_wildcards:
+            if cancel is not None and cancel.is_set(): raise SearchCancelled()
+            items = results.setdefault("wildcard", [])
+            items.extend(cls.search_wildcard_values(term, items, quota - len(items)))
+        
+        return [result for items in results.values() for result in items], None
+    
+    
+    @staticmethod
+    def cursor_position(cursor: dict, stream: str, size: int):
+        # クライアントから返されたカーソルのうち、形式が正しいものだけを使う
+        position = cursor.get(stream)
+        if isinstance(position, list) and len(position) == size:
+            return position
+        return None
+    
+    
+    @classmethod
+    def search_tags(cls, conn: sqlite3.Connection, escaped_term: str, ids: list[int], category_lower: list[str], limit: int, after: list = None):
+        # tags は検索結果の並び順 (rank DESC, label, term, id) を主キーにしたクラスタ化テーブルのため、
+        # 先頭から走査して LIMIT 件で打ち切る。source の条件は + を付けて、主キー以外のインデックスを選ばせない。
+        # 重ねたタグファイルで優先度の低い側にある重複行（shadowed = 1）は除く
+        where_clause = "(term LIKE '%' || ? || '%' ESCAPE '\\' OR translate LIKE '%' || ? || '%' ESCAPE '\\')"
+        params = [*ids, escaped_term, escaped_term]
+        
+        if category_lower:
+            where_clause += f" AND LOWER(categoryName) IN ({','.join('?' for _ in category_lower)})"
             params.extend(category_lower)
         
-        # 各テーブルからのSELECT文を作成
-        union_queries = []
-        for table in cls.tables:
-            union_queries.append(f'''
-                SELECT term, text, value, category, postCount, categoryName, site, translate, wildcardValue 
-                FROM {table}_tags 
-                WHERE {where_clause}
-            ''')
-        
-        # UNIONで結合
-        union_query = ' UNION ALL '.join(union_queries)
-        
-        # サブクエリとしてラップしてORDER BY
-        query = f'''
-        SELECT * FROM ({union_query})
-        ORDER BY 
-            CASE 
-                WHEN postCount GLOB '[0-9]*' THEN CAST(postCount AS INTEGER)
-                ELSE -1
-            END DESC,
-            CASE 
-                WHEN postCount GLOB '[0-9]*' THEN ''
-                ELSE postCount
-            END ASC,
-            term ASC
-        '''
+        # 前のページの最後の行より後ろ（主キーの並び順）から走査する
+        if after is not None:
+            where_clause += " AND rank <= ? AND (rank < ? OR (label, term, id) > (?, ?, ?))"
+            params.extend([after[0], after[0], after[1], after[2], after[3]])
         
-        # 取得数制限
-        if cls.max_count is not None and cls.max_count > 0:
-            query += f" LIMIT ?"
-            # UNIONの場合、パラメータを各テーブル分準備
-            all_params = []
-            for _ in cls.tables:
-                all_params.extend(params)
-            all_params.append(cls.max_count)
+        return cls.select_tags(conn, f"shadowed = 0 AND +source IN ({','.join('?' for _ in ids)}) AND {where_clause}", params, limit)
+    
+    
+    @classmethod
+    def search_readings(cls, conn: sqlite3.Connection, escaped_term: str, reading: str, ids: list[int], category_lower: list[str], limit: int, after: list = None):
+        # 翻訳の読みを readings の主キーの範囲で前方一致で引き、一致したタグだけを ID のインデックスで取得して並べ替える。
+        # 検索語そのものに一致するタグは search_tags の結果に含まれるため除く
+        where_clause = (
+            "id IN (SELECT tag FROM readings WHERE reading >= ? AND reading < ?) "
+            f"AND shadowed = 0 AND +source IN ({','.join('?' for _ in ids)}) "
+            "AND NOT (term LIKE '%' || ? || '%' ESCAPE '\\' OR translate LIKE '%' || ? || '%' ESCAPE '\\')"
+        )
+        params = [reading, reading + "\U0010ffff", *ids, escaped_term, escaped_term]
+        
+        if category_lower:
+            where_clause += f" AND LOWER(categoryName) IN ({','.join('?' for _ in category_lower)})"
+            params.extend(category_lower)
+        
+        if after is not None:
+            where_clause += " AND rank <= ? AND (rank < ? OR (label, term, id) > (?, ?, ?))"
+            params.extend([after[0], after[0], after[1], after[2], after[3]])
+        
+        return cls.select_tags(conn, where_clause, params, limit, "reading")
+    
+    
+    @classmethod
+    def search_tags_by_table(cls, conn: sqlite3.Connection, tables: list[ShortQueryTable], code: int, reading: str, category_lower: list[str], limit: int):
+        # 各ソースの上位候補（検索語とカテゴリで絞り込み済み）を合わせて並べ直す
+        tag_ids = [tag_id for table in tables for tag_id in table.find_tags(code, reading, category_lower)]
+        return cls.select_tags(conn, f"id IN ({','.join('?' for _ in tag_ids)})", tag_ids, limit)
+    
+    
+    @classmethod
+    def select_tags(cls, conn: sqlite3.Connection, where_clause: str, params: list, limit: int, stream: str = "tag"):
+        cursor = conn.execute(f'''
+            SELECT rank, label, term, COALESCE(text, term), COALESCE(value, term), category, postCount, categoryName, site, translate, wildcardValue, wildcardCount, id 
+            FROM tags 
+            WHERE {where_clause}
+            ORDER BY rank DESC, label ASC, term ASC, id ASC
+            LIMIT ?
+        ''', [*params, limit])
+        
+        for row in cursor:
+            yield (-row[0], row[1], row[2]), stream, [row[0], row[1], row[2], row[12]], {
+                "term": row[2],
+                "text": row[3], 
+                "value": row[4],
+                "category": row[5],
+                "postCount": row[6],
+                "categoryName": row[7],
+                "site": row[8], 
+                "translate": row[9], 
+                "wildcardValue": row[10], 
+                "wildcardCount": row[11], 
+            }
+    
+    
+    @classmethod
+    def search_aliases(cls, conn: sqlite3.Connection, term: str, escaped_term: str, ids: list[int], category_lower: list[str], limit: int, after: list = None):
+        # Restrict Alias の場合は完全一致のみ（主キーと翻訳のインデックスを引くだけで済む）
+        if cls.restrictAlias:
+            where_clause = "(alias.alias = ? OR alias.translate = ?)"
+            params = [*ids, term, term]
         else:
-            all_params = []
-            for _ in cls.tables:
-                all_params.extend(params)
+            where_clause = "(alias.alias LIKE '%' || ? || '%' ESCAPE '\\' OR alias.translate LIKE '%' || ? || '%' ESCAPE '\\')"
+            params = [*ids, escaped_term, escaped_term]
+        
+        if category_lower:
+            where_clause += f" AND LOWER(tag.categoryName) IN ({','.join('?' for _ in category_lower)})"
+            params.extend(category_lower)
+        
+        # 前のページの最後の行より後ろ（主キーの並び順）から走査する
+        if after is not None:
+            where_clause += " AND (alias.alias, alias.tag) > (?, ?)"
+            params.extend(after)
         
-        cursor = cls.conn.execute(query, all_params)
-        results = []
+        return cls.select_aliases(conn, f"alias.shadowed = 0 AND +alias.source IN ({','.join('?' for _ in ids)}) AND {where_clause}", params, limit)
+    
+    
+    @classmethod
+    def search_aliases_by_table(cls, conn: sqlite3.Connection, tables: list[ShortQueryTable], code: int, category_lower: list[str], limit: int):
+        alias_keys = [key for table in tables for key in table.find_aliases(code, category_lower)]
+        if not alias_keys: return iter(())
         
-        for row in cursor.fetchall():
-            results.append({
+        # 行値の IN だけでは主キーを使わないため、alias の IN で探索範囲を絞る
+        names = list({alias for alias, _ in alias_keys})
+        where_clause = f"alias.alias IN ({','.join('?' for _ in names)}) AND (alias.alias, alias.tag) IN (VALUES {','.join('(?, ?)' for _ in alias_keys)})"
+        return cls.select_aliases(conn, where_clause, [*names, *(value for key in alias_keys for value in key)], limit)
+    
+    
+    @classmethod
+    def select_aliases(cls, conn: sqlite3.Connection, where_clause: str, params: list, limit: int):
+        cursor = conn.execute(f'''
+            SELECT alias.alias, COALESCE(tag.value, tag.term), tag.category, tag.categoryName, tag.site, alias.translate, alias.tag 
+            FROM aliases AS alias 
+            JOIN tags AS tag ON tag.id = alias.tag 
+            WHERE {where_clause}
+            ORDER BY alias.alias ASC, alias.tag ASC
+            LIMIT ?
+        ''', [*params, limit])
+        
+        # エイリアスの並び順はタグの postCount が "Alias" の場合と同じ
+        for row in cursor:
+            yield (1, "Alias", row[0]), "alias", [row[0], row[6]], {
                 "term": row[0],
-                "text": row[1], 
-                "value": row[2],
-                "category": row[3],
-                "postCount": row[4],
-                "categoryName": row[5],
-                "site": row[6], 
-                "translate": row[7], 
-                "wildcardValue": row[8], 
+                "text": f"{row[0]} => {row[1]}", 
+                "value": row[1],
+                "category": row[2],
+                "postCount": "Alias",
+                "categoryName": row[3],
+                "site": row[4], 
+                "translate": row[5], 
+                "wildcardValue": None, 
+                "wildcardCount": None, 
+            }
+    
+    
+    @classmethod
+    def search_wildcard_values(cls, term: str, results: list[dict], limit: int):
+        if limit <= 0: return []
+        
+        found = {result["term"] for result in results}
+        data = []
+
+        for key, matched in WildcardLoader.find_keys_by_value(term, limit + len(found)):
+            wildcard = f"__{key}__"
+            if wildcard in found:
+                continue
+            found.add(wildcard)
+
+            values = WildcardLoader.get_wildcards_dict().get(key, ())
+            data.append({
+                "term": wildcard, 
+                "text": f"{matched} => {wildcard}", 
+                "value": wildcard, 
+                "category": None, 
+                "postCount": None, 
+                "categoryName": "Wildcard", 
+                "site": None, 
+                "translate": None, 
+                "wildcardValue": "\n".join(values[:cls.wildcard_preview_lines]), 
+                "wildcardCount": len(values), 
+            })
+            if len(data) >= limit:
+                break
+        
+        return data
+    
+    
+    # -------------------------------------------
+    # 次のタグの候補（共起）
+    # -------------------------------------------
+    @classmethod
+    def learn_prompts(cls, texts: list[str]):
+        # キューに追加されたプロンプトごとに、読み込み済みのタグの組を数える（タグ以外の語は数えない）
+        for text in texts:
+            tags = prompt_tags(text)
+            known = cls.known_terms(tags)
+            CooccurrenceIndex.learn([tag for tag in tags if tag in known])
+        CooccurrenceIndex.flusher.start()
+    
+    
+    @classmethod
+    def known_terms(cls, terms: list[str]):
+        # 公開中の世代にある、数値の postCount のタグ（idx_tags_term で引く）
+        # バックグラウンドの学習に使うため、退避中の世代は読み戻さず、最後の検索の時刻も更新しない
+        if not terms: return set()
+        terms = terms[:CooccurrenceIndex.MAX_PROMPT_TAGS * 2]
+        query = f"SELECT term FROM tags WHERE term IN ({','.join('?' for _ in terms)}) AND shadowed = 0 AND rank >= 0"
+        
+        while True:
+            snapshot = cls._snapshot
+            if snapshot is None: break
+            conn = snapshot.acquire()
+            if conn is None: continue
+            try:
+                return {row[0] for row in conn.execute(query, terms)}
+            finally:
+                snapshot.release(conn)
+        
+        # 退避中は、ディスクに書き出した世代を読み取り専用で引く（読み戻しとは _lock で排他する）
+        with cls._lock:
+            if not cls._evicted: return set()
+            try:
+                conn = sqlite3.connect(f"{paths.index_snapshot_path.as_uri()}?mode=ro", uri=True)
+                try:
+                    return {row[0] for row in conn.execute(query, terms)}
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                print(f"Failed to read tag index snapshot: {e}")
+                return set()
+    
+    
+    @classmethod
+    def suggest_next(cls, text: str):
+        """
+        カーソルの前のプロンプトに続くタグの候補を、共起のスコアの高い順に返す。
+        候補の表示内容は検索結果と同じ形式（公開中の世代から引く）。
+        """
+        if not cls.enable: return {"results": [], "cursor": None}
+        
+        tags = prompt_tags(text)
+        limit = cls.max_count if cls.max_count else cls.page_size
+        
+        # 直近のタグほど次のタグとの関係が強いため、末尾の一定数だけを使う
+        scored = CooccurrenceIndex.suggest(tags[-32:], limit, exclude=set(tags))
+        if not scored: return {"results": [], "cursor": None}
+        
+        while True:
+            snapshot = cls.current_snapshot()
+            if snapshot is None: return {"results": [], "cursor": None}
+            conn = snapshot.acquire()
+            if conn is not None: break
+        
+        try:
+            terms = [term for term, _ in scored]
+            where_clause = f"shadowed = 0 AND +source IN ({','.join('?' for _ in snapshot.source_ids)}) AND term IN ({','.join('?' for _ in terms)})"
+            found = {}
+            for _, _, _, result in cls.select_tags(conn, where_clause, [*snapshot.source_ids, *terms], -1):
+                found.setdefault(result["term"], result)
+        finally:
+            snapshot.release(conn)
+        
+        return {"results": [found[term] for term in terms if term in found], "cursor": None}
+    
+    
+    # -------------------------------------------
+    # プロンプトの正規化（エイリアスを正式なタグに、未知のタグの検出）
+    # -------------------------------------------
+    # 補完の検索語と同じ区切り文字で分割する（エスケープされた括弧はタグの一部）
+    PROMPT_TOKEN_RE = re.compile(r'(?:\\.|[^,;"|{}()\n\\])+')
+    PROMPT_WEIGHT_RE = re.compile(r"\s*:\s*-?[\d.]+\s*$")
+    PROMPT_SPECIAL_RE = re.compile(r"^(?:<.*>|__.*__|embedding:.*)$", re.IGNORECASE)
+    PROMPT_LOOKUP_CHUNK = 500 # 1回のクエリで引く語の数
+    
+    @classmethod
+    def normalize_prompt(cls, prompt: str):
+        '''
+        プロンプト全体をタグに分割し、読み込み済みのタグとエイリアスを1回ずつまとめて引く。
+        戻り値:
+          - tokens: タグごとの位置（重みを除いたタグ名の範囲）、状態（tag / alias / unknown / special）、正式なタグとカテゴリ
+          - unknown: 見つからなかったタグ（重複なし）
+          - normalized: エイリアスを正式なタグに置き換えたプロンプト（元の表記に合わせて空白と括弧のエスケープを揃える）
+        '''
+        tokens = []
+        for match in cls.PROMPT_TOKEN_RE.finditer(prompt):
+            text = match.group()
+            # 強調を弱める角括弧と重みを除いた部分をタグ名とする
+            name = cls.PROMPT_WEIGHT_RE.sub("", text.strip(" \t[]")).strip(" \t[]")
+            if not name: continue
+            
+            start = match.start() + text.index(name)
+            key = name.replace("\\(", "(").replace("\\)", ")").replace(" ", "_").lower()
+            tokens.append({"text": name, "start": start, "end": start + len(name), "key": key})
+        
+        keys = list({token["key"] for token in tokens if not cls.PROMPT_SPECIAL_RE.match(token["text"])})
+        tags, aliases = cls.lookup_terms(keys)
+        
+        unknown = []
+        parts = []
+        position = 0
+        for token in tokens:
+            key = token.pop("key")
+            if cls.PROMPT_SPECIAL_RE.match(token["text"]):
+                token.update(status="special", value=None, category=None, categoryName=None)
+            elif key in tags:
+                token.update(status="tag", **tags[key])
+            elif key in aliases:
+                token.update(status="alias", **aliases[key])
+                
+                # 元の表記（空白区切りか、_ 区切りか）に合わせて置き換える
+                value = token["value"]
+                if " " in token["text"] or "_" not in token["text"]:
+                    value = value.replace("_", " ")
+                parts.append(prompt[position:token["start"]])
+                parts.append(value.replace("(", "\\(").replace(")", "\\)"))
+                position = token["end"]
+            else:
+                token.update(status="unknown", value=None, category=None, categoryName=None)
+                if token["text"] not in unknown:
+                    unknown.append(token["text"])
+        parts.append(prompt[position:])
+        
+        return {"tokens": tokens, "unknown": unknown, "normalized": "".join(parts)}
+    
+    
+    @classmethod
+    def lookup_terms(cls, keys: list[str]):
+        # タグとエイリアスをそれぞれ主キー・インデックスで引く（優先度の高いソースの行を使う）
+        tags = {}
+        aliases = {}
+        snapshot = cls.current_snapshot()
+        if snapshot is None or not keys: return tags, aliases
+        conn = snapshot.acquire()
+        if conn is None: return tags, aliases
+        
+        try:
+            for i in range(0, len(keys), cls.PROMPT_LOOKUP_CHUNK):
+                chunk = keys[i:i + cls.PROMPT_LOOKUP_CHUNK]
+                placeholders = ','.join('?' for _ in chunk)
+                for term, value, category, categoryName in conn.execute(f'''
+                    SELECT term, COALESCE(value, term), category, categoryName FROM tags 
+                    WHERE term IN ({placeholders}) AND shadowed = 0 
+                    ORDER BY priority ASC
+                ''', chunk):
+                    tags.setdefault(term, {"value": value, "category": category, "categoryName": categoryName})
+                for alias, value, category, categoryName in conn.execute(f'''
+                    SELECT alias.alias, COALESCE(tag.value, tag.term), tag.category, tag.categoryName FROM aliases AS alias 
+                    JOIN tags AS tag ON tag.id = alias.tag 
+                    WHERE alias.alias IN ({placeholders}) AND alias.shadowed = 0 
+                    ORDER BY alias.priority ASC, tag.rank DESC
+                ''', chunk):
+                    aliases.setdefault(alias, {"value": value, "category": category, "categoryName": categoryName})
+        finally:
+            snapshot.release(conn)
+        return tags, aliases
+    
+    
+    # -------------------------------------------
+    # 検索結果のエンコード（列形式）
+    # -------------------------------------------
+    @classmethod
+    def encode_columns(cls, results: list[dict]):
+        """
+        検索結果を列ごとの配列にまとめた、サイズの小さい形式に変換する。
+          - category / categoryName / site の組は categories に1度だけ登録し、categoryId で参照する
+          - text / value は term から導ける場合（エイリアスの text は "term => value"）は null にする
+          - 全て null の列は省略する
+        """
+        categories = []
+        category_ids = {}
+        category_column = []
+        columns = {name: [] for name in ("term", "text", "value", "postCount", "translate", "wildcardValue", "wildcardCount")}
+        
+        for result in results:
+            term = result["term"]
+            value = result["value"]
+            postCount = result["postCount"]
+            
+            key = (result["category"], result["categoryName"], result["site"])
+            category_id = category_ids.get(key)
+            if category_id is None:
+                category_id = category_ids[key] = len(categories)
+                categories.append(key)
+            category_column.append(category_id)
+            
+            text = f"{term} => {value}" if postCount == "Alias" else term
+            columns["term"].append(term)
+            columns["text"].append(None if result["text"] == text else result["text"])
+            columns["value"].append(None if value == term else value)
+            columns["postCount"].append(postCount)
+            columns["translate"].append(result["translate"])
+            columns["wildcardValue"].append(result["wildcardValue"])
+            columns["wildcardCount"].append(result["wildcardCount"])
+        
+        encoded = {
+            "format": "columns", 
+            "count": len(results), 
+            "categories": categories, 
+            "categoryId": category_column, 
+        }
+        for name, column in columns.items():
+            if any(item is not None for item in column):
+                encoded[name] = column
+        return encoded
+    
+    
+    # -------------------------------------------
+    # ワイルドカードの内容（ページ単位）
+    # -------------------------------------------
+    @classmethod
+    def get_wildcard_values(cls, key: str, offset: int = 0, limit: int = 100):
+        if not cls.enable or not cls.enable_wildcards:
+            return {"key": key, "total": 0, "offset": offset, "values": []}
+        
+        values, total = WildcardLoader.get_wildcard_values(key, offset, limit)
+        return {"key": key, "total": total, "offset": offset, "values": values}
+    
+    
+    # -------------------------------------------
+    # メモリの使用量と解放
+    #   メモリの上限を超えた場合は、大きなソースから上位候補表を手放す（そのソースは SQL で検索する）。
+    #   検索のない状態が続いた場合（上限を超えたままの場合は短い間隔で）は、公開中の世代をディスクに書き出して手放し、
+    #   次の検索でディスクから読み戻す（CSVの読み直しはしない）。
+    # -------------------------------------------
+    @classmethod
+    def current_snapshot(cls):
+        # 検索に使う世代（退避中の場合はディスクから読み戻す）
+        # 利用者の操作（検索・正規化）だけが使う。バックグラウンドの処理は _snapshot を直接参照し、読み戻さない
+        cls._last_access = time.monotonic()
+        if cls._snapshot is None and cls._evicted:
+            with cls._lock:
+                if cls._snapshot is None and cls._evicted:
+                    cls.restore_index()
+        return cls._snapshot
+    
+    
+    @classmethod
+    def database_bytes(cls, conn: sqlite3.Connection):
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        return page_count * page_size
+    
+    
+    @classmethod
+    def enforce_memory_budget(cls):
+        # 書き込み用データベースと上位候補表の合計が上限を超える場合は、大きな表から作らないようにする
+        if cls.memory_budget_mb <= 0: return
+        budget = cls.memory_budget_mb * 1024 * 1024
+        total = cls.database_bytes(cls.conn) + sum(table.nbytes() for table in cls._short_queries.values())
+        
+        for source_id, table in sorted(cls._short_queries.items(), key=lambda item: item[1].nbytes(), reverse=True):
+            if total <= budget: break
+            total -= table.nbytes()
+            del cls._short_queries[source_id]
+            cls._short_queries_dropped.add(source_id)
+            print(f"[ExTagComplete] Dropped short query table of source {source_id} to stay within the memory budget ({cls.memory_budget_mb} MB)")
+    
+    
+    @classmethod
+    def set_memory_budget(cls, megabytes: int):
+        # 上限の変更は、手放した上位候補表を作り直してから改めて適用する
+        with cls.writing():
+            cls.memory_budget_mb = max(0, int(megabytes or 0))
+            if cls._snapshot is None and not cls._evicted: return
+            cls.open_writer()
+            cls._short_queries_dropped = set()
+            cls._changed = True
+    
+    
+    @classmethod
+    def evict_index(cls, reason: str):
+        # 公開中の世代をディスクに書き出して手放す（読み込み中の場合は次の確認に回す）
+        # 使用中の検索は手放した世代のまま続き、終わり次第メモリが解放される
+        if cls._snapshot is None or not cls._lock.acquire(blocking=False): return False
+        try:
+            snapshot = cls._snapshot
+            if snapshot is None or cls.conn is not None: return False
+            
+            start = time.perf_counter()
+            released = cls.memory_usage()["totalBytes"]
+            temp_path = paths.index_snapshot_path.with_suffix(".tmp")
+            try:
+                if temp_path.exists():
+                    temp_path.unlink()
+                target = sqlite3.connect(temp_path)
+                try:
+                    snapshot.backup(target)
+                finally:
+                    target.close()
+                # 上位候補表は numpy の配列のまま書き出し、読み戻し時に作り直す
+                if cls._short_queries:
+                    save_tables(paths.index_short_queries_path, cls._short_queries)
+                else:
+                    paths.index_short_queries_path.unlink(missing_ok=True)
+                os.replace(temp_path, paths.index_snapshot_path)
+            except (OSError, sqlite3.Error, ValueError) as e:
+                print(f"Failed to save tag index snapshot: {e}")
+                return False
+            
+            cls._evicted = True
+            cls.set_snapshot(None)
+            cls._short_queries = {}
+            cls._memory_stats["evictions"] += 1
+            cls._memory_stats["lastEviction"] = reason
+            print(f"[ExTagComplete] Released tag index ({reason}): {released / 1024 / 1024:.1f} MB, saved in {(time.perf_counter() - start) * 1000:.0f} ms")
+            return True
+        finally:
+            cls._lock.release()
+    
+    
+    @classmethod
+    def restore_index(cls):
+        # 退避したインデックスをディスクから読み戻して公開する（_lock を取得した状態で呼ぶ）
+        start = time.perf_counter()
+        cls._evicted = False
+        try:
+            conn = sqlite3.connect(':memory:', check_same_thread=False)
+            source = sqlite3.connect(paths.index_snapshot_path)
+            try:
+                source.backup(conn)
+            finally:
+                source.close()
+            short_queries = load_tables(paths.index_short_queries_path) if paths.index_short_queries_path.exists() else {}
+        except (OSError, sqlite3.Error, ValueError, ImportError) as e:
+            # 読み戻せない場合は、読み込み済みの選択からインデックスを作り直す
+            print(f"Failed to restore tag index snapshot, rebuilding: {e}")
+            cls._live = {}
+            cls._sources = {}
+            cls._short_queries = {}
+            cls.toggle_enable(cls.enable)
+            return
+        
+        cls._short_queries = short_queries
+        cls.set_snapshot(TagSnapshot(conn, cls.source_ids(), dict(short_queries)))
+        conn.close()
+        cls.remove_index_files()
+        
+        elapsed = (time.perf_counter() - start) * 1000
+        cls._memory_stats["restores"] += 1
+        cls._memory_stats["lastRestoreMs"] = round(elapsed, 1)
+        print(f"[ExTagComplete] Restored tag index in {elapsed:.0f} ms")
+        
+        # 退避中に更新されたワイルドカードは、読み戻しを待っている検索とは別のスレッドで反映する
+        if cls._wildcards_dirty:
+            threading.Thread(target=cls.reindex_wildcards, name="ExTagCompleteWildcardReindex", daemon=True).start()
+    
+    
+    @classmethod
+    def reindex_wildcards(cls):
+        try:
+            cls.on_wildcards_reloaded()
+        except Exception as e:
+            print(f"Failed to reindex wildcards: {e}")
+    
+    
+    @classmethod
+    def remove_index_files(cls):
+        for path in (paths.index_snapshot_path, paths.index_snapshot_path.with_suffix(".tmp"), paths.index_short_queries_path):
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                print(f"Failed to remove tag index snapshot: {e}")
+    
+    
+    @classmethod
+    def memory_usage(cls):
+        """
+        インデックスのメモリ使用量をソースごとに返す。
+        データベースの大きさは、ソースごとの行の内容の大きさの割合で按分した概算。
+        """
+        report = {
+            "evicted": cls._evicted, 
+            "budgetMB": cls.memory_budget_mb, 
+            "idleReleaseMinutes": cls.idle_release_minutes, 
+            "idleSeconds": round(time.monotonic() - cls._last_access) if cls._last_access else None, 
+            "totalBytes": 0, 
+            "databaseBytes": 0, 
+            "shortQueryBytes": 0, 
+            "sources": [], 
+            **cls._memory_stats, 
+        }
+        
+        snapshot = cls._snapshot
+        conn = snapshot.acquire() if snapshot is not None else None
+        if conn is None:
+            report["sources"] = [{"name": name, "kind": source["kind"], "resident": False} for name, source in cls._sources.items()]
+            return report
+        
+        try:
+            database = cls.database_bytes(conn)
+            payload = {}
+            for table, columns in (
+                ("tags", "LENGTH(term) + IFNULL(LENGTH(text), 0) + IFNULL(LENGTH(value), 0) + IFNULL(LENGTH(translate), 0) + IFNULL(LENGTH(wildcardValue), 0)"), 
+                ("aliases", "LENGTH(alias) + IFNULL(LENGTH(translate), 0)"), 
+                ("readings", "LENGTH(reading)"), 
+            ):
+                # 行ごとの固定の大きさ（主キーと副インデックスの分）を加える
+                for source_id, rows, size in conn.execute(f'SELECT source, COUNT(*), SUM({columns}) + COUNT(*) * 48 FROM {table} GROUP BY source'):
+                    entry = payload.setdefault(source_id, {"rows": 0, "size": 0})
+                    entry["size"] += size or 0
+                    if table == "tags":
+                        entry["rows"] = rows
+        finally:
+            snapshot.release(conn)
+        
+        total_payload = sum(entry["size"] for entry in payload.values()) or 1
+        for name, source in cls._sources.items():
+            entry = payload.get(source["id"], {"rows": 0, "size": 0})
+            table = snapshot.short_queries.get(source["id"])
+            report["sources"].append({
+                "name": name, 
+                "kind": source["kind"], 
+                "resident": True, 
+                "rows": entry["rows"], 
+                "databaseBytes": database * entry["size"] // total_payload, 
+                "shortQueryBytes": table.nbytes() if table is not None else 0, 
+                "shortQueryDropped": source["id"] in cls._short_queries_dropped, 
             })
+        
+        report["databaseBytes"] = database
+        report["shortQueryBytes"] = sum(table.nbytes() for table in snapshot.short_queries.values())
+        report["totalBytes"] = report["databaseBytes"] + report["shortQueryBytes"]
+        return report
+    
+    
+    @classmethod
+    def start_memory_monitor(cls):
+        # アイドル状態と上限を確認するバックグラウンドスレッド（どちらも無効の間は何もしない）
+        if cls._memory_monitor and cls._memory_monitor.is_alive(): return
+        
+        cls._memory_monitor = threading.Thread(target=cls._memory_monitor_loop, name="ExTagCompleteMemoryMonitor", daemon=True)
+        cls._memory_monitor.start()
+    
+    
+    @classmethod
+    def _memory_monitor_loop(cls):
+        while True:
+            time.sleep(cls.memory_check_interval)
+            try:
+                cls.check_memory()
+            except Exception as e:
+                print(f"Failed to check tag index memory: {e}")
+    
     
-        return results
+    @classmethod
+    def check_memory(cls):
+        snapshot = cls._snapshot
+        if snapshot is None: return
+        
+        idle = time.monotonic() - cls._last_access
+        if cls.idle_release_minutes > 0 and idle >= cls.idle_release_minutes * 60:
+            cls.evict_index(f"idle for {idle / 60:.0f} min")
+        elif cls.memory_budget_mb > 0 and idle >= cls.memory_check_interval:
+            # 上位候補表を手放しても上限を超えている場合は、短いアイドル時間で退避する
+            usage = cls.memory_usage()
+            if usage["totalBytes"] > cls.memory_budget_mb * 1024 * 1024:
+                cls.evict_index(f"over budget: {usage['totalBytes'] / 1024 / 1024:.1f} MB > {cls.memory_budget_mb} MB")
     
     
     # -------------------------------------------
     # データベースクリア
     # -------------------------------------------
     @classmethod
-    def clear_data_by_table(cls, table):
+    def clear_data_by_kind(cls, kind, commit=True):
         if cls.conn:
-            cls.conn.execute(f"DELETE FROM {table}_tags")
-            cls.conn.commit()
+            ids = cls.source_ids([kind])
+            if ids:
+                placeholders = ','.join('?' for _ in ids)
+                cls.conn.execute(f"DELETE FROM tags WHERE source IN ({placeholders})", ids)
+                cls.conn.execute(f"DELETE FROM aliases WHERE source IN ({placeholders})", ids)
+                cls.conn.execute(f"DELETE FROM readings WHERE source IN ({placeholders})", ids)
+            cls._sources = {name: source for name, source in cls._sources.items() if source["kind"] != kind}
+            if commit:
+                cls.conn.commit()
     
     
     # -------------------------------------------
@@ -489,9 +1897,18 @@ class TagDataManager:
     # -------------------------------------------
     @classmethod
     def close(cls):
-        if cls.conn:
-            cls.conn.close()
-            cls.conn = None
+        with cls._lock:
+            if cls.conn:
+                cls.conn.close()
+                cls.conn = None
+            cls.set_snapshot(None)
+            cls._changed = False
+            cls._live = {}
+            cls._sources = {}
+            cls._short_queries = {}
+            cls._short_queries_dropped = set()
+            cls._evicted = False
+            cls.remove_index_files()
     
     
     # -------------------------------------------
@@ -501,13 +1918,20 @@ class TagDataManager:
     def toggle_enable(cls, value):
         cls.enable = value
 
-        if value:
-            # trueの場合、全データ読み直し
-            cls.load_main()
-            cls.load_extra()
-            cls.load_translate()
-            cls.load_embeddings()
-            cls.load_loras()
-        else:
-            # false場合、データベースを閉じてメモリ解放
-            cls.close()
\ No newline at end of file
+        # 全ての読み込みが終わってから1つの世代として公開する
+        with cls.writing():
+            # 退避中でなければ、残っている退避ファイルは古いため消す（退避中は読み戻しに使う）
+            if not cls._evicted:
+                cls.remove_index_files()
+            
+            if value:
+                # trueの場合、全データ読み直し
+                cls.load_main()
+                cls.load_extra()
+                cls.load_translate()
+                cls.load_embeddings()
+                cls.load_loras()
+                cls.load_wildcards()
+            else:
+                # false場合、データベースを閉じてメモリ解放
+                cls.close()
\ No newline at end of file
@@ -0,0 +1,114 @@
+from __future__ import annotations
+from . import paths
+from .utils import PeriodicFlusher, save_json
+import json
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+
+# -----------------------------------------------
+# 補完で確定されたタグの使用回数
+#   確定のたびにメモリ上の回数を増やすだけで、ファイルへの書き出しは一定間隔でまとめて行う。
+#   回数は半減期で減衰させ（最後に更新した時刻と、その時点の回数を保持）、
+#   保持するタグ数に上限を設けて、長期間使い続けてもメモリと書き出しの量が増え続けないようにする。
+# -----------------------------------------------
+class UsageCounter:
+    HALF_LIFE = 30 * 24 * 60 * 60 # 回数が半分になるまでの秒数
+    MAX_KEYS = 5000 # 保持するタグ数の上限（書き出し時に、回数の少ないタグから捨てる）
+    MIN_COUNT = 0.05 # これより少なくなったタグは捨てる
+    FLUSH_INTERVAL = 300.0 # ファイルへの書き出しと、並び順への反映の間隔（秒）
+
+    _counts: Dict[str, Tuple[float, float]] = {} # タグ -> (回数, 更新した時刻)
+    _loaded: bool = False
+    _dirty: bool = False
+    _lock = threading.Lock()
+
+    # 一定間隔の書き出し（flusher.start() で開始）
+    flusher = PeriodicFlusher("ExTagCompleteUsageFlusher", lambda: UsageCounter.flush(), FLUSH_INTERVAL, "usage counts")
+    _flush_listeners: List[Callable[[], None]] = []
+
+    # --- Public API ---
+
+    @classmethod
+    def record(cls, term: str, now: float = None):
+        """確定されたタグの回数を1増やす（ファイルには書き出さない）。"""
+        now = time.time() if now is None else now
+        with cls._lock:
+            cls._load()
+            cls._counts[term] = (cls._decayed(term, now) + 1.0, now)
+            cls._dirty = True
+
+            # 書き出しまでの間に増えすぎた場合は、その場で上限まで減らす
+            if len(cls._counts) > cls.MAX_KEYS * 2:
+                cls._trim(now)
+
+    @classmethod
+    def counts(cls, now: float = None) -> Dict[str, float]:
+        """現時点まで減衰させた、全てのタグの回数を返す。"""
+        now = time.time() if now is None else now
+        with cls._lock:
+            cls._load()
+            return {term: cls._decayed(term, now) for term in cls._counts}
+
+    @classmethod
+    def flush(cls):
+        """変更があれば、回数をファイルに書き出してから、登録されたコールバックを呼び出す。"""
+        with cls._lock:
+            if not cls._dirty:
+                return
+            cls._trim(time.time())
+            data = {term: [round(count, 4), round(updated)] for term, (count, updated) in cls._counts.items()}
+            cls._dirty = False
+
+        save_json(paths.usage_path, data, "usage counts")
+
+        for listener in list(cls._flush_listeners):
+            try:
+                listener()
+            except Exception as e:
+                print(f"Usage flush listener failed: {e}")
+
+    @classmethod
+    def add_flush_listener(cls, listener: Callable[[], None]):
+        """書き出し後に呼び出されるコールバックを登録します。"""
+        if listener not in cls._flush_listeners:
+            cls._flush_listeners.append(listener)
+
+    # --- Internal ---
+
+    @classmethod
+    def _decayed(cls, term: str, now: float) -> float:
+        entry = cls._counts.get(term)
+        if entry is None:
+            return 0.0
+        count, updated = entry
+        return count * math.exp2(-max(0.0, now - updated) / cls.HALF_LIFE)
+
+    @classmethod
+    def _trim(cls, now: float):
+        # 減衰して少なくなったタグを捨て、上限を超える場合は回数の多いタグだけを残す
+        counts = {term: cls._decayed(term, now) for term in cls._counts}
+        kept = [term for term, count in counts.items() if count >= cls.MIN_COUNT]
+        if len(kept) > cls.MAX_KEYS:
+            kept = sorted(kept, key=counts.__getitem__, reverse=True)[:cls.MAX_KEYS]
+        cls._counts = {term: cls._counts[term] for term in kept}
+
+    @classmethod
+    def _load(cls):
+        if cls._loaded:
+            return
+        cls._loaded = True
+        if not paths.usage_path.exists():
+            return
+
+        try:
+            with open(paths.usage_path, mode="r", encoding="utf-8") as file:
+                data = json.load(file)
+            cls._counts = {
+                term: (float(entry[0]), float(entry[1])) for term, entry in data.items()
+                if isinstance(entry, list) and len(entry) == 2
+            }
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Failed to load usage counts: {e}")
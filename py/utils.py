@@ -1,8 +1,13 @@
 from functools import wraps
 from server import PromptServer
-from typing import Union, Literal
+from typing import Union, Literal, Callable, Any
 from comfy.comfy_types import IO
+import asyncio
+import atexit
+import json
+import os
 import sys
+import threading
 
 author = "jupo"
 packageName = "ExTagComplete"
@@ -21,6 +26,13 @@ def set_default_category(node_class_mappings: dict):
     for cls in node_class_mappings.values():
         if not hasattr(cls, "CATEGORY"):
             setattr(cls, "CATEGORY", f"{author}/{packageName}")
+
+def is_queue_idle():
+    """キューに実行中・待機中のプロンプトがない場合にTrueを返す"""
+    prompt_queue = getattr(PromptServer.instance, "prompt_queue", None)
+    if prompt_queue is None:
+        return True
+    return prompt_queue.get_tasks_remaining() == 0
         
 
 
@@ -60,6 +72,160 @@ class Endpoint:
 
 
 
+# ===============================================
+# 同時リクエストのまとめ（シングルフライト）
+# ===============================================
+class LoadCancelled(Exception):
+    """新しいリクエストに置き換えられて中断された処理"""
+
+
+class SingleFlight:
+    """
+    グループ（テーブルなど）ごとに処理を管理する。
+      - 同じキーの同時リクエストは、実行中の1つの処理の結果を共有する
+      - 異なるキーのリクエストが来た場合、実行中・待機中の処理に中断を通知する
+      - 同じグループの処理は直列に実行する
+    処理はワーカースレッドで実行され、中断通知用の threading.Event を引数に受け取る。
+    """
+    def __init__(self):
+        self._inflight: dict[str, tuple[Any, asyncio.Future, threading.Event]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    async def run(self, group: str, key: Any, func: Callable[[threading.Event], Any]):
+        inflight = self._inflight.get(group)
+        if inflight and inflight[0] == key and not inflight[1].done():
+            return await asyncio.shield(inflight[1])
+        
+        # 古い処理を中断させる
+        if inflight:
+            inflight[2].set()
+        
+        cancel = threading.Event()
+        lock = self._locks.setdefault(group, asyncio.Lock())
+
+        async def runner():
+            async with lock:
+                if cancel.is_set():
+                    return None
+                try:
+                    return await asyncio.to_thread(func, cancel)
+                except LoadCancelled:
+                    return None
+        
+        future = asyncio.ensure_future(runner())
+        self._inflight[group] = (key, future, cancel)
+        try:
+            return await asyncio.shield(future)
+        finally:
+            current = self._inflight.get(group)
+            if current and current[1] is future and future.done():
+                del self._inflight[group]
+
+
+
+# ===============================================
+# 古いリクエストの中断
+# ===============================================
+class SearchCancelled(Exception):
+    """新しいリクエストに置き換えられた、またはクライアントが切断したため中断された検索"""
+
+
+class RequestCancel(threading.Event):
+    """
+    リクエストの中断フラグ。
+    set() による通知に加えて、クライアントが切断した場合も中断として扱う。
+    """
+    def __init__(self, request=None):
+        super().__init__()
+        self._request = request
+
+    def is_set(self):
+        if super().is_set():
+            return True
+        if self._request is None:
+            return False
+        transport = self._request.transport
+        return transport is None or transport.is_closing()
+
+
+class LatestRequests:
+    """
+    クライアントごとに最新のリクエストだけを有効にする。
+    クライアントが付けた連番より新しいリクエストが届いた場合、実行中の古いリクエストに中断を通知する。
+    """
+    def __init__(self):
+        self._latest: dict[str, tuple[int, threading.Event]] = {}
+
+    def begin(self, client: str, seq: int, cancel: threading.Event):
+        if client is None or seq is None:
+            return
+        
+        current = self._latest.get(client)
+        if current and current[0] > seq:
+            # 新しいリクエストより後に届いた古いリクエスト
+            cancel.set()
+            return
+        
+        if current:
+            current[1].set()
+        self._latest[client] = (seq, cancel)
+
+    def end(self, client: str, cancel: threading.Event):
+        current = self._latest.get(client)
+        if current and current[1] is cancel:
+            del self._latest[client]
+
+
+
+# ===============================================
+# 学習データの保存（一定間隔でまとめて書き出す）
+# ===============================================
+def save_json(path, data, description: str):
+    """書き出し途中のファイルを読まないよう、一時ファイルに書いてから置き換える。"""
+    temp_path = path.with_suffix(".tmp")
+    try:
+        with open(temp_path, mode="w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Failed to save {description}: {e}")
+
+
+class PeriodicFlusher:
+    """flush を一定間隔（秒）でバックグラウンドスレッドから呼び出す（終了時にも1回呼び出す）。"""
+    def __init__(self, name: str, flush: Callable[[], None], interval: float, description: str):
+        self.name = name
+        self.flush = flush
+        self.interval = interval
+        self.description = description
+        self._thread: threading.Thread = None
+        self._stop = threading.Event()
+        self._registered = False
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, args=(self._stop,), name=self.name, daemon=True)
+        self._thread.start()
+        if not self._registered:
+            self._registered = True
+            atexit.register(self.flush)
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _loop(self, stop: threading.Event):
+        while not stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Failed to flush {self.description}: {e}")
+
+
+
 # ===============================================
 # ノード入力用
 # ===============================================
@@ -0,0 +1,399 @@
+from bisect import bisect_right
+from math import factorial
+import random
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+from .wildcards import WildcardLoader
+
+
+# -----------------------------------------------
+# ワイルドカードテンプレートの展開空間
+#   テンプレートを木構造に解析し、展開結果の総数の計算と
+#   番号から展開結果への変換（アンランク）を行う。
+#   展開空間全体をメモリに展開することはない。
+# -----------------------------------------------
+
+class _Node:
+    """展開空間の節点。`count` 通りの展開を持ち、`unrank(i)` で i 番目の展開を返す。"""
+    __slots__ = ("count",)
+
+    def unrank(self, index: int) -> str:
+        raise NotImplementedError
+
+
+class _Literal(_Node):
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+        self.count = 1
+
+    def unrank(self, index: int) -> str:
+        return self.text
+
+
+class _Sequence(_Node):
+    """子節点の連結。先頭の子が最も遅く変化する混合基数で番号付けする。"""
+    __slots__ = ("children",)
+
+    def __init__(self, children: List[_Node]):
+        self.children = children
+        self.count = 1
+        for child in children:
+            self.count *= child.count
+
+    def unrank(self, index: int) -> str:
+        parts = []
+        for child in reversed(self.children):
+            index, digit = divmod(index, child.count)
+            parts.append(child.unrank(digit))
+        return "".join(reversed(parts))
+
+
+class _Choice(_Node):
+    """候補から1つを選ぶ節点（`{a|b}` や `__name__`）。"""
+    __slots__ = ("options", "_offsets")
+
+    def __init__(self, options: List[_Node]):
+        self.options = options
+        self._offsets = []
+        total = 0
+        for option in options:
+            self._offsets.append(total)
+            total += option.count
+        self.count = total
+
+    def unrank(self, index: int) -> str:
+        i = bisect_right(self._offsets, index) - 1
+        return self.options[i].unrank(index - self._offsets[i])
+
+
+class _MultiSelect(_Node):
+    """
+    候補から k 個（k は範囲内）を重複なしで選び、区切り文字で連結する節点（`{1-2$$a|b|c}`）。
+    `WildcardLoader` は選んだ候補をランダムな順序で連結するため、順序を区別する並べ方として数える
+    （番号は「元の並び順での組み合わせ」×「k 個の並べ方」の混合基数）。
+    """
+    __slots__ = ("options", "separator", "sizes", "_ways", "_size_offsets")
+
+    def __init__(self, options: List[_Node], separator: str, sizes: List[int]):
+        self.options = options
+        self.separator = separator
+        self.sizes = sizes
+
+        # _ways[j][t]: options[j:] から t 個選ぶ場合の展開数（後ろから動的計画法）
+        max_size = max(sizes) if sizes else 0
+        ways = [[0] * (max_size + 1) for _ in range(len(options) + 1)]
+        ways[len(options)][0] = 1
+        for j in range(len(options) - 1, -1, -1):
+            next_ways = ways[j + 1]
+            c = options[j].count
+            row = ways[j]
+            row[0] = 1
+            for t in range(1, max_size + 1):
+                row[t] = next_ways[t] + c * next_ways[t - 1]
+        self._ways = ways
+
+        self._size_offsets = []
+        total = 0
+        for size in sizes:
+            self._size_offsets.append(total)
+            total += ways[0][size] * factorial(size)
+        self.count = total
+
+    def unrank(self, index: int) -> str:
+        i = bisect_right(self._size_offsets, index) - 1
+        index -= self._size_offsets[i]
+        remaining = self.sizes[i]
+        index, order = divmod(index, factorial(remaining))
+
+        parts = []
+        for j, option in enumerate(self.options):
+            if remaining == 0:
+                break
+            rest = self._ways[j + 1][remaining - 1]
+            with_option = option.count * rest
+            if index < with_option:
+                digit, index = divmod(index, rest)
+                parts.append(option.unrank(digit))
+                remaining -= 1
+            else:
+                index -= with_option
+
+        # 並べ方の番号（階乗進数）で並べ替える
+        ordered = []
+        for n in range(len(parts), 0, -1):
+            j, order = divmod(order, factorial(n - 1))
+            ordered.append(parts.pop(j))
+        return self.separator.join(ordered)
+
+
+class WildcardSpace:
+    """
+    テンプレートが生成し得るプロンプトの空間を扱うクラス。
+
+    - `count()` で展開番号の総数を計算します（数量子、`{n-m$$...}` の複数選択、ネストしたワイルドカードに対応）。
+    - `iter_all()` で全展開を決定的な順序でストリームします。
+    - `sample_unique(n, seed)` で重複のない n 個のランダムな展開をストリームします。
+
+    重み（`確率::値`）は抽選確率のみに影響するため、0 以外の重みを持つ候補はすべて1通りとして数えます。
+    複数選択は `WildcardProcessor` と同じく、選んだ候補の並び順を区別します。
+    同じ候補が重複している場合など、異なる番号が同じ文字列になることがあるため、
+    `iter_all()` と `sample_unique()` は文字列で重複を除きます（`count()` はその前の番号の総数です）。
+    異なる文字列が番号の総数に比べて極端に少ない場合も止まらないよう、どちらも調べる番号の数に上限があります。
+    """
+    MAX_DEPTH = 20
+    SAMPLE_DRAWS = 8 # sample_unique で結果1個あたりに抽選する番号の数の上限
+    MAX_DUPLICATE_RUN = 10000 # iter_all で同じ文字列がこの回数続いたら打ち切る
+
+    def __init__(self, template: str):
+        WildcardLoader.load()
+        self._templates: Dict[str, _Node] = {}
+        self._wildcards: Dict[str, Optional[_Node]] = {}
+        self.root = self._parse_template(WildcardLoader._remove_comments(template or ""), 0)
+
+    # --- Public API ---
+
+    def count(self) -> int:
+        """展開結果の組み合わせ総数を返します。"""
+        return self.root.count
+
+    def expand(self, index: int) -> str:
+        """`index` 番目（0 始まり）の展開結果を返します。"""
+        if not 0 <= index < self.root.count:
+            raise IndexError(f"index {index} out of range for {self.root.count} expansions")
+        return self.root.unrank(index)
+
+    def iter_all(self, start: int = 0) -> Iterator[str]:
+        """
+        `start` 番目から順に、全ての展開結果を決定的な順序で返します（同じ文字列は最初の1回のみ）。
+        同じ文字列が MAX_DUPLICATE_RUN 回続いた場合は、それ以降に新しい文字列がないものとして打ち切ります。
+        """
+        seen = set()
+        duplicates = 0
+        for index in range(max(0, start), self.root.count):
+            text = self.root.unrank(index)
+            if text in seen:
+                duplicates += 1
+                if duplicates >= self.MAX_DUPLICATE_RUN:
+                    return
+                continue
+            duplicates = 0
+            seen.add(text)
+            yield text
+
+    def sample_unique(self, n: int, seed: int) -> Iterator[str]:
+        """
+        重複のない n 個の展開結果をランダムに返します。
+        抽選する番号は n * SAMPLE_DRAWS 個までのため、異なる文字列が少ない場合は見つかった分だけを返します。
+        """
+        seen = set()
+        if n <= 0:
+            return
+        for index in self._random_indices(n * self.SAMPLE_DRAWS, seed):
+            text = self.root.unrank(index)
+            if text in seen:
+                continue
+            seen.add(text)
+            yield text
+            if len(seen) >= n:
+                return
+
+    def _random_indices(self, draws: int, seed: int) -> Iterator[int]:
+        """重複のない展開番号を最大 draws 個、ランダムな順序で返します。メモリ使用量は O(draws) です。"""
+        total = self.root.count
+        rng = random.Random(seed)
+
+        # 総数が抽選回数以下の場合は、全ての番号をシャッフルして返す
+        if total <= draws:
+            indices = list(range(total))
+            rng.shuffle(indices)
+            yield from indices
+            return
+
+        # それ以外は棄却法で、抽選回数の上限まで返す
+        seen = set()
+        for _ in range(draws):
+            index = rng.randrange(total)
+            if index not in seen:
+                seen.add(index)
+                yield index
+
+    # --- テンプレートの解析 ---
+
+    def _parse_template(self, text: str, depth: int) -> _Node:
+        """テンプレート文字列を解析します。同じ文字列の解析結果は共有します。"""
+        node = self._templates.get(text)
+        if node is not None:
+            return node
+
+        if depth > self.MAX_DEPTH:
+            node = _Literal(text)
+        else:
+            node = self._parse_sequence(WildcardLoader._handle_quantifiers(text), depth)
+        self._templates[text] = node
+        return node
+
+    def _parse_sequence(self, text: str, depth: int) -> _Node:
+        children: List[_Node] = []
+        literal: List[str] = []
+        pos = 0
+        length = len(text)
+
+        def flush():
+            if literal:
+                self._append_literal(children, "".join(literal))
+                literal.clear()
+
+        while pos < length:
+            char = text[pos]
+            if char == "\\" and pos + 1 < length:
+                literal.append(text[pos:pos + 2])
+                pos += 2
+            elif char == "{":
+                end = self._find_group_end(text, pos)
+                if end < 0:
+                    literal.append(char)
+                    pos += 1
+                    continue
+                flush()
+                children.append(self._parse_group(text[pos + 1:end], depth))
+                pos = end + 1
+            elif text.startswith("__", pos):
+                match = WildcardLoader.WILDCARD_RE.match(text, pos)
+                node = self._parse_wildcard(match.group(1), depth) if match else None
+                if node is None:
+                    literal.append(match.group(0) if match else char)
+                    pos = match.end() if match else pos + 1
+                    continue
+                flush()
+                children.append(node)
+                pos = match.end()
+            else:
+                literal.append(char)
+                pos += 1
+        flush()
+
+        if len(children) == 1:
+            return children[0]
+        return _Sequence(children)
+
+    @staticmethod
+    def _append_literal(children: List[_Node], text: str):
+        if children and isinstance(children[-1], _Literal):
+            children[-1] = _Literal(children[-1].text + text)
+        else:
+            children.append(_Literal(text))
+
+    @staticmethod
+    def _find_group_end(text: str, start: int) -> int:
+        """`{` に対応する `}` の位置を返します（エスケープとネストを考慮）。"""
+        depth = 0
+        pos = start
+        while pos < len(text):
+            char = text[pos]
+            if char == "\\":
+                pos += 2
+                continue
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    return pos
+            pos += 1
+        return -1
+
+    @staticmethod
+    def _split_options(content: str) -> List[str]:
+        """グループの中身をネストの外側の `|` で分割します。"""
+        options = []
+        depth = 0
+        current = []
+        pos = 0
+        while pos < len(content):
+            char = content[pos]
+            if char == "\\" and pos + 1 < len(content):
+                current.append(content[pos:pos + 2])
+                pos += 2
+                continue
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+            elif char == "|" and depth == 0:
+                options.append("".join(current))
+                current = []
+                pos += 1
+                continue
+            current.append(char)
+            pos += 1
+        options.append("".join(current))
+        return options
+
+    def _parse_group(self, content: str, depth: int) -> _Node:
+        """選択グループ `{...}` を解析します（`WildcardLoader._parse_option_group` と同じ規則）。"""
+        options = self._split_options(content)
+        select_range_str, separator, remaining_options_str = WildcardLoader._parse_multi_select_syntax(options[0])
+
+        wildcard_options = None
+        if select_range_str:
+            options = ([remaining_options_str] if remaining_options_str else []) + options[1:]
+            if len(options) == 1 and WildcardLoader.WILDCARD_RE.search(options[0]):
+                sampler = WildcardLoader._get_sampler_from_wildcard_str(options[0])
+                wildcard_options = sampler.selectable_options() if sampler else []
+
+        if wildcard_options is not None:
+            nodes = [self._parse_template(option, depth + 1) for option in wildcard_options]
+        else:
+            nodes = [self._parse_template(option, depth + 1) for option in self._clean_options(options)]
+
+        if not nodes:
+            return _Literal("")
+        if not select_range_str:
+            return _Choice(nodes)
+
+        low, high = self._select_range(select_range_str, len(nodes))
+        if low == high == 1:
+            return _Choice(nodes)
+        return _MultiSelect(nodes, separator, list(range(low, high + 1)))
+
+    def _parse_wildcard(self, keyword: str, depth: int) -> Optional[_Node]:
+        """`__keyword__` を候補の選択として解析します。解決できない場合は None を返します。"""
+        keyword = WildcardLoader._key_normalize(keyword)
+        if keyword in self._wildcards:
+            return self._wildcards[keyword]
+
+        sampler = WildcardLoader._resolve_wildcard(keyword)
+        node = None
+        if sampler:
+            # 再帰的な参照に備えて先にリテラルとして登録しておく
+            self._wildcards[keyword] = _Literal(f"__{keyword}__")
+            options = [self._parse_template(option, depth + 1) for option in sampler.selectable_options()]
+            node = _Choice(options) if options else None
+        self._wildcards[keyword] = node
+        return node
+
+    @staticmethod
+    def _clean_options(options: List[str]) -> List[str]:
+        weights, clean_options = WildcardLoader._parse_weights(options)
+        if sum(weights) <= 0:
+            return clean_options
+        return [option for option, weight in zip(clean_options, weights) if weight > 0]
+
+    @staticmethod
+    def _select_range(range_str: str, num_options: int) -> Tuple[int, int]:
+        """`WildcardLoader._determine_select_count` と同じ規則で選択数の範囲を返します。"""
+        min_val, max_val = 1, 1
+        range_match = re.match(r'(\d+)-(\d+)', range_str)
+        if range_match:
+            min_val = int(range_match.group(1))
+            max_val = int(range_match.group(2))
+        elif WildcardLoader._is_numeric(range_str):
+            min_val = max_val = int(float(range_str))
+
+        low = min(min_val, max_val)
+        high = min(max(min_val, max_val), num_options)
+        if low >= high:
+            return high, high
+        return low, high
@@ -1,12 +1,18 @@
+from __future__ import annotations
 import folder_paths
 from pathlib import Path
 import configparser
 import os
-import yaml
 from . import paths
-import numpy as np
 import re
-from typing import List, Dict, Tuple, Optional, Any
+import sys
+import threading
+from bisect import bisect_left
+from typing import List, Dict, Tuple, Optional, Any, Callable, Union, TYPE_CHECKING
+
+# numpy / yaml は実際に展開・読み込みを行うまでインポートしない
+if TYPE_CHECKING:
+    import numpy as np
 
 # -----------------------------------------------
 # 以下のフォルダからワイルドカードを取得する
@@ -46,14 +52,145 @@ def get_wildcard_dirs() -> List[str]:
     return [path for path in dirs if Path(path).exists()]
 
 
+class WeightedSampler:
+    """
+    `確率::値` 形式を解析済みの候補リストから、重みに従って O(1) で抽選するサンプラー。
+    Vose のエイリアス法でテーブルを事前計算するため、候補数に関係なく1回の抽選コストは一定です。
+    """
+    __slots__ = ("options", "_prob", "_alias", "_weights")
+
+    def __init__(self, options: Tuple[str, ...], weights: Optional[List[float]] = None):
+        self.options = options
+        self._prob: Optional[List[float]] = None
+        self._alias: Optional[List[int]] = None
+        self._weights: Optional[List[float]] = None
+
+        # 重みなし、全て同じ重み、もしくは重みの合計が0の場合は均等確率（テーブル不要）
+        if weights is None:
+            return
+        num_options = len(options)
+        total_weight = sum(weights)
+        if num_options == 0 or total_weight <= 0 or all(w == weights[0] for w in weights):
+            return
+
+        self._weights = weights
+        self._build_alias_table([w * num_options / total_weight for w in weights])
+
+    @classmethod
+    def from_options(cls, options: Tuple[str, ...]) -> "WeightedSampler":
+        """生の候補リストから `確率::値` を解析してサンプラーを作成します。"""
+        # `::` を含まない場合は候補をそのまま共有する（メモリ節約）
+        if not any("::" in option for option in options):
+            return cls(tuple(options))
+
+        probabilities, clean_options = WildcardLoader._parse_weights(options)
+        return cls(tuple(clean_options), probabilities)
+
+    def __len__(self) -> int:
+        return len(self.options)
+
+    def selectable_options(self) -> List[str]:
+        """候補のうち、抽選で選ばれ得るもの（重みが0でないもの）を返します。"""
+        if self._weights is None:
+            return list(self.options)
+        return [option for option, weight in zip(self.options, self._weights) if weight > 0]
+
+    def _build_alias_table(self, scaled: List[float]):
+        """スケール済みの確率（平均1）からエイリアステーブルを構築します。"""
+        num_options = len(scaled)
+        prob = [1.0] * num_options
+        alias = list(range(num_options))
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large[-1]
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(large.pop())
+        # 残りは浮動小数点誤差によるものなので確率1とする
+
+        self._prob = prob
+        self._alias = alias
+
+    def index(self, random_gen: np.random.Generator) -> int:
+        """重みに従って候補のインデックスを1つ抽選します。"""
+        u = random_gen.random() * len(self.options)
+        i = int(u)
+        if self._prob is None or u - i < self._prob[i]:
+            return i
+        return self._alias[i]
+
+    def sample(self, random_gen: np.random.Generator) -> str:
+        """重みに従って候補を1つ抽選します。"""
+        return self.options[self.index(random_gen)]
+
+    def sample_unique(self, random_gen: np.random.Generator, count: int) -> List[str]:
+        """重みに従って重複なしで `count` 個の候補を抽選します。"""
+        num_options = len(self.options)
+        if count <= 0:
+            return []
+        # 選択数より候補が少ない場合は、候補をシャッフルしてすべて使用
+        if count >= num_options:
+            return [self.options[i] for i in random_gen.permutation(num_options)]
+
+        if self._prob is None:
+            indices = random_gen.choice(num_options, size=count, replace=False)
+            return [self.options[i] for i in indices]
+
+        # 候補数に比べて少数の場合は棄却法（テーブルを使うので O(count)）
+        if count * 4 <= num_options:
+            selected = {}
+            for _ in range(count * 8):
+                selected.setdefault(self.index(random_gen), None)
+                if len(selected) == count:
+                    return [self.options[i] for i in selected]
+
+        # それ以外は Efraimidis-Spirakis 法で重み付き非復元抽出
+        keys = [
+            random_gen.random() ** (1.0 / w) if w > 0 else -1.0
+            for w in self._weights
+        ]
+        indices = sorted(range(num_options), key=keys.__getitem__, reverse=True)[:count]
+        return [self.options[i] for i in indices]
+
+
 class WildcardLoader:
     """
     テキスト内のワイルドカード（例: `__animal__`）や選択オプション（例: `{cat|dog}`）を
     解決・置換する機能を提供するクラス。
     """
     # --- クラス属性 & 定数 ---
-    _wildcards: Dict[str, List[str]] = {}
-    _dirs: List[str] = get_wildcard_dirs()
+    _wildcards: Dict[str, Tuple[str, ...]] = {}
+    _samplers: Dict[str, WeightedSampler] = {}
+    _dirs: Optional[List[str]] = None # 初回の読み込み時に取得
+
+    # 常駐ストア: ファイルごとの (mtime, size) と解析結果。変更のないファイルは再利用する
+    _loaded: bool = False
+    _generation: int = 0
+    _file_cache: Dict[str, Tuple[Tuple[int, int], List[Tuple[str, Tuple[str, ...], WeightedSampler, bool]]]] = {}
+    _lock = threading.RLock()
+
+    # ディレクトリ監視（ホットリロード）
+    WATCH_INTERVAL = 5.0
+    _watcher: Optional[threading.Thread] = None
+    _watch_stop = threading.Event()
+    _can_reload: Optional[Callable[[], bool]] = None
+    _reload_listeners: List[Callable[[], None]] = []
+
+    # 抽選時に再計算しないためのキャッシュ（ロード・アンロード時にクリア）
+    _pattern_cache: Dict[str, Optional[WeightedSampler]] = {}
+    _group_cache: Dict[str, Tuple[str, str, Optional[WeightedSampler]]] = {}
+    GROUP_CACHE_SIZE = 4096
+
+    # 逆引きインデックス: 正規化した候補 → その候補を含むキーの番号（1件なら int、複数なら tuple）
+    _value_keys: List[str] = []
+    _value_index: Dict[str, Union[int, Tuple[int, ...]]] = {}
+    _sorted_values: List[str] = []
+    PREFIX_SCAN_LIMIT = 1000 # 前方一致で走査する最大件数
 
     # 正規表現パターン
     QUANTIFIER_RE = re.compile(r"(?P<quantifier>\d+)#__(?P<keyword>[\w.\-+/*\\]+?)__", re.IGNORECASE)
@@ -66,26 +203,104 @@ class WildcardLoader:
     def load(cls, force: bool = False):
         """
         設定されたディレクトリからワイルドカードファイルを読み込みます。
+        読み込んだ内容は常駐し、以降の展開でディスクにアクセスすることはありません。
         
         Args:
             force (bool): Trueの場合、読み込み済みのキャッシュを破棄して再読み込みします。
         """
-        if force:
-            cls.unload()
+        with cls._lock:
+            if force:
+                cls.unload()
+            
+            if cls._loaded:
+                return
+
+            cls._rebuild()
+
+    @classmethod
+    def unload(cls):
+        """読み込み済みのワイルドカードをすべてクリアします。"""
+        with cls._lock:
+            cls._wildcards = {}
+            cls._samplers = {}
+            cls._file_cache = {}
+            cls._value_keys = []
+            cls._value_index = {}
+            cls._sorted_values = []
+            cls._loaded = False
+            cls._clear_caches()
+
+    @classmethod
+    def reload_if_changed(cls) -> bool:
+        """
+        ソースディレクトリに変更があった場合のみ、変更されたファイルを読み直します。
+        
+        Returns:
+            bool: 再読み込みを行った場合はTrue。
+        """
+        with cls._lock:
+            if not cls._loaded:
+                return False
+            if cls._scan_signatures() == {path: entry[0] for path, entry in cls._file_cache.items()}:
+                return False
+
+            cls._rebuild()
+        
+        for listener in list(cls._reload_listeners):
+            try:
+                listener()
+            except Exception as e:
+                print(f"Wildcard reload listener failed: {e}")
+        return True
+
+    @classmethod
+    def add_reload_listener(cls, listener: Callable[[], None]):
+        """ホットリロード後に呼び出されるコールバックを登録します。"""
+        if listener not in cls._reload_listeners:
+            cls._reload_listeners.append(listener)
+
+    @classmethod
+    def start_watcher(cls, can_reload: Optional[Callable[[], bool]] = None):
+        """
+        ソースディレクトリを監視するバックグラウンドスレッドを開始します。
         
-        if cls._wildcards:
+        Args:
+            can_reload: 再読み込みしてよいかを返す関数。キューの実行中は False を返すことで、
+                バッチ実行の途中でストアが入れ替わるのを防ぎます。
+        """
+        cls._can_reload = can_reload
+        if cls._watcher and cls._watcher.is_alive():
             return
 
-        for path_str in cls._dirs:
+        cls._watch_stop.clear()
+        cls._watcher = threading.Thread(target=cls._watch_loop, name="WildcardWatcher", daemon=True)
+        cls._watcher.start()
+
+    @classmethod
+    def stop_watcher(cls):
+        """ディレクトリ監視を停止します。"""
+        cls._watch_stop.set()
+        cls._watcher = None
+
+    @classmethod
+    def get_generation(cls) -> int:
+        """ストアの世代番号（再読み込みのたびに増加）を返します。"""
+        return cls._generation
+
+    @classmethod
+    def _watch_loop(cls):
+        while not cls._watch_stop.wait(cls.WATCH_INTERVAL):
             try:
-                cls._load_wildcards_from_directory(Path(path_str))
+                if cls._can_reload is not None and not cls._can_reload():
+                    continue
+                cls.reload_if_changed()
             except Exception as e:
-                print(f"Failed to load wildcards from {path_str}: {e}")
+                print(f"Failed to watch wildcards: {e}")
 
     @classmethod
-    def unload(cls):
-        """読み込み済みのワイルドカードをすべてクリアします。"""
-        cls._wildcards = {}
+    def _clear_caches(cls):
+        cls._pattern_cache = {}
+        cls._group_cache = {}
     
     @classmethod
     def get_wildcards_list(cls) -> List[str]:
@@ -93,10 +308,77 @@ class WildcardLoader:
         return [f"__{key}__" for key in cls._wildcards.keys()]
     
     @classmethod
-    def get_wildcards_dict(cls) -> Dict[str, List[str]]:
+    def get_wildcards_dict(cls) -> Dict[str, Tuple[str, ...]]:
         """ワイルドカードの辞書（キー: 名前, 値: 候補リスト）を返します。"""
         return cls._wildcards
 
+    @classmethod
+    def get_wildcard_values(cls, key: str, offset: int = 0, limit: int = 100) -> Tuple[List[str], int]:
+        """
+        ワイルドカードの候補をページ単位で返します。
+        
+        Args:
+            key (str): ワイルドカード名（`__name__` 形式でも可）。
+            offset (int): 取得開始位置。
+            limit (int): 取得する最大件数。
+            
+        Returns:
+            (候補のリスト, 全候補数)
+        """
+        if key.startswith("__") and key.endswith("__") and len(key) > 4:
+            key = key[2:-2]
+        values = cls._wildcards.get(cls._key_normalize(key), ())
+        
+        offset = max(0, offset)
+        limit = max(0, limit)
+        return list(values[offset:offset + limit]), len(values)
+
+    @classmethod
+    def find_keys_by_value(cls, value: str, limit: int = 50, prefix: bool = True) -> List[Tuple[str, str]]:
+        """
+        指定した値を候補に含むワイルドカードを逆引きします。
+        
+        Args:
+            value (str): 検索する値（`silver hair` / `silver_hair` どちらでも可）。
+            limit (int): 返す最大件数。
+            prefix (bool): Trueの場合、完全一致に続けて前方一致する候補も返します。
+            
+        Returns:
+            (ワイルドカード名, 一致した正規化済みの値) のリスト。完全一致が先頭になります。
+        """
+        value = cls._value_normalize(value)
+        if not value or limit <= 0:
+            return []
+
+        index = cls._value_index
+        value_keys = cls._value_keys
+        results = []
+        seen = set()
+
+        def collect(matched: str):
+            key_ids = index[matched]
+            for key_id in ((key_ids, ) if isinstance(key_ids, int) else key_ids):
+                if key_id not in seen:
+                    seen.add(key_id)
+                    results.append((value_keys[key_id], matched))
+
+        if value in index:
+            collect(value)
+
+        if prefix:
+            sorted_values = cls._sorted_values
+            pos = bisect_left(sorted_values, value)
+            end = min(len(sorted_values), pos + cls.PREFIX_SCAN_LIMIT)
+            while pos < end and len(results) < limit:
+                matched = sorted_values[pos]
+                if not matched.startswith(value):
+                    break
+                if matched != value:
+                    collect(matched)
+                pos += 1
+
+        return results[:limit]
+
     @classmethod
     def process(cls, text: str, seed: int) -> str:
         """
@@ -112,6 +394,8 @@ class WildcardLoader:
         if not text:
             return ""
 
+        import numpy as np
+
         text = cls._remove_comments(text)
         random_gen = np.random.default_rng(seed)
         
@@ -138,41 +422,142 @@ class WildcardLoader:
     # --- ファイル読み込み関連のメソッド ---
 
     @classmethod
-    def _load_wildcards_from_directory(cls, dir_path: Path):
-        """指定されたディレクトリからワイルドカードファイルを再帰的に読み込みます。"""
-        for root, _, files in os.walk(dir_path, followlinks=True):
-            root_path = Path(root)
-            for file in files:
-                file_path = root_path / file
-                
-                if file_path.suffix == ".txt":
-                    key = cls._key_normalize(file_path.stem)
-                    rel_path = file_path.relative_to(dir_path)
-                    key = cls._key_normalize(str(rel_path.with_suffix('')))
-                    
-                    if key not in cls._wildcards:
-                        lines = cls._read_text_file(file_path)
-                        # コメント行（#で始まる行）を除外
-                        cls._wildcards[key] = [line for line in lines if not line.strip().startswith("#")]
-
-                elif file_path.suffix in [".yml", ".yaml"]:
-                    yaml_data = cls._read_yaml_file(file_path)
-                    if yaml_data:
-                        cls._parse_yaml_data(yaml_data)
-
-    @classmethod
-    def _parse_yaml_data(cls, data: Any, prefix: str = ""):
-        """YAMLファイルから読み込んだデータを再帰的に処理し、ワイルドカード辞書に登録します。"""
+    def _rebuild(cls):
+        """
+        全ディレクトリを走査してストアを再構築します。
+        (mtime, size) が変わっていないファイルは前回の解析結果とサンプラーを再利用します。
+        """
+        wildcards: Dict[str, Tuple[str, ...]] = {}
+        samplers: Dict[str, WeightedSampler] = {}
+        file_cache = {}
+
+        for file_path, dir_path, signature in cls._iter_wildcard_files():
+            cached = cls._file_cache.get(str(file_path))
+            if cached and cached[0] == signature:
+                entries = cached[1]
+            else:
+                entries = cls._parse_wildcard_file(file_path, dir_path)
+            file_cache[str(file_path)] = (signature, entries)
+
+            # txt は先に登録されたものを優先、yaml は上書き
+            for key, lines, sampler, overwrite in entries:
+                if overwrite or key not in wildcards:
+                    wildcards[key] = lines
+                    samplers[key] = sampler
+
+        cls._wildcards = wildcards
+        cls._samplers = samplers
+        cls._file_cache = file_cache
+        cls._build_value_index()
+        cls._loaded = True
+        cls._generation += 1
+        cls._clear_caches()
+
+    @classmethod
+    def _build_value_index(cls):
+        """
+        候補（行、およびカンマ区切りの各要素）からキーへの逆引きインデックスを構築します。
+        完全一致は辞書、前方一致はソート済みリストの二分探索で引きます。
+        """
+        value_keys = list(cls._wildcards.keys())
+        index: Dict[str, Union[int, Tuple[int, ...]]] = {}
+
+        for key_id, key in enumerate(value_keys):
+            for option in cls._samplers[key].options:
+                values = {cls._value_normalize(option)}
+                if "," in option:
+                    values.update(cls._value_normalize(part) for part in option.split(","))
+
+                for value in values:
+                    if not value:
+                        continue
+                    current = index.get(value)
+                    if current is None:
+                        index[value] = key_id
+                    elif isinstance(current, int):
+                        if current != key_id:
+                            index[value] = (current, key_id)
+                    elif current[-1] != key_id:
+                        index[value] = current + (key_id, )
+
+        cls._value_keys = value_keys
+        cls._value_index = index
+        cls._sorted_values = sorted(index)
+
+    @classmethod
+    def _get_dirs(cls) -> List[str]:
+        """ワイルドカードのディレクトリ（初回のみファイルシステムと設定ファイルを調べる）を返します。"""
+        if cls._dirs is None:
+            cls._dirs = get_wildcard_dirs()
+        return cls._dirs
+
+    @classmethod
+    def _iter_wildcard_files(cls):
+        """(ファイルパス, 基準ディレクトリ, (mtime, size)) を順に返します。"""
+        for path_str in cls._get_dirs():
+            dir_path = Path(path_str)
+            try:
+                for root, _, files in os.walk(dir_path, followlinks=True):
+                    root_path = Path(root)
+                    for file in files:
+                        file_path = root_path / file
+                        if file_path.suffix not in (".txt", ".yml", ".yaml"):
+                            continue
+                        try:
+                            stat = file_path.stat()
+                        except OSError:
+                            continue
+                        yield file_path, dir_path, (stat.st_mtime_ns, stat.st_size)
+            except Exception as e:
+                print(f"Failed to load wildcards from {path_str}: {e}")
+
+    @classmethod
+    def _scan_signatures(cls) -> Dict[str, Tuple[int, int]]:
+        """ディスク上のワイルドカードファイルの (mtime, size) を取得します。"""
+        return {str(file_path): signature for file_path, _, signature in cls._iter_wildcard_files()}
+
+    @classmethod
+    def _parse_wildcard_file(cls, file_path: Path, dir_path: Path):
+        """
+        ワイルドカードファイルを解析し、(キー, 候補, サンプラー, 上書きするか) のリストを返します。
+        キーの優先順位は結合時に決めるため、ここでは常にファイル全体を解析します。
+        """
+        entries = []
+
+        if file_path.suffix == ".txt":
+            rel_path = file_path.relative_to(dir_path)
+            key = cls._key_normalize(str(rel_path.with_suffix('')))
+            
+            lines = cls._read_text_file(file_path)
+            # コメント行（#で始まる行）を除外
+            entries.append(cls._make_entry(key, [line for line in lines if not line.strip().startswith("#")], False))
+
+        else:
+            yaml_data = cls._read_yaml_file(file_path)
+            if yaml_data:
+                cls._parse_yaml_data(yaml_data, entries)
+
+        return entries
+
+    @classmethod
+    def _make_entry(cls, key: str, lines: List[str], overwrite: bool):
+        # 同じ文字列はインターンして共有し、候補はタプルで保持する（メモリ節約）
+        lines = tuple(sys.intern(line) for line in lines)
+        return (key, lines, WeightedSampler.from_options(lines), overwrite)
+
+    @classmethod
+    def _parse_yaml_data(cls, data: Any, entries: List, prefix: str = ""):
+        """YAMLファイルから読み込んだデータを再帰的に処理し、エントリのリストに追加します。"""
         if isinstance(data, dict):
             for key, value in data.items():
                 new_prefix = f"{prefix}/{key}" if prefix else key
-                cls._parse_yaml_data(value, new_prefix)
+                cls._parse_yaml_data(value, entries, new_prefix)
         elif isinstance(data, list):
             normalized_key = cls._key_normalize(prefix)
-            cls._wildcards[normalized_key] = [str(item) for item in data]
+            entries.append(cls._make_entry(normalized_key, [str(item) for item in data], True))
         elif isinstance(data, (str, int, float)):
             normalized_key = cls._key_normalize(prefix)
-            cls._wildcards[normalized_key] = [str(data)]
+            entries.append(cls._make_entry(normalized_key, [str(data)], True))
 
     @staticmethod
     def _read_text_file(file_path: Path) -> List[str]:
@@ -187,6 +572,8 @@ class WildcardLoader:
     @staticmethod
     def _read_yaml_file(file_path: Path) -> Optional[Dict]:
         """YAMLファイルを読み込み、辞書として返します。エンコーディングフォールバックにも対応します。"""
+        import yaml
+
         try:
             with open(file_path, "r", encoding="utf-8") as f:
                 return yaml.safe_load(f)
@@ -240,75 +627,108 @@ class WildcardLoader:
             wildcard_str = match.group(0) # `__keyword__`
             keyword = cls._key_normalize(match.group(1)) # `keyword`
             
-            options = []
-            
-            # 1. 通常のワイルドカード
-            if keyword in cls._wildcards:
-                options = cls._wildcards[keyword]
-            # 2. Globパターン (`*`) を含むワイルドカード
-            elif '*' in keyword:
-                try:
-                    glob_re = re.compile(keyword.replace('*', '.*').replace('+', r'\+'))
-                    for k, v in cls._wildcards.items():
-                        if glob_re.fullmatch(k):
-                            options.extend(v)
-                except re.error:
-                    pass # 無効な正規表現パターンは無視
-            # 3. フォールバック (`/` がない場合、 `*/keyword` として再検索)
-            elif '/' not in keyword:
-                fallback_wildcard = f"__*/{keyword}__"
-                # `text` 全体を渡すのではなく、現在のワイルドカード部分のみを再帰的に処理
-                replacement = cls._replace_all_wildcards(fallback_wildcard, random_gen)
-                text = text.replace(wildcard_str, replacement, 1)
-                continue
-
-            if options:
-                # 確率をパースして選択
-                probabilities, clean_options = cls._parse_probabilities(options)
-                selected_item = random_gen.choice(clean_options, p=probabilities)
+            sampler = cls._resolve_wildcard(keyword)
+            if sampler:
+                selected_item = sampler.sample(random_gen)
                 text = text.replace(wildcard_str, str(selected_item), 1)
 
         return text
 
+    @classmethod
+    def _resolve_wildcard(cls, keyword: str) -> Optional[WeightedSampler]:
+        """
+        正規化済みのキーワードから、抽選に使うサンプラーを取得します。
+        
+        1. 通常のワイルドカード
+        2. Globパターン (`*`) を含むワイルドカード（該当する全候補を結合）
+        3. フォールバック (`/` がない場合、 `*/keyword` として再検索)
+        """
+        # 1. 通常のワイルドカード
+        sampler = cls._samplers.get(keyword)
+        if sampler is not None:
+            return sampler if len(sampler) else None
+
+        if keyword in cls._pattern_cache:
+            return cls._pattern_cache[keyword]
+
+        sampler = None
+        # 2. Globパターン
+        if '*' in keyword:
+            options = cls._glob_options(keyword)
+            if options:
+                sampler = WeightedSampler.from_options(options)
+        # 3. フォールバック
+        elif '/' not in keyword:
+            sampler = cls._resolve_wildcard(f"*/{keyword}")
+
+        cls._pattern_cache[keyword] = sampler
+        return sampler
+
+    @classmethod
+    def _glob_options(cls, keyword: str) -> List[str]:
+        """Globパターンに一致する全ワイルドカードの候補（未解析）を結合して返します。"""
+        options = []
+        try:
+            glob_re = re.compile(keyword.replace('*', '.*').replace('+', r'\+'))
+            for k, v in cls._wildcards.items():
+                if glob_re.fullmatch(k):
+                    options.extend(v)
+        except re.error:
+            pass # 無効な正規表現パターンは無視
+        return options
+
     @classmethod
     def _process_option_group(cls, match: re.Match, random_gen: np.random.Generator) -> str:
         """単一の選択グループ `{...}` を処理します。"""
-        content = match.group(1)
+        select_range_str, separator, sampler = cls._parse_option_group(match.group(1))
+        
+        if not sampler:
+            return ""
+
+        # 選択数の決定
+        select_count = cls._determine_select_count(select_range_str, len(sampler), random_gen)
+
+        # 置換アイテムの選択
+        if select_count == 1:
+            return str(sampler.sample(random_gen))
+        
+        selected_items = sampler.sample_unique(random_gen, select_count)
+        return separator.join(map(str, selected_items))
+
+    @classmethod
+    def _parse_option_group(cls, content: str) -> Tuple[str, str, Optional[WeightedSampler]]:
+        """
+        選択グループ `{...}` の中身を解析します。解析結果はテンプレートごとにキャッシュされます。
+        
+        Returns:
+            (範囲文字列, 区切り文字, 候補のサンプラー)
+        """
+        cached = cls._group_cache.get(content)
+        if cached is not None:
+            return cached
+
         options = content.split('|')
         
         # 複数選択構文（例: `2-4$$__colors__`）の解析
         select_range_str, separator, remaining_options_str = cls._parse_multi_select_syntax(options[0])
         
+        sampler = None
         if select_range_str:
-            # 範囲指定がある場合は、オプションを再構築
-            options = remaining_options_str.split('|') if remaining_options_str else []
+            # 範囲指定がある場合は、オプションを再構築（`$$` 以降の部分と残りの候補）
+            # 以前は `$$` 以降の部分だけを分割していたため、`{2$$a|b|c}` の b・c が候補から抜けていた
+            options = ([remaining_options_str] if remaining_options_str else []) + options[1:]
             # オプションがワイルドカード形式の場合、展開する
             if len(options) == 1 and cls.WILDCARD_RE.search(options[0]):
-                options = cls._get_options_from_wildcard_str(options[0])
-        
-        if not options:
-            return ""
-
-        # 選択数の決定
-        select_count = cls._determine_select_count(select_range_str, len(options), random_gen)
+                sampler = cls._get_sampler_from_wildcard_str(options[0])
+                options = []
         
-        # 確率の解析
-        probabilities, clean_options = cls._parse_probabilities(options)
+        if options:
+            sampler = WeightedSampler.from_options(options)
 
-        # 置換アイテムの選択
-        if select_count > len(clean_options):
-             # 選択数より候補が少ない場合は、候補をシャッフルしてすべて使用
-            random_gen.shuffle(clean_options)
-            selected_items = clean_options
-        else:
-            selected_items = random_gen.choice(
-                clean_options, 
-                size=select_count, 
-                replace=False, 
-                p=probabilities
-            )
-        
-        return separator.join(map(str, selected_items))
+        if len(cls._group_cache) >= cls.GROUP_CACHE_SIZE:
+            cls._group_cache.clear()
+        cls._group_cache[content] = (select_range_str, separator, sampler)
+        return cls._group_cache[content]
 
     # --- ユーティリティ & ヘルパーメソッド ---
 
@@ -317,20 +737,29 @@ class WildcardLoader:
         """ワイルドカードのキーを正規化します（小文字化、バックスラッシュをスラッシュに、スペースをハイフンに）。"""
         return text.replace("\\", "/").replace(" ", "-").lower()
         
+    @classmethod
+    def _value_normalize(cls, text: str) -> str:
+        """逆引き用に候補を正規化します（重みの除去、小文字化、スペースをアンダーバーに）。"""
+        parts = text.split("::", 1)
+        if len(parts) == 2 and cls._is_numeric(parts[0].strip()):
+            text = parts[1]
+        return text.strip().lower().replace(" ", "_")
+
     @staticmethod
     def _is_numeric(text: str) -> bool:
         """文字列が数値（整数または浮動小数点数）かどうかを判定します。"""
         return re.match(r'^-?(\d*\.?\d+|\d+\.?\d*)$', text) is not None
 
     @classmethod
-    def _parse_probabilities(cls, options: List[str]) -> Tuple[List[float], List[str]]:
+    def _parse_weights(cls, options: List[str]) -> Tuple[List[float], List[str]]:
         """
         オプションリストから `確率::値` 形式を解析します。
+        重みの正規化は `WeightedSampler` がテーブル構築時に行います。
         
         Returns:
-            (正規化された確率のリスト, 確率部分を取り除いた値のリスト)
+            (重みのリスト, 確率部分を取り除いた値のリスト)
         """
-        probabilities = []
+        weights = []
         clean_options = []
         
         for option in options:
@@ -344,18 +773,10 @@ class WildcardLoader:
                 weight = float(parts[0].strip())
                 value = parts[1]
             
-            probabilities.append(weight)
+            weights.append(weight)
             clean_options.append(value)
             
-        total_weight = sum(probabilities)
-        if total_weight == 0:
-            # 全ての重みが0の場合は均等確率にする
-            num_options = len(options)
-            normalized_probs = [1.0 / num_options] * num_options if num_options > 0 else []
-        else:
-            normalized_probs = [w / total_weight for w in probabilities]
-            
-        return normalized_probs, clean_options
+        return weights, clean_options
 
     @staticmethod
     def _parse_multi_select_syntax(option_str: str) -> Tuple[str, str, str]:
@@ -395,24 +816,31 @@ class WildcardLoader:
         return random_gen.integers(low, high + 1)
 
     @classmethod
-    def _get_options_from_wildcard_str(cls, wildcard_str: str) -> List[str]:
-        """`__*color__`のような文字列からワイルドカードを展開して候補リストを返します。"""
-        options = []
+    def _get_sampler_from_wildcard_str(cls, wildcard_str: str) -> Optional[WeightedSampler]:
+        """`__*color__`のような文字列からワイルドカードを展開して候補のサンプラーを返します。"""
+        cache_key = f"$${wildcard_str}"
+        if cache_key in cls._pattern_cache:
+            return cls._pattern_cache[cache_key]
+
         matches = cls.WILDCARD_RE.findall(wildcard_str)
-        
+        samplers = []
+        options = []
         for match in matches:
             keyword = cls._key_normalize(match)
             if keyword in cls._wildcards:
+                samplers.append(cls._samplers[keyword])
                 options.extend(cls._wildcards[keyword])
             elif '*' in keyword:
-                try:
-                    glob_re = re.compile(keyword.replace('*', '.*').replace('+', r'\+'))
-                    for k, v in cls._wildcards.items():
-                        if glob_re.fullmatch(k):
-                            options.extend(v)
-                except re.error:
-                    pass
-        return options
+                options.extend(cls._glob_options(keyword))
+
+        if len(samplers) == 1 and len(options) == len(samplers[0]):
+            # 単一のワイルドカードの場合は事前計算済みのサンプラーをそのまま使う
+            sampler = samplers[0]
+        else:
+            sampler = WeightedSampler.from_options(options) if options else None
+
+        cls._pattern_cache[cache_key] = sampler
+        return sampler
 
     @staticmethod
     def _remove_comments(text: str) -> str:
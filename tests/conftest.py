@@ -0,0 +1,101 @@
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+# -----------------------------------------------
+# テスト用の読み込み設定
+#   拡張機能のモジュールは ComfyUI の custom_nodes から読み込まれる前提のため、
+#   py フォルダを ex_tagcomplete パッケージとして読み込めるようにする（pytest の py モジュールと名前が重なるため別名にする）。
+#   ComfyUI の外で実行する場合は、インポート時に参照される server / comfy / folder_paths の最小限の代替を用意する。
+# -----------------------------------------------
+
+PY_DIR = Path(__file__).resolve().parent.parent / "py"
+PACKAGE = "ex_tagcomplete"
+
+
+def _install_comfy_placeholders():
+    try:
+        import server  # noqa: F401
+        return
+    except ImportError:
+        pass
+
+    class _Routes:
+        def get(self, path):
+            return lambda func: func
+
+        def post(self, path):
+            return lambda func: func
+
+    class _Loop:
+        def call_soon_threadsafe(self, callback, *args):
+            pass
+
+        def run_in_executor(self, executor, func, *args):
+            pass
+
+    class _PromptServer:
+        # ルートの __init__.py から endpoints も読み込まれるため、起動時の処理は何もしない
+        instance = types.SimpleNamespace(routes=_Routes(), prompt_queue=None, loop=_Loop())
+
+    server = types.ModuleType("server")
+    server.PromptServer = _PromptServer
+    comfy = types.ModuleType("comfy")
+    comfy_types = types.ModuleType("comfy.comfy_types")
+    comfy_types.IO = types.SimpleNamespace(STRING="STRING", INT="INT", IMAGE="IMAGE", MASK="MASK")
+    comfy.comfy_types = comfy_types
+    folder_paths = types.ModuleType("folder_paths")
+    folder_paths.get_folder_paths = lambda name: []
+    folder_paths.get_filename_list = lambda name: []
+    folder_paths.get_full_path = lambda name, filename: None
+    sys.modules.update({
+        "server": server,
+        "comfy": comfy,
+        "comfy.comfy_types": comfy_types,
+        "folder_paths": folder_paths,
+    })
+
+
+def _install_package():
+    if PACKAGE in sys.modules:
+        return
+    _install_comfy_placeholders()
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [str(PY_DIR)]
+    sys.modules[PACKAGE] = package
+
+
+_install_package()
+
+
+# -----------------------------------------------
+# フィクスチャ
+# -----------------------------------------------
+@pytest.fixture
+def data_paths(tmp_path, monkeypatch):
+    """学習データと退避ファイルの保存先を一時フォルダにする。"""
+    from ex_tagcomplete import paths
+    for name in ("selection_path", "usage_path", "cooccurrence_path", "lora_metadata_path", "index_snapshot_path", "index_short_queries_path"):
+        monkeypatch.setattr(paths, name, tmp_path / getattr(paths, name).name)
+    return tmp_path
+
+
+@pytest.fixture
+def manager(data_paths, monkeypatch):
+    """空の状態の TagDataManager（使用回数による並び順の調整なし）。"""
+    from ex_tagcomplete.tagdata_manager import TagDataManager as manager
+    monkeypatch.setattr(manager, "enable", True)
+    monkeypatch.setattr(manager, "max_count", 50)
+    monkeypatch.setattr(manager, "restrictAlias", False)
+    monkeypatch.setattr(manager, "search_check_interval", 10)
+    monkeypatch.setattr(manager, "_usage_boosts", {})
+    monkeypatch.setattr(manager, "usage_boosts", classmethod(lambda cls: {}))
+    monkeypatch.setattr(manager, "_live", {})
+    monkeypatch.setattr(manager, "_sources", {})
+    monkeypatch.setattr(manager, "_short_queries", {})
+    monkeypatch.setattr(manager, "_short_queries_dirty", set())
+    monkeypatch.setattr(manager, "_short_queries_dropped", set())
+    yield manager
+    manager.close()
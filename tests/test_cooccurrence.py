@@ -0,0 +1,57 @@
+import pytest
+
+from ex_tagcomplete.cooccurrence import CooccurrenceIndex, prompt_tags
+
+
+@pytest.fixture
+def index(data_paths, monkeypatch):
+    """学習データのない CooccurrenceIndex。"""
+    monkeypatch.setattr(CooccurrenceIndex, "_counts", {})
+    monkeypatch.setattr(CooccurrenceIndex, "_pairs", {})
+    monkeypatch.setattr(CooccurrenceIndex, "_neighbours", {})
+    monkeypatch.setattr(CooccurrenceIndex, "_stale", set())
+    monkeypatch.setattr(CooccurrenceIndex, "_recent", type(CooccurrenceIndex._recent)(maxlen=CooccurrenceIndex.RECENT_PROMPTS))
+    monkeypatch.setattr(CooccurrenceIndex, "_loaded", False)
+    monkeypatch.setattr(CooccurrenceIndex, "_dirty", False)
+    return CooccurrenceIndex
+
+
+def test_prompt_tags_strips_weights_and_keeps_escaped_brackets():
+    assert prompt_tags("1girl, (Long Hair:1.2), [smile], nahida \\(genshin impact\\)") == [
+        "1girl", "long_hair", "smile", "nahida_(genshin_impact)",
+    ]
+
+
+def test_suggest_reflects_learned_prompts_before_flush(index):
+    index.learn(["1girl", "long_hair", "smile"])
+    index.learn(["1girl", "long_hair", "blue_eyes"])
+    index.learn(["1girl", "short_hair"])
+
+    # 書き出しを待たずに、学習したタグの確率（同時に出現した回数 / タグの出現回数）の合計で並ぶ
+    suggestions = index.suggest(["1girl"], limit=10)
+    assert suggestions[0] == ("long_hair", pytest.approx(2 / 3))
+    assert {tag for tag, _ in suggestions} == {"long_hair", "smile", "blue_eyes", "short_hair"}
+
+    scores = dict(index.suggest(["1girl", "long_hair"], limit=10))
+    assert scores["smile"] == pytest.approx(1 / 3 + 1 / 2)
+    assert "1girl" not in scores and "long_hair" not in scores
+
+
+def test_suggest_skips_excluded_tags_and_repeated_prompts(index):
+    for _ in range(3):
+        index.learn(["1girl", "smile"])
+    index.learn(["1girl", "solo"])
+
+    assert index.suggest(["1girl"], limit=10, exclude={"smile"}) == [("solo", pytest.approx(1 / 2))]
+    assert index.suggest(["1girl"], limit=1) == [("smile", pytest.approx(1 / 2))]
+
+
+def test_flush_keeps_suggestions_after_reload(index):
+    index.learn(["1girl", "smile"])
+    index.flush()
+
+    index._counts = {}
+    index._pairs = {}
+    index._neighbours = {}
+    index._loaded = False
+    assert index.suggest(["1girl"], limit=10) == [("smile", pytest.approx(1.0))]
@@ -0,0 +1,89 @@
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from ex_tagcomplete.short_queries import ShortQueryTable, load_tables, query_code, save_tables
+
+LETTERS = "abcde_"
+KANA = "ねこいぬみ"
+CATEGORIES = ("General", "Character", "Artist")
+
+
+# -----------------------------------------------
+# 上位候補表と SQL の検索の比較
+# -----------------------------------------------
+@pytest.fixture
+def loaded(manager, monkeypatch):
+    """表の大きさ（page_size）に比べて一致する行の多いタグを読み込んだ状態。"""
+    monkeypatch.setattr(manager, "page_size", 10)
+    monkeypatch.setattr(manager, "max_count", 10)
+    random.seed(0)
+    rows = [
+        {
+            "term": "".join(random.choices(LETTERS, k=random.randint(2, 6))) + f"_{i}",
+            "postCount": str(random.randint(0, 1000)) if i % 10 else "",
+            "categoryName": random.choice(CATEGORIES),
+            "translate": "".join(random.choices(KANA, k=3)) if i % 3 == 0 else None,
+            "aliases": ["".join(random.choices(LETTERS, k=4))] if i % 4 == 0 else [],
+        }
+        for i in range(1500)
+    ]
+    with manager.writing():
+        manager.open_writer()
+        manager.replace_sources("main", ["test"], [("main:test.csv", rows)])
+    return manager
+
+
+def queries():
+    return [a + b for a in LETTERS for b in LETTERS] + list(KANA) + [a + b for a in KANA for b in KANA[:2]]
+
+
+def assert_same_as_sql(manager, monkeypatch):
+    snapshot = manager._snapshot
+    assert snapshot.short_queries
+    for category in (None, ["general"], ["character", "artist"]):
+        with_table = {term: manager.search(term, category) for term in queries()}
+        with monkeypatch.context() as context:
+            context.setattr(snapshot, "short_queries", {})
+            for term, results in with_table.items():
+                assert results == manager.search(term, category), (term, category)
+
+
+def test_table_matches_sql(loaded, monkeypatch):
+    assert_same_as_sql(loaded, monkeypatch)
+
+
+def test_table_matches_sql_after_usage_changes(loaded, monkeypatch):
+    terms = [row[0] for row in loaded._snapshot._owner.execute("SELECT term FROM tags WHERE rank >= 0 ORDER BY id")]
+    boosts = {term: 10000 for term in terms[::7]}
+    monkeypatch.setattr(loaded, "usage_boosts", classmethod(lambda cls: dict(boosts)))
+    loaded.apply_usage()
+    table = loaded._short_queries[loaded.source_ids()[0]]
+    assert not table.excluded and len(table.boosted.tag_ids) == len(boosts)
+    assert_same_as_sql(loaded, monkeypatch)
+
+    # 使用回数が減ったタグと、新たに増えたタグ（上位の表は作り直さない）
+    for term in terms[::14]:
+        del boosts[term]
+    boosts.update({term: 1000000 for term in terms[3::50]})
+    loaded.apply_usage()
+    assert loaded._short_queries[loaded.source_ids()[0]].tags is table.tags
+    assert_same_as_sql(loaded, monkeypatch)
+
+
+def test_saved_tables_keep_usage_part(loaded, monkeypatch, tmp_path):
+    terms = [row[0] for row in loaded._snapshot._owner.execute("SELECT term FROM tags WHERE rank >= 0 ORDER BY id")]
+    monkeypatch.setattr(loaded, "_usage_boosts", {term: 10000 for term in terms[::5]})
+    source_id = loaded.source_ids()[0]
+    table = ShortQueryTable.build(loaded._snapshot._owner, source_id, loaded.page_size, loaded._usage_boosts.keys())
+
+    save_tables(tmp_path / "tables.npz", {source_id: table})
+    restored = load_tables(tmp_path / "tables.npz")[source_id]
+    assert restored.excluded == table.excluded
+    for term in queries():
+        code = query_code(term)
+        for category in ([], ["general"]):
+            assert sorted(restored.find_tags(code, None, category)) == sorted(table.find_tags(code, None, category))
+            assert sorted(restored.find_aliases(code, category)) == sorted(table.find_aliases(code, category))
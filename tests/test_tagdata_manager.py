@@ -0,0 +1,125 @@
+import threading
+
+import pytest
+
+from ex_tagcomplete.utils import RequestCancel, SearchCancelled
+
+
+# -----------------------------------------------
+# 世代（スナップショット）の公開
+# -----------------------------------------------
+def publish_generation(manager, generation: int, size: int = 2000):
+    # 同じソースを、タグ名とエイリアスに世代の番号を付けたデータで置き換えて公開する
+    with manager.writing():
+        manager.open_writer()
+        rows = (
+            {"term": f"gen{generation}_tag_{i}", "postCount": str(i), "aliases": [f"gen{generation}_tagalias_{i}"]}
+            for i in range(size)
+        )
+        manager.replace_sources("main", [f"test-{generation}"], [("main:test.csv", rows)])
+
+
+def test_searches_during_reload_see_one_generation(manager):
+    publish_generation(manager, 0)
+
+    stop = threading.Event()
+    errors = []
+    searches = []
+    seen = set()
+
+    def reader():
+        while not stop.is_set():
+            # 1〜2文字の上位候補表と、SQL の走査の両方を使う
+            for term in ("tag", "ag"):
+                results = manager.search(term)
+                generations = {result["term"].split("_")[0] for result in results}
+                if len(results) != manager.max_count or len(generations) != 1:
+                    errors.append((term, len(results), sorted(generations)))
+                seen.update(generations)
+                searches.append(term)
+
+    readers = [threading.Thread(target=reader) for _ in range(8)]
+    for thread in readers:
+        thread.start()
+    try:
+        for generation in range(1, 6):
+            publish_generation(manager, generation)
+    finally:
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+    assert not errors
+    assert searches
+    assert len(seen) > 1
+    assert manager.search("tag")[0]["term"].startswith("gen5_")
+
+
+# -----------------------------------------------
+# 検索の中断（SQLite の進捗ハンドラ）
+# -----------------------------------------------
+class CancelAfter(RequestCancel):
+    """is_set() が指定回数呼ばれた後に中断を返す（SQLite の進捗ハンドラからの呼び出しを数える）。"""
+    def __init__(self, calls):
+        super().__init__()
+        self.remaining = calls
+
+    def is_set(self):
+        self.remaining -= 1
+        return self.remaining < 0 or super().is_set()
+
+
+@pytest.fixture
+def loaded(manager):
+    # 書き込み用の接続に 3000 件のタグを読み込む（公開はしない）
+    manager.init_db()
+    source = {"id": 1, "kind": "main", "priority": 0}
+    manager._sources = {"main:test.csv": source}
+    manager.insert_data_to_source(
+        [{"term": f"tag_{i}", "postCount": str(i), "aliases": [f"alias_{i}"]} for i in range(3000)], source
+    )
+    return manager
+
+
+def test_search_is_interrupted_by_progress_handler(loaded):
+    # 一致しない検索語はテーブル全体を走査するため、走査の途中で進捗ハンドラが中断する
+    cancel = CancelAfter(2)
+    with pytest.raises(SearchCancelled):
+        loaded._search(loaded.conn, [1], "no_such_tag", [], cancel, None, 50, {})
+    assert cancel.remaining < 0
+
+    # 進捗ハンドラは検索後に外され、同じ接続で次の検索ができる
+    results, _ = loaded._search(loaded.conn, [1], "tag_299", [], RequestCancel(), None, 50, {})
+    assert "tag_299" in [result["term"] for result in results]
+
+
+def test_cancelled_before_start_raises_without_querying(loaded):
+    cancel = RequestCancel()
+    cancel.set()
+    with pytest.raises(SearchCancelled):
+        loaded._search(loaded.conn, [1], "tag", [], cancel, None, 50, {})
+
+
+# -----------------------------------------------
+# ワイルドカードのホットリロード
+# -----------------------------------------------
+def test_reloaded_wildcards_are_indexed_by_the_watcher(manager, monkeypatch):
+    from ex_tagcomplete.wildcards import WildcardLoader
+    wildcards = {"colour": ["red", "blue"]}
+    generation = [1]
+    monkeypatch.setattr(manager, "enable_wildcards", True)
+    monkeypatch.setattr(manager, "_wildcards_dirty", False)
+    monkeypatch.setattr(WildcardLoader, "load", classmethod(lambda cls: None))
+    monkeypatch.setattr(WildcardLoader, "get_generation", classmethod(lambda cls: generation[0]))
+    monkeypatch.setattr(WildcardLoader, "get_wildcards_dict", classmethod(lambda cls: dict(wildcards)))
+    monkeypatch.setattr(WildcardLoader, "add_reload_listener", classmethod(lambda cls, listener: None))
+    monkeypatch.setattr(WildcardLoader, "start_watcher", classmethod(lambda cls, can_reload=None: None))
+    manager.load_wildcards()
+    assert [result["term"] for result in manager.search("__col")] == ["__colour__"]
+
+    # 監視スレッドからの通知で再インデックスし、検索は公開済みの世代を読むだけにする
+    wildcards["colours"] = ["green"]
+    generation[0] += 1
+    manager.on_wildcards_reloaded()
+    monkeypatch.setattr(manager, "load_wildcards", classmethod(lambda cls, cancel=None: pytest.fail("search must not reload wildcards")))
+    assert sorted(result["term"] for result in manager.search("__col")) == ["__colour__", "__colours__"]
@@ -0,0 +1,89 @@
+import json
+import time
+
+import pytest
+
+from ex_tagcomplete import paths
+from ex_tagcomplete.usage import UsageCounter
+
+DAY = 24 * 60 * 60
+
+
+@pytest.fixture
+def counter(data_paths, monkeypatch):
+    """記録のない UsageCounter（コールバックなし）。"""
+    monkeypatch.setattr(UsageCounter, "_counts", {})
+    monkeypatch.setattr(UsageCounter, "_loaded", False)
+    monkeypatch.setattr(UsageCounter, "_dirty", False)
+    monkeypatch.setattr(UsageCounter, "_flush_listeners", [])
+    return UsageCounter
+
+
+# -----------------------------------------------
+# 減衰
+# -----------------------------------------------
+def test_counts_halve_every_half_life(counter):
+    start = 1_000_000.0
+    counter.record("1girl", now=start)
+    counter.record("1girl", now=start)
+
+    assert counter.counts(now=start) == {"1girl": pytest.approx(2.0)}
+    assert counter.counts(now=start + counter.HALF_LIFE) == {"1girl": pytest.approx(1.0)}
+    assert counter.counts(now=start + counter.HALF_LIFE * 3) == {"1girl": pytest.approx(0.25)}
+
+
+def test_record_adds_to_the_decayed_count(counter):
+    start = 1_000_000.0
+    counter.record("smile", now=start)
+    counter.record("smile", now=start + counter.HALF_LIFE)
+
+    # 1 回目は半減して 0.5、2 回目の 1 を加えて 1.5（更新した時刻から改めて減衰する）
+    assert counter.counts(now=start + counter.HALF_LIFE) == {"smile": pytest.approx(1.5)}
+    assert counter.counts(now=start + counter.HALF_LIFE * 2) == {"smile": pytest.approx(0.75)}
+
+
+# -----------------------------------------------
+# 上限と書き出し
+# -----------------------------------------------
+def test_trim_drops_faded_tags_and_keeps_the_most_used(counter, monkeypatch):
+    monkeypatch.setattr(counter, "MAX_KEYS", 3)
+    now = 1_000_000.0
+    # 5 回の半減期で 1/32 ≒ 0.03 になり、MIN_COUNT を下回る
+    counter.record("old", now=now - counter.HALF_LIFE * 5)
+    for term, times in (("a", 4), ("b", 3), ("c", 2), ("d", 1)):
+        for _ in range(times):
+            counter.record(term, now=now)
+
+    counter._trim(now)
+    assert set(counter.counts(now=now)) == {"a", "b", "c"}
+
+
+def test_record_trims_when_far_over_the_limit(counter, monkeypatch):
+    monkeypatch.setattr(counter, "MAX_KEYS", 10)
+    now = 1_000_000.0
+    for i in range(21):
+        counter.record(f"tag_{i}", now=now + i)
+
+    # 上限の2倍を超えた時点で、新しい（減衰の少ない）タグから上限まで残す
+    assert set(counter.counts(now=now + 21)) == {f"tag_{i}" for i in range(11, 21)}
+
+
+def test_flush_writes_trimmed_counts_and_calls_listeners(counter):
+    calls = []
+    counter.add_flush_listener(lambda: calls.append(True))
+    now = time.time()
+    counter.record("1girl", now=now)
+    counter.record("faded", now=now - counter.HALF_LIFE * 10)
+
+    counter.flush()
+    data = json.loads(paths.usage_path.read_text(encoding="utf-8"))
+    assert list(data) == ["1girl"] and data["1girl"][0] == pytest.approx(1.0, abs=1e-3)
+    assert calls == [True]
+
+    # 変更がなければ書き出さない
+    counter.flush()
+    assert calls == [True]
+
+    counter._counts = {}
+    counter._loaded = False
+    assert counter.counts(now=now) == {"1girl": pytest.approx(1.0, abs=1e-3)}
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import types
+
+from ex_tagcomplete.utils import LatestRequests, LoadCancelled, RequestCancel, SingleFlight
+
+
+# -----------------------------------------------
+# SingleFlight（読み込みのまとめと置き換え）
+# -----------------------------------------------
+def test_same_key_shares_one_run():
+    calls = []
+
+    def job(cancel):
+        calls.append(cancel)
+        threading.Event().wait(0.05)
+        return "loaded"
+
+    async def main():
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.run("main", "danbooru.csv", job) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["loaded"] * 5
+    assert len(calls) == 1
+
+
+def test_superseded_job_is_never_started():
+    started = []
+    release = threading.Event()
+
+    def make_job(name):
+        def job(cancel):
+            started.append(name)
+            if name == "a":
+                # 実行中の処理は、新しいリクエストで中断を通知される
+                release.wait(5)
+                assert cancel.is_set()
+                raise LoadCancelled()
+            return name
+        return job
+
+    async def main():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.run("main", "a", make_job("a")))
+        await asyncio.sleep(0.05) # a がワーカースレッドで実行中になるまで待つ
+        second = asyncio.ensure_future(flight.run("main", "b", make_job("b")))
+        await asyncio.sleep(0)
+        third = asyncio.ensure_future(flight.run("main", "c", make_job("c")))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(first, second, third)
+
+    assert asyncio.run(main()) == [None, None, "c"]
+    assert started == ["a", "c"]
+
+
+def test_groups_run_independently():
+    async def main():
+        flight = SingleFlight()
+        return await asyncio.gather(
+            flight.run("main", "x", lambda cancel: ("main", cancel.is_set())),
+            flight.run("extra", "y", lambda cancel: ("extra", cancel.is_set())),
+        )
+
+    assert asyncio.run(main()) == [("main", False), ("extra", False)]
+
+
+# -----------------------------------------------
+# LatestRequests / RequestCancel（検索の中断）
+# -----------------------------------------------
+def test_newer_request_cancels_older():
+    latest = LatestRequests()
+    old, new = RequestCancel(), RequestCancel()
+    latest.begin("client", 1, old)
+    latest.begin("client", 2, new)
+    assert old.is_set()
+    assert not new.is_set()
+
+    # 新しいリクエストより後に届いた古いリクエストは、最初から中断される
+    late = RequestCancel()
+    latest.begin("client", 1, late)
+    assert late.is_set()
+    assert not new.is_set()
+
+    latest.end("client", new)
+    again = RequestCancel()
+    latest.begin("client", 3, again)
+    assert not again.is_set()
+
+
+def test_request_cancel_follows_client_disconnect():
+    transport = types.SimpleNamespace(closing=False)
+    transport.is_closing = lambda: transport.closing
+    cancel = RequestCancel(types.SimpleNamespace(transport=transport))
+    assert not cancel.is_set()
+    transport.closing = True
+    assert cancel.is_set()
@@ -0,0 +1,17 @@
+from ex_tagcomplete.wildcards import WildcardLoader
+
+
+# -----------------------------------------------
+# 選択オプション
+# -----------------------------------------------
+def test_multi_select_uses_every_option():
+    # `{2$$a|b|c}` は a・b・c の全てから重複なしで2つ選ぶ（`$$` の後の最初の候補だけにしない）
+    picks = [WildcardLoader.process("{2$$a|b|c}", seed).split(" ") for seed in range(64)]
+    assert all(len(pick) == 2 and len(set(pick)) == 2 for pick in picks)
+    assert {option for pick in picks for option in pick} == {"a", "b", "c"}
+
+
+def test_multi_select_with_separator_uses_every_option():
+    picks = [WildcardLoader.process("{1-2$$ / $$a|b|c}", seed).split(" / ") for seed in range(64)]
+    assert {len(pick) for pick in picks} == {1, 2}
+    assert {option for pick in picks for option in pick} == {"a", "b", "c"}
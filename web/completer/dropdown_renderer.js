@@ -1,4 +1,5 @@
 import { $el } from "../../../scripts/ui.js";
+import { api_post } from "../utils.js";
 import { TagCompleterSettings } from "./tag_completer_settings.js";
 
 // ==============================================
@@ -8,20 +9,10 @@ import { TagCompleterSettings } from "./tag_completer_settings.js";
 export class DropdownRenderer {
     constructor() {
         this.settings = TagCompleterSettings;
+        this.wildcardTitleLimit = 100; // ツールチップに表示するワイルドカードの最大行数
+        this.itemResults = new WeakMap(); // 行 -> 描画した結果
     }
 
-    // ------------------------------------------
-    // ドロップダウンアイテムを作成
-    // ------------------------------------------
-    createDropdownItems(searchResults, searchInfo, onItemClick) {
-        return searchResults.map(result => {
-            const parts = this.createItemParts(result, searchInfo);
-            const item = this.createDropdownItem(result, searchInfo, parts, onItemClick);
-            return item;
-        });
-    }
-
-
     // ------------------------------------------
     // アイテムの構成要素を作成
     // ------------------------------------------
@@ -134,6 +125,13 @@ export class DropdownRenderer {
     // テキスト部分
     // ------------------------------------------
     createTextParts(result, inputTerm) {
+        // 次のタグの候補など、入力中の語がない場合は強調しない
+        if (!inputTerm) {
+            const element = $el("span", { textContent: result.text });
+            this.applyTextStyles(element, result);
+            return $el("div.jupo-tagcomplete-text", [element]);
+        }
+
         const safeTerm = this.escapeRegExp(inputTerm);
         const regex = new RegExp(`(${safeTerm})`, "gi");
         const splitText = result.text.split(regex);
@@ -203,26 +201,90 @@ export class DropdownRenderer {
 
 
     // ------------------------------------------
-    // 各行のアイテムを作成
+    // 再利用する行に結果を描画（仮想スクロール用）
     // ------------------------------------------
-    createDropdownItem(result, searchInfo, parts, onItemClick) {
-        const item = $el("div.jupo-tagcomplete-item", {
-            onclick: (e) => onItemClick(e, result, searchInfo), 
-        }, parts);
+    renderDropdownItem(element, result, searchInfo) {
+        element.replaceChildren(...this.createItemParts(result, searchInfo));
+
+        // 前に描画した結果のタイトルを消してから付け直す
+        element.removeAttribute("title");
+        element.onmouseenter = null;
+        this.applyItemTitle(element, result);
+        this.applySection(element, result);
+    }
 
-        // wildcardの場合、アイテムにタイトルをつける
-        this.applyItemTitle(item, result);
+    // ------------------------------------------
+    // カテゴリごとのセクション
+    // ------------------------------------------
+    // --- カテゴリごとにまとまった結果の、各カテゴリの先頭にセクション名を付ける ---
+    markSections(results) {
+        let previous;
+        results.forEach(result => {
+            const categoryName = result.categoryName ?? "";
+            result.section = categoryName !== previous ? (categoryName || "Other") : null;
+            previous = categoryName;
+        });
+    }
 
-        return item;
+    // --- セクションの先頭の行に区切りとセクション名を表示 ---
+    applySection(element, result) {
+        element.classList.toggle("jupo-tagcomplete-item--section", !!result.section);
+        if (result.section) {
+            element.dataset.section = result.section;
+        } else {
+            delete element.dataset.section;
+        }
     }
 
     // ------------------------------------------
     // アイテムタイトル
     // ------------------------------------------
     applyItemTitle(element, result) {
+        this.itemResults.set(element, result);
+
         if (result.categoryName === "Wildcard" && result.wildcardValue) {
-            element.title = result.wildcardValue.replace(/,/g, '\n');
+            element.title = this.createWildcardTitle(
+                result.wildcardValue.split("\n"), 
+                result.wildcardCount
+            );
+
+            // プレビューに収まらない場合は、ホバー時に続きを取得する
+            if (result.wildcardCount > this.wildcardPreviewCount(result)) {
+                element.onmouseenter = () => {
+                    element.onmouseenter = null;
+                    this.loadWildcardTitle(element, result);
+                };
+            }
         }
     }
 
+    // --- ワイルドカードの内容をページ単位で取得してタイトルに反映 ---
+    async loadWildcardTitle(element, result) {
+        try {
+            const page = await api_post("get_wildcard_values", {
+                key: result.value, 
+                offset: 0, 
+                limit: this.wildcardTitleLimit, 
+            });
+            if (!page?.values?.length) return;
+
+            // 取得中に行が別の結果に再利用された場合は反映しない
+            if (this.itemResults.get(element) !== result) return;
+
+            element.title = this.createWildcardTitle(page.values, page.total);
+        } catch (error) {
+            console.error("ワイルドカード取得エラー: ", error);
+        }
+    }
+
+    createWildcardTitle(values, total) {
+        const title = values.join("\n");
+        const rest = (total ?? values.length) - values.length;
+        return rest > 0 ? `${title}\n... (+${rest})` : title;
+    }
+
+    wildcardPreviewCount(result) {
+        return result.wildcardValue ? result.wildcardValue.split("\n").length : 0;
+    }
+
 }
\ No newline at end of file
@@ -0,0 +1,114 @@
+import { api } from "../../../scripts/api.js";
+import { mk_endpoint } from "../utils.js";
+
+// ==============================================
+// WebSocket による検索チャネル
+// 1本の接続で検索リクエストを送り、リクエストIDで結果を対応付ける
+// ==============================================
+
+export class SearchChannel {
+    // ------------------------------------------
+    // 静的プロパティ
+    // ------------------------------------------
+    static #shared = null;
+
+    // ------------------------------------------
+    // プライベートプロパティ
+    // ------------------------------------------
+    #socket = null;
+    #opening = null;
+    #nextId = 0;
+    #pending = new Map();
+
+    // --- 全てのインスタンスで共有するチャネル ---
+    static shared() {
+        SearchChannel.#shared ??= new SearchChannel();
+        return SearchChannel.#shared;
+    }
+
+
+    // ------------------------------------------
+    // 接続
+    // ------------------------------------------
+    connect() {
+        if (this.#socket?.readyState === WebSocket.OPEN) return Promise.resolve(this.#socket);
+        if (this.#opening) return this.#opening;
+
+        this.#opening = new Promise((resolve, reject) => {
+            const protocol = location.protocol === "https:" ? "wss:" : "ws:";
+            const socket = new WebSocket(`${protocol}//${location.host}${api.apiURL(mk_endpoint("search_ws"))}`);
+
+            socket.onopen = () => {
+                this.#socket = socket;
+                this.#opening = null;
+                resolve(socket);
+            };
+            socket.onmessage = (e) => this.handleMessage(e);
+            socket.onclose = () => {
+                if (this.#opening) {
+                    this.#opening = null;
+                    reject(new Error("検索チャネルに接続できません"));
+                }
+                if (this.#socket === socket) this.#socket = null;
+                this.rejectAll(new Error("検索チャネルが切断されました"));
+            };
+        });
+        return this.#opening;
+    }
+
+
+    // ------------------------------------------
+    // 検索リクエストを送信
+    // 戻り値: サーバーの検索レスポンス（HTTP の search と同じ形式）
+    // ------------------------------------------
+    async request(body, { signal } = {}) {
+        const socket = await this.connect();
+        signal?.throwIfAborted();
+
+        const id = ++this.#nextId;
+        return new Promise((resolve, reject) => {
+            const onAbort = () => {
+                this.#pending.delete(id);
+                reject(new DOMException("検索を中止しました", "AbortError"));
+            };
+
+            this.#pending.set(id, {
+                resolve: (response) => {
+                    signal?.removeEventListener("abort", onAbort);
+                    resolve(response);
+                }, 
+                reject: (error) => {
+                    signal?.removeEventListener("abort", onAbort);
+                    reject(error);
+                }, 
+            });
+            signal?.addEventListener("abort", onAbort, { once: true });
+
+            // 新しいリクエストを送ると、サーバー側で実行中の古い検索は中断される
+            socket.send(JSON.stringify({ ...body, id }));
+        });
+    }
+
+    // --- レスポンスを受信 ---
+    handleMessage(e) {
+        let message;
+        try {
+            message = JSON.parse(e.data);
+        } catch {
+            return;
+        }
+
+        const pending = this.#pending.get(message.id);
+        if (!pending) return;
+
+        this.#pending.delete(message.id);
+        pending.resolve(message.response);
+    }
+
+    // --- 待機中のリクエストを全て失敗させる ---
+    rejectAll(error) {
+        const pending = [...this.#pending.values()];
+        this.#pending.clear();
+        pending.forEach(p => p.reject(error));
+    }
+}
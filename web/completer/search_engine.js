@@ -1,5 +1,6 @@
 import { api_post } from "../utils.js";
 import { TagCompleterSettings } from "./tag_completer_settings.js";
+import { SearchChannel } from "./search_channel.js";
 
 // ==============================================
 // 検索処理とAPIリクエストを担当するクラス
@@ -15,6 +16,8 @@ export class SearchEngine {
 
     constructor() {
         this.settings = TagCompleterSettings;
+        // サーバーが古い検索を中断できるよう、シーケンス番号と一緒に送るID
+        this.clientId = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
     }
 
     // ------------------------------------------
@@ -70,8 +73,11 @@ export class SearchEngine {
 
     // ------------------------------------------
     // 検索結果を取得
+    // cursor を渡すと、前のページの続きを取得する
+    // カテゴリごとの表示件数が設定されている場合は、カテゴリごとにまとまった結果が返される
+    // 戻り値: { results, cursor }（cursor は続きのページがない場合 null）
     // ------------------------------------------
-    async fetchSearchResults(searchInfo, requestSequence) {
+    async fetchSearchResults(searchInfo, requestSequence, cursor = null) {
         // 新しいAbortControllerを作成
         this.#abortController = new AbortController();
 
@@ -79,20 +85,25 @@ export class SearchEngine {
             const body = {
                 term: searchInfo.term, 
                 filters: searchInfo.categoryFilters, 
+                client: this.clientId, 
+                seq: requestSequence, 
+                format: "columns", 
+                compress: true, 
+                cursor: cursor, 
+                group: this.settings.groupQuota || null, 
             };
 
-            const response = await api_post(
-                "search", 
-                body, 
-                { signal: this.#abortController.signal }
-            );
+            const response = await this.sendSearchRequest(body, this.#abortController.signal);
 
             // レスポンス取得時に再度シーケンス番号をチェック
             if (requestSequence !== this.#requestSequence) {
                 throw new Error("リクエストが古くなりました");
             }
 
-            return response;
+            return {
+                results: this.decodeSearchResults(response), 
+                cursor: response?.cursor ?? null, 
+            };
         
         } catch (error) {
             if (error.name === "AbortError") {
@@ -103,6 +114,94 @@ export class SearchEngine {
     }
 
 
+    // ------------------------------------------
+    // 次のタグの候補を取得（カーソルの前のプロンプトに含まれるタグとの共起から）
+    // ------------------------------------------
+    async fetchNextTags(beforeCursor, requestSequence) {
+        this.#abortController = new AbortController();
+
+        const response = await api_post("suggest_next", {
+            text: beforeCursor, 
+            format: "columns", 
+        }, { signal: this.#abortController.signal });
+
+        if (requestSequence !== this.#requestSequence) {
+            throw new Error("リクエストが古くなりました");
+        }
+        return this.decodeSearchResults(response);
+    }
+
+
+    // ------------------------------------------
+    // 検索リクエストを送信
+    // WebSocket が有効な場合は検索チャネルを使い、接続できない場合は HTTP で送る
+    // ------------------------------------------
+    async sendSearchRequest(body, signal) {
+        if (this.settings.webSocket) {
+            try {
+                return await SearchChannel.shared().request(body, { signal });
+            } catch (error) {
+                if (error.name === "AbortError") throw error;
+                console.debug("検索チャネルを使用できないため HTTP で検索: ", error.message);
+            }
+        }
+        return await api_post("search", body, { signal });
+    }
+
+
+    // ------------------------------------------
+    // 確定されたタグをサーバーに通知（使用回数による並び順の調整）
+    // 応答は待たず、失敗しても補完には影響しない
+    // ------------------------------------------
+    reportAccepted(result) {
+        // postCount が数値のタグと、エイリアス（エイリアス先のタグとして数える）のみ
+        const postCount = result?.postCount;
+        if (postCount !== "Alias" && !/^\d/.test(postCount ?? "")) return;
+
+        api_post("record_usage", { term: result.value }).catch(error => {
+            console.debug("使用回数の通知に失敗: ", error.message);
+        });
+    }
+
+
+    // ------------------------------------------
+    // 列形式の検索結果を1件ずつのオブジェクトに戻す
+    // ------------------------------------------
+    decodeSearchResults(response) {
+        // 列形式に対応していないサーバーの場合はそのまま
+        if (!response || response.format !== "columns") return response;
+
+        const { count, categories, categoryId, term } = response;
+        const text = response.text;
+        const value = response.value;
+        const postCount = response.postCount;
+        const translate = response.translate;
+        const wildcardValue = response.wildcardValue;
+        const wildcardCount = response.wildcardCount;
+
+        const results = new Array(count);
+        for (let i = 0; i < count; i++) {
+            const [category, categoryName, site] = categories[categoryId[i]];
+            const itemValue = value?.[i] ?? term[i];
+            const itemPostCount = postCount?.[i] ?? null;
+
+            results[i] = {
+                term: term[i], 
+                text: text?.[i] ?? (itemPostCount === "Alias" ? `${term[i]} => ${itemValue}` : term[i]), 
+                value: itemValue, 
+                category: category, 
+                postCount: itemPostCount, 
+                categoryName: categoryName, 
+                site: site, 
+                translate: translate?.[i] ?? null, 
+                wildcardValue: wildcardValue?.[i] ?? null, 
+                wildcardCount: wildcardCount?.[i] ?? null, 
+            };
+        }
+        return results;
+    }
+
+
     // ------------------------------------------
     // 現在のリクエストをキャンセル
     // ------------------------------------------
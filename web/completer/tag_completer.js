@@ -24,6 +24,8 @@ export class TagCompleter {
     // 静的プロパティ
     // ------------------------------------------
     static instanceArray = [];
+    static firstInputTime = null; // 初回補完までの時間計測用
+    static firstCompletionLogged = false;
 
     // ------------------------------------------
     // コンストラクタ
@@ -160,6 +162,7 @@ export class TagCompleter {
     handleInput(e) {
         if (!this.settings.enable) return;
 
+        TagCompleter.firstInputTime ??= performance.now();
         this.debouncedUpdate();
     }
 
@@ -205,7 +208,7 @@ export class TagCompleter {
 
     // --- item click ---
     handleItemClick(e, result, searchInfo) {
-        if (e.target.classList.contains("jupo-tagcomplete-wikiLink")) return;
+        if (e?.target.classList.contains("jupo-tagcomplete-wikiLink")) return;
 
         this.element.focus();
 
@@ -219,6 +222,7 @@ export class TagCompleter {
         const replaceLength = this.textProcessor.getReplaceLength(searchInfo);
 
         this.helper.insertAtCursor(insertValue, replaceLength);
+        this.searchEngine.reportAccepted(result);
 
         setTimeout(() => this.dropdownController.hide(), 150);
     }
@@ -238,6 +242,15 @@ export class TagCompleter {
         try {
             const searchInfo = this.getSearchInfo();
 
+            // 区切り文字の直後では、プロンプト中のタグから次のタグの候補を表示
+            if (!searchInfo && this.settings.nextTags) {
+                const beforeCursor = this.helper.getBeforeCursor();
+                if (this.textProcessor.isAfterDelimiter(beforeCursor)) {
+                    await this.showNextTags(beforeCursor, currentSequence);
+                    return;
+                }
+            }
+
             if (!searchInfo || !searchInfo.term) {
                 this.dropdownController.hide();
                 return;
@@ -250,7 +263,7 @@ export class TagCompleter {
             };
 
             // 検索実行
-            const searchResults = await this.searchEngine.fetchSearchResults(
+            const { results: searchResults, cursor } = await this.searchEngine.fetchSearchResults(
                 searchInfo, 
                 currentSequence
             );
@@ -268,6 +281,7 @@ export class TagCompleter {
             }
 
             this.showDropdown(searchResults, searchInfo);
+            this.setupLoadMore(searchInfo, currentSequence, cursor);
 
         } catch(error) {
             if (error.name !== "AbortError") {
@@ -279,6 +293,29 @@ export class TagCompleter {
         }
     }
 
+    // --- 次のタグの候補を表示 ---
+    async showNextTags(beforeCursor, currentSequence) {
+        const results = await this.searchEngine.fetchNextTags(beforeCursor, currentSequence);
+
+        // リクエストが古い場合は処理をスキップ
+        if (currentSequence !== this.searchEngine.getCurrentSequence()) return;
+
+        if (!results || results.length === 0) {
+            this.dropdownController.hide();
+            return;
+        }
+
+        // 入力中の語はないため、カーソル位置にそのまま挿入する
+        this.termCursorPostion = {
+            start: this.element.selectionStart, 
+            end: this.element.selectionEnd, 
+        };
+        const searchInfo = { term: "", customPrefixes: [], categoryFilters: [], fullTerm: "", next: true };
+
+        this.showDropdown(results, searchInfo);
+        this.setupLoadMore(searchInfo, currentSequence, null);
+    }
+
     // --- 検索情報を取得 ---
     getSearchInfo() {
         const beforeCursor = this.helper.getBeforeCursor();
@@ -291,22 +328,54 @@ export class TagCompleter {
 
     // --- ドロップダウンを表示 ---
     showDropdown(searchResults, searchInfo) {
-        const items = this.dropdownRenderer.createDropdownItems(
-            searchResults, 
-            searchInfo, 
-            (e, result, searchInfo) => this.handleItemClick(e, result, searchInfo)
-        );
-
+        // 行の要素はドロップダウンが表示範囲の分だけ作り、スクロールに合わせて再利用する
         const position = this.helper.getCursorOffset();
-        this.dropdownController.show(items, position);
+        if (this.settings.groupQuota && !searchInfo.next) {
+            this.dropdownRenderer.markSections(searchResults);
+        }
+        this.dropdownController.show(searchResults, position, {
+            renderItem: (element, result) => this.dropdownRenderer.renderDropdownItem(element, result, searchInfo), 
+            onItemClick: (e, result) => this.handleItemClick(e, result, searchInfo), 
+        });
+        this.logFirstCompletion();
+    }
+
+    // --- 続きのページの取得を設定（全て表示の場合のみ cursor が返される） ---
+    setupLoadMore(searchInfo, sequence, cursor) {
+        if (!cursor) {
+            this.dropdownController.setLoadMore(null);
+            return;
+        }
+
+        this.dropdownController.setLoadMore(async () => {
+            try {
+                const page = await this.searchEngine.fetchSearchResults(searchInfo, sequence, cursor);
+
+                // 入力が進んでいる場合は破棄
+                if (sequence !== this.searchEngine.getCurrentSequence()) return;
+
+                this.dropdownController.append(page.results);
+                this.setupLoadMore(searchInfo, sequence, page.cursor);
+            } catch (error) {
+                if (error.name !== "AbortError") {
+                    console.debug("続きの候補の取得を中止: ", error.message);
+                }
+            }
+        });
+    }
+
+    // --- 初回補完までの時間を記録 ---
+    logFirstCompletion() {
+        if (TagCompleter.firstCompletionLogged || TagCompleter.firstInputTime === null) return;
+        TagCompleter.firstCompletionLogged = true;
+
+        const elapsed = performance.now() - TagCompleter.firstInputTime;
+        console.debug(`[ExTagComplete] time to first completion: ${elapsed.toFixed(1)}ms (page: ${performance.now().toFixed(0)}ms)`);
     }
 
     // --- 選択中のアイテムを挿入 ---
     insertSelectedItem() {
-        const selectedItem = this.dropdownController.getSelectedItem();
-        if (!selectedItem) return;
-
-        selectedItem.click();
+        this.dropdownController.clickSelectedItem();
     }
 
     
@@ -11,5 +11,8 @@ export const TagCompleterSettings = {
     replaceUnderbar: true, 
     wikiLink: true, 
     delay: 50, 
+    webSocket: false, 
+    groupQuota: 0, 
+    nextTags: false, 
 }
 
@@ -26,6 +26,18 @@ export class TextProcessor {
     }
 
 
+    // ------------------------------------------
+    // カーソルが区切り文字の直後にあるか (次のタグの候補を表示する位置)
+    // ------------------------------------------
+    isAfterDelimiter(beforeCursor) {
+        const last = beforeCursor?.replace(/[ \t]+$/, "").slice(-1);
+        if (!last) return false;
+
+        const delimiter = this.settings.delimiter.trim();
+        return last === "," || last === "\n" || (delimiter !== "" && last === delimiter);
+    }
+
+
     // ------------------------------------------
     // タグ値を処理 (エスケープ、アンダーバー処理)
     // ------------------------------------------
@@ -20,16 +20,25 @@ export class VirtualDropdownController {
         this.itemHeight = 40; // 各アイテムの固定高さ
         this.visibleCount = 50; // 表示するアイテム数
         this.bufferSize = 3; // 前後の余剰アイテム数
+        this.loadMoreThreshold = 50; // 末尾までの残りがこの件数になったら続きを取得する
         
         // 状態管理
-        this.allItems = [];
-        this.visibleItems = [];
+        this.allItems = []; // 検索結果（行の要素は表示範囲の分だけ作る）
+        this.rows = []; // 表示中の行（startIndex から順に並ぶ）
+        this.rowPool = []; // 再利用待ちの行
+        this.rowIndexes = new WeakMap(); // 行 -> 表示している結果の位置
+        this.renderItem = null; // (element, result) => 行の中身を描画
+        this.onItemClick = null; // (e, result) => 行のクリック
         this.startIndex = 0;
         this.endIndex = 0;
         this.currentIndex = 0;
         this.isMousedownOnDropdown = false;
         this.isHoveringOnDropdown = false;
         
+        // 続きのページの取得（全て表示の場合）
+        this.loadMore = null;
+        this.isLoadingMore = false;
+        
         // スクロール制御用フラグ
         this.isUserScrolling = false;
         this.userScrollTimeout = null;
@@ -45,7 +54,6 @@ export class VirtualDropdownController {
     setupDOM() {
         // ドロップダウン構造: dropdown > viewport > container
         this.container.append(this.paddingTop);
-        this.container.append(...this.visibleItems);
         this.container.append(this.paddingBottom);
         
         this.viewport.append(this.container);
@@ -122,6 +130,9 @@ export class VirtualDropdownController {
     handleScroll() {
         if (!this.allItems.length) return;
         
+        // 末尾に近づいたら続きのページを取得
+        this.requestMoreIfNeeded();
+        
         const currentScrollTop = this.viewport.scrollTop;
         
         // スクロール方向を検出
@@ -155,6 +166,43 @@ export class VirtualDropdownController {
         }
     }
 
+    // ------------------------------------------
+    // 続きのページ
+    // ------------------------------------------
+    // --- 続きのページを取得する関数を設定（null の場合は続きなし） ---
+    setLoadMore(loadMore) {
+        this.loadMore = loadMore;
+        this.requestMoreIfNeeded();
+    }
+
+    // --- 表示範囲が末尾に近い場合に続きを取得 ---
+    requestMoreIfNeeded() {
+        if (!this.loadMore || this.isLoadingMore || !this.isVisible()) return;
+
+        const lastVisibleIndex = Math.floor(
+            (this.viewport.scrollTop + this.viewport.clientHeight) / this.itemHeight
+        );
+        if (this.allItems.length - lastVisibleIndex > this.loadMoreThreshold) return;
+
+        const loadMore = this.loadMore;
+        this.loadMore = null;
+        this.isLoadingMore = true;
+        loadMore().finally(() => {
+            this.isLoadingMore = false;
+        });
+    }
+
+    // --- 取得した結果を末尾に追加 ---
+    append(results) {
+        if (!results.length || !this.isVisible()) return;
+
+        // 続きは1ページ分の件数が揃った場合のみ返されるため、すでに仮想スクロールの状態になっている
+        this.allItems.push(...results);
+
+        this.container.style.height = `${this.allItems.length * this.itemHeight}px`;
+        this.updateVisibleItemsOnly();
+    }
+
     // ------------------------------------------
     // 仮想スクロールのみ更新（選択状態は変更しない）
     // ------------------------------------------
@@ -181,33 +229,7 @@ export class VirtualDropdownController {
     // 表示アイテムのみ更新（選択状態は更新しない）
     // ------------------------------------------
     updateVisibleItemsOnly() {
-        // 通常の仮想スクロール処理
-        const topPadding = this.startIndex * this.itemHeight;
-        const bottomPadding = (this.allItems.length - this.endIndex - 1) * this.itemHeight;
-        
-        this.paddingTop.style.height = `${topPadding}px`;
-        this.paddingBottom.style.height = `${bottomPadding}px`;
-        
-        // 表示アイテム取得
-        this.visibleItems = this.allItems.slice(this.startIndex, this.endIndex + 1);
-        
-        // DOM更新
-        const itemElements = this.visibleItems.map(item => {
-            const element = item.element;
-            element.style.height = `${this.itemHeight}px`;
-            element.style.display = "flex";
-            element.style.alignItems = "center";
-            element.style.boxSizing = "border-box";
-            element.style.width = "100%";
-            return element;
-        });
-        
-        // コンテナ更新
-        this.container.replaceChildren(
-            this.paddingTop,
-            ...itemElements,
-            this.paddingBottom
-        );
+        this.renderRows();
         
         // 選択状態のみ更新（scrollIntoViewは呼ばない）
         this.updateItemSelectionWithoutScroll();
@@ -217,68 +239,79 @@ export class VirtualDropdownController {
     // 表示アイテム更新
     // ------------------------------------------
     updateVisibleItems() {
+        this.renderRows();
+        this.updateItemSelection();
+    }
+
+    // ------------------------------------------
+    // 表示範囲の行を描画
+    // 範囲内に残る行はそのまま使い、範囲外に出た行を新しく入る位置に再利用する
+    // ------------------------------------------
+    renderRows() {
         // アイテム数が少ない場合は全て表示
-        if (this.allItems.length <= this.visibleCount) {
-            this.paddingTop.style.height = '0px';
-            this.paddingBottom.style.height = '0px';
-            
-            this.visibleItems = this.allItems;
-            
-            // DOM更新 - イベントリスナーを保持するため元の要素を使用
-            const itemElements = this.visibleItems.map(item => {
-                const element = item.element; // cloneNode(true)ではなく元の要素を使用
-                element.style.height = `${this.itemHeight}px`;
-                element.style.display = "flex";
-                element.style.alignItems = "center";
-                element.style.boxSizing = "border-box";
-                element.style.width = "100%";
-                return element;
-            });
-            
-            this.container.replaceChildren(...itemElements);
-            this.updateItemSelection();
-            return;
+        const isVirtual = this.allItems.length > this.visibleCount;
+        const startIndex = isVirtual ? this.startIndex : 0;
+        const endIndex = isVirtual ? this.endIndex : this.allItems.length - 1;
+
+        this.paddingTop.style.height = `${startIndex * this.itemHeight}px`;
+        this.paddingBottom.style.height = `${(this.allItems.length - endIndex - 1) * this.itemHeight}px`;
+
+        // 範囲内に残る行を探し、範囲外の行はプールに戻す（残る行は連続した範囲になる）
+        const keptRows = new Map();
+        this.rows.forEach(row => {
+            const index = this.rowIndexes.get(row);
+            if (index >= startIndex && index <= endIndex) {
+                keptRows.set(index, row);
+            } else {
+                this.rowPool.push(row);
+            }
+        });
+        const keptStart = keptRows.size ? Math.min(...keptRows.keys()) : endIndex + 1;
+
+        // 残った行の前後に入る位置だけ、プールの行に描画する
+        const rows = [];
+        const headRows = [];
+        const tailRows = [];
+        for (let index = startIndex; index <= endIndex; index++) {
+            let row = keptRows.get(index);
+            if (!row) {
+                row = this.rowPool.pop() ?? this.createRow();
+                this.rowIndexes.set(row, index);
+                this.renderItem?.(row, this.allItems[index]);
+                (index < keptStart ? headRows : tailRows).push(row);
+            }
+            rows.push(row);
         }
 
-        // 通常の仮想スクロール処理
-        const topPadding = this.startIndex * this.itemHeight;
-        const bottomPadding = (this.allItems.length - this.endIndex - 1) * this.itemHeight;
-        
-        this.paddingTop.style.height = `${topPadding}px`;
-        this.paddingBottom.style.height = `${bottomPadding}px`;
-        
-        // 表示アイテム取得
-        this.visibleItems = this.allItems.slice(this.startIndex, this.endIndex + 1);
-        
-        // DOM更新 - イベントリスナーを保持するため元の要素を使用
-        const itemElements = this.visibleItems.map(item => {
-            const element = item.element; // cloneNode(true)ではなく元の要素を使用
-            element.style.height = `${this.itemHeight}px`;
-            element.style.display = "flex";
-            element.style.alignItems = "center";
-            element.style.boxSizing = "border-box";
-            element.style.width = "100%";
-            return element;
+        // 移動する行だけDOMを更新
+        this.rowPool.forEach(row => row.remove());
+        this.paddingTop.after(...headRows);
+        this.paddingBottom.before(...tailRows);
+        this.rows = rows;
+    }
+
+    // --- 再利用する行を作成 ---
+    createRow() {
+        const row = $el("div.jupo-tagcomplete-item", {
+            onclick: (e) => this.onItemClick?.(e, this.allItems[this.rowIndexes.get(row)]), 
         });
-        
-        // コンテナ更新
-        this.container.replaceChildren(
-            this.paddingTop,
-            ...itemElements,
-            this.paddingBottom
-        );
-        
-        this.updateItemSelection();
+        row.style.height = `${this.itemHeight}px`;
+        row.style.display = "flex";
+        row.style.alignItems = "center";
+        row.style.boxSizing = "border-box";
+        row.style.width = "100%";
+        return row;
     }
 
     // ------------------------------------------
     // ドロップダウンを表示
+    // 行の要素は表示範囲に入ったときに renderItem で描画する
     // ------------------------------------------
-    show(items, position) {
-        this.allItems = items.map((item, index) => ({
-            element: item,
-            originalIndex: index
-        }));
+    show(results, position, { renderItem, onItemClick }) {
+        this.allItems = results;
+        this.renderItem = renderItem;
+        this.onItemClick = onItemClick;
+        this.releaseRows();
         
         this.currentIndex = 0;
         this.startIndex = 0;
@@ -311,16 +344,29 @@ export class VirtualDropdownController {
         this.dropdown.style.top = "";
         
         this.allItems = [];
-        this.visibleItems = [];
+        this.releaseRows();
+        this.renderItem = null;
+        this.onItemClick = null;
         this.currentIndex = 0;
         this.startIndex = 0;
         this.endIndex = 0;
+        this.loadMore = null;
         this.isMousedownOnDropdown = false;
         this.isHoveringOnDropdown = false;
         this.isUserScrolling = false;
         this.dropdown.remove();
     }
 
+    // --- 全ての行をプールに戻す ---
+    releaseRows() {
+        this.rows.forEach(row => {
+            this.rowIndexes.delete(row);
+            row.remove();
+        });
+        this.rowPool.push(...this.rows);
+        this.rows = [];
+    }
+
     // ------------------------------------------
     // 表示状態を確認
     // ------------------------------------------
@@ -428,22 +474,10 @@ export class VirtualDropdownController {
     updateItemSelectionWithoutScroll() {
         const selectedClassName = "jupo-tagcomplete-item--selected";
         
-        if (this.allItems.length <= this.visibleCount) {
-            // アイテム数が少ない場合
-            const containerItems = this.container.querySelectorAll(".jupo-tagcomplete-item");
-            containerItems.forEach((item, index) => {
-                const isSelected = index === this.currentIndex;
-                item.classList.toggle(selectedClassName, isSelected);
-            });
-        } else {
-            // 仮想スクロール時
-            const containerItems = this.container.querySelectorAll(".jupo-tagcomplete-item");
-            containerItems.forEach((item, index) => {
-                const actualIndex = this.startIndex + index;
-                const isSelected = actualIndex === this.currentIndex;
-                item.classList.toggle(selectedClassName, isSelected);
-            });
-        }
+        this.rows.forEach(row => {
+            const isSelected = this.rowIndexes.get(row) === this.currentIndex;
+            row.classList.toggle(selectedClassName, isSelected);
+        });
     }
 
     // ------------------------------------------
@@ -458,48 +492,36 @@ export class VirtualDropdownController {
 
         const selectedClassName = "jupo-tagcomplete-item--selected";
         
-        if (this.allItems.length <= this.visibleCount) {
-            // アイテム数が少ない場合
-            const containerItems = this.container.querySelectorAll(".jupo-tagcomplete-item");
-            containerItems.forEach((item, index) => {
-                const isSelected = index === this.currentIndex;
-                item.classList.toggle(selectedClassName, isSelected);
-                
-                if (isSelected) {
-                    item.scrollIntoView({
-                        block: "nearest", 
-                        behavior: "smooth", 
-                        inline: "nearest"
-                    });
-                }
-            });
-        } else {
-            // 仮想スクロール時
-            const containerItems = this.container.querySelectorAll(".jupo-tagcomplete-item");
-            containerItems.forEach((item, index) => {
-                const actualIndex = this.startIndex + index;
-                const isSelected = actualIndex === this.currentIndex;
-                item.classList.toggle(selectedClassName, isSelected);
-                
-                if (isSelected) {
-                    item.scrollIntoView({
-                        block: "nearest", 
-                        behavior: "smooth", 
-                        inline: "nearest"
-                    });
-                }
-            });
-        }
+        this.rows.forEach(row => {
+            const isSelected = this.rowIndexes.get(row) === this.currentIndex;
+            row.classList.toggle(selectedClassName, isSelected);
+            
+            if (isSelected) {
+                row.scrollIntoView({
+                    block: "nearest", 
+                    behavior: "smooth", 
+                    inline: "nearest"
+                });
+            }
+        });
     }
 
     // ------------------------------------------
-    // 選択中のアイテムを取得
+    // 選択中の結果を取得
     // ------------------------------------------
     getSelectedItem() {
         if (!this.allItems.length || this.currentIndex < 0 || this.currentIndex >= this.allItems.length) {
             return null;
         }
-        return this.allItems[this.currentIndex].element;
+        return this.allItems[this.currentIndex];
+    }
+
+    // --- 選択中の結果をクリックした場合と同じ処理を行う（行が表示範囲外でもよい） ---
+    clickSelectedItem() {
+        const result = this.getSelectedItem();
+        if (!result) return;
+
+        this.onItemClick?.(null, result);
     }
 
     // ------------------------------------------
@@ -6,9 +6,11 @@ import { TagCompleter } from "./completer/tag_completer.js";
 // 設定オブジェクト
 // ==============================================
 
-const MAIN_FILES = await api_get("get_main_files")
-const EXTRA_FILES = await api_get("get_extra_files")
-const TRANSLATE_FILES = await api_get("get_translate_files")
+// ファイルリストは1回のリクエストでまとめて取得する
+const BOOTSTRAP = await api_get("get_bootstrap");
+const MAIN_FILES = BOOTSTRAP.mainFiles;
+const EXTRA_FILES = BOOTSTRAP.extraFiles;
+const TRANSLATE_FILES = BOOTSTRAP.translateFiles;
 
 
 export const settings = {
@@ -104,6 +106,30 @@ export const settings = {
         }, 
     }, 
 
+    groupQuota: {
+        name: "Suggestions per Category", 
+        id: mk_name("groupQuota"), 
+        type: "slider", 
+        defaultValue: 0, 
+        attrs: { min: 0, max: 20, step: 1 }, 
+        tooltip: "Show the top N suggestions of each category in separate sections. 0: Off.", 
+        onChange: (value) => {
+            TagCompleter.updateSetting("groupQuota", value);
+        }, 
+    }, 
+
+    nextTags: {
+        name: "Suggest Next Tags", 
+        id: mk_name("nextTags"), 
+        type: "boolean", 
+        defaultValue: false, 
+        tooltip: "After a delimiter, suggest tags that often appear together with the tags already in the prompt (learned from queued prompts).", 
+        onChange: async (value) => {
+            TagCompleter.updateSetting("nextTags", value);
+            await api_post("set_next_tags", { value: value });
+        }, 
+    }, 
+
     wikiLink: {
         name: "Add 🔍 Link button", 
         id: mk_name("wikiLink"), 
@@ -136,6 +162,17 @@ export const settings = {
         }, 
     }, 
 
+    webSocket: {
+        name: "Search over WebSocket", 
+        id: mk_name("searchWebSocket"), 
+        type: "boolean", 
+        defaultValue: false, 
+        tooltip: "Send searches over one persistent WebSocket connection (falls back to HTTP if it cannot connect).", 
+        onChange: (value) => {
+            TagCompleter.updateSetting("webSocket", value);
+        }, 
+    }, 
+
     embeddings: {
         name: "Enable Embeddings", 
         id: mk_name("enableEmbeddings"), 
@@ -177,4 +214,28 @@ export const settings = {
         }, 
     }, 
 
+    memoryBudget: {
+        name: "Memory Budget (MB)", 
+        id: mk_name("memoryBudget"), 
+        type: "slider", 
+        defaultValue: 0, 
+        attrs: { min: 0, max: 2048, step: 64 }, 
+        tooltip: "Upper limit for the tag index in RAM. Over the limit, short-query tables of the largest sources are dropped and the index is released when idle. 0: No limit.", 
+        onChange: async (value) => {
+            await api_post("set_memory_budget", { value: value });
+        }, 
+    }, 
+
+    idleRelease: {
+        name: "Release Memory When Idle (min)", 
+        id: mk_name("idleRelease"), 
+        type: "slider", 
+        defaultValue: 0, 
+        attrs: { min: 0, max: 720, step: 30 }, 
+        tooltip: "Move the tag index to disk after this many minutes without searches, and restore it on the next search. 0: Off.", 
+        onChange: async (value) => {
+            await api_post("set_idle_release", { value: value });
+        }, 
+    }, 
+
 }
\ No newline at end of file